@@ -2,19 +2,54 @@
 Sequences of dismod_at commands that work together to create a cascade operation
 that can be performed on a single DisMod-AT database.
 """
+from cascade_at.cascade.completion import FileOutput, DatabaseOutput
 from cascade_at.jobmon.resources import DEFAULT_EXECUTOR_PARAMETERS
 
 
+def _id_arguments(ids):
+    """
+    Formats one ID or a list of IDs as command line arguments.
+    """
+    if isinstance(ids, (list, tuple)):
+        return ' '.join(str(i) for i in ids)
+    return str(ids)
+
+
+def _as_list(ids):
+    return list(ids) if isinstance(ids, (list, tuple)) else [ids]
+
+
 class CascadeOperation:
     def __init__(self, model_version_id, upstream_commands=None):
         if upstream_commands is None:
             upstream_commands = list()
 
         self.model_version_id = model_version_id
-        self.executor_parameters = DEFAULT_EXECUTOR_PARAMETERS
+        self.executor_parameters = dict(DEFAULT_EXECUTOR_PARAMETERS)
+        self.features = dict()
         self.upstream_commands = upstream_commands
         self.j_resource = False
 
+    def inputs(self, context):
+        """
+        Files that the operation reads, which have to be older than its outputs
+        for the operation to be skipped when resuming.
+
+        :param context: (cascade_at.context.model_context.Context)
+        :return: List[pathlib.Path]
+        """
+        return list()
+
+    def outputs(self, context):
+        """
+        Outputs that the operation makes, which are checked when resuming.
+        Operations without outputs always run.
+
+        :param context: (cascade_at.context.model_context.Context)
+        :return: List[cascade_at.cascade.completion.FileOutput]
+        """
+        return list()
+
 
 class ConfigureInputs(CascadeOperation):
     def __init__(self, **kwargs):
@@ -27,20 +62,55 @@ class ConfigureInputs(CascadeOperation):
             f'--make --configure'
         )
 
+    def outputs(self, context):
+        return [FileOutput(context.inputs_file), FileOutput(context.settings_file)]
+
 
 class FitBoth(CascadeOperation):
-    def __init__(self, parent_location_id, sex_id, **kwargs):
+    """
+    Fits a parent model. The parent location and sex can also be lists,
+    to build all of their databases in one task.
+    """
+    def __init__(self, parent_location_id, sex_id, index_tables=False,
+                 prior_parent=None, prior_sex=None, warm_start=False, skip_fit_fixed=False, **kwargs):
         super().__init__(**kwargs)
         self.parent_location_id = parent_location_id
         self.sex_id = sex_id
+        self.index_tables = index_tables
+        self.prior_parent = prior_parent
+        self.prior_sex = prior_sex
+        self.warm_start = warm_start
+        self.skip_fit_fixed = skip_fit_fixed
 
         self.command = (
             f'dismod_db '
             f'-model-version-id {self.model_version_id} '
-            f'-parent-location-id {self.parent_location_id} '
-            f'-sex-id {self.sex_id} '
+            f'-parent-location-id {_id_arguments(self.parent_location_id)} '
+            f'-sex-id {_id_arguments(self.sex_id)} '
             f'--commands init fit-fixed set-start_var-fit_var set-scale_var-fit_var fit-both predict-fit_var '
         )
+        if self.prior_parent is not None:
+            self.command += f'--prior-parent {self.prior_parent} --prior-sex {self.prior_sex} '
+        if self.warm_start:
+            self.command += '--warm-start '
+        if self.skip_fit_fixed:
+            self.command += '--skip-fit-fixed '
+        if self.index_tables:
+            self.command += '--index-tables '
+
+    def inputs(self, context):
+        files = [context.inputs_file, context.settings_file]
+        if self.prior_parent is not None:
+            files.append(context.db_file(location_id=self.prior_parent, sex_id=self.prior_sex, make=False))
+        return files
+
+    def outputs(self, context):
+        return [
+            DatabaseOutput(context.db_file(location_id=location_id, sex_id=sex_id, make=False),
+                           tables=['fit_var', 'predict'])
+            for location_id in _as_list(self.parent_location_id)
+            for sex_id in _as_list(self.sex_id)
+        ]
 
 
 class SampleSimulate(CascadeOperation):
@@ -62,6 +132,13 @@ class SampleSimulate(CascadeOperation):
             f'-fit-type {self.fit_type}'
         )
 
+    def inputs(self, context):
+        return [context.inputs_file, context.settings_file]
+
+    def outputs(self, context):
+        return [DatabaseOutput(context.db_file(location_id=self.parent_location_id, sex_id=self.sex_id, make=False),
+                               tables=['sample'])]
+
 
 class FormatAndUpload(CascadeOperation):
     def __init__(self, parent_location_id, sex_id, **kwargs):
@@ -76,6 +153,13 @@ class FormatAndUpload(CascadeOperation):
             f'-sex-id {self.sex_id}'
         )
 
+    def inputs(self, context):
+        return [context.db_file(location_id=self.parent_location_id, sex_id=self.sex_id, make=False)]
+
+    def outputs(self, context):
+        directory = context.draw_dir / str(self.parent_location_id)
+        return [FileOutput(directory / f'{self.parent_location_id}_{self.sex_id}.csv')]
+
 
 class CleanUp(CascadeOperation):
     def __init__(self, **kwargs):
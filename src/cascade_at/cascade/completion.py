@@ -0,0 +1,158 @@
+"""
+Keeps track of which cascade operations have finished, so that a cascade
+that is run again can skip the ones whose outputs are still good.
+
+Each cascade operation declares the files it reads and the outputs it makes.
+When an operation's command finishes, it is recorded in a completion manifest
+with a hash of its inputs. An operation is complete if the manifest has its
+command with the same input hash, and all of its outputs are valid and are
+newer than all of its inputs. An operation that doesn't declare any outputs
+is never complete.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from cascade_at.core.log import get_loggers
+
+LOG = get_loggers(__name__)
+
+MANIFEST_FILE = 'completed.json'
+
+
+class FileOutput:
+    def __init__(self, path):
+        """
+        An output file that has to exist and not be empty.
+
+        Args:
+            path: (pathlib.Path)
+        """
+        self.path = Path(path)
+
+    def is_valid(self):
+        return self.path.is_file() and self.path.stat().st_size > 0
+
+    def modified(self):
+        return self.path.stat().st_mtime
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path})"
+
+
+class DatabaseOutput(FileOutput):
+    def __init__(self, path, tables):
+        """
+        A dismod database that has to have rows in some tables.
+
+        Args:
+            path: (pathlib.Path)
+            tables: (List[str]) tables that can't be empty
+        """
+        super().__init__(path)
+        self.tables = tables
+
+    def is_valid(self):
+        if not super().is_valid():
+            return False
+        connection = sqlite3.connect(f"{self.path.absolute().as_uri()}?mode=ro", uri=True)
+        try:
+            for table in self.tables:
+                try:
+                    row = connection.execute(f'SELECT 1 FROM "{table}" LIMIT 1').fetchone()
+                except sqlite3.OperationalError:
+                    return False
+                if row is None:
+                    return False
+        finally:
+            connection.close()
+        return True
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.path}, {self.tables})"
+
+
+def input_hash(command, paths):
+    """
+    A hash of a command and the files it reads, by their paths, sizes and modification times.
+    Files that don't exist are hashed as missing.
+
+    Args:
+        command: (str)
+        paths: (List[pathlib.Path])
+
+    Returns:
+        (str) hex digest
+    """
+    digest = hashlib.sha1(command.encode())
+    for path in sorted(str(p) for p in paths):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        else:
+            digest.update(f"{path}:missing".encode())
+    return digest.hexdigest()
+
+
+class CompletionManifest:
+    def __init__(self, path):
+        """
+        A JSON file of the commands that have finished, keyed by command,
+        with the hash of their inputs and when they finished.
+
+        Args:
+            path: (pathlib.Path)
+        """
+        self.path = Path(path)
+        if self.path.is_file():
+            with open(self.path) as f:
+                self.completed = json.load(f)
+        else:
+            self.completed = dict()
+
+    def record(self, command, inputs_hash):
+        """
+        Records that a command finished, and writes the manifest.
+        """
+        self.completed[command] = {'input_hash': inputs_hash, 'finished': time.time()}
+        os.makedirs(self.path.parent, exist_ok=True)
+        temporary = self.path.parent / f".{self.path.name}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self.completed, f, indent=2)
+        os.replace(temporary, self.path)
+
+    def has(self, command, inputs_hash):
+        entry = self.completed.get(command)
+        return entry is not None and entry['input_hash'] == inputs_hash
+
+
+def is_complete(operation, context, manifest):
+    """
+    Whether a cascade operation finished before and its outputs are still good.
+
+    Args:
+        operation: (cascade_at.cascade.cascade_operations.CascadeOperation)
+        context: (cascade_at.context.model_context.Context)
+        manifest: (CompletionManifest)
+
+    Returns:
+        (bool)
+    """
+    outputs = operation.outputs(context)
+    if not outputs:
+        return False
+    inputs = operation.inputs(context)
+    if not manifest.has(operation.command, input_hash(operation.command, inputs)):
+        return False
+    invalid = [o for o in outputs if not o.is_valid()]
+    if invalid:
+        LOG.info(f"Outputs {invalid} of {operation.command} are missing or empty.")
+        return False
+    newest_input = max((os.stat(p).st_mtime for p in inputs if os.path.exists(p)), default=0.)
+    if min(o.modified() for o in outputs) < newest_input:
+        LOG.info(f"Inputs of {operation.command} changed since it ran.")
+        return False
+    return True
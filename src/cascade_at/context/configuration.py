@@ -2,8 +2,6 @@ from configparser import ConfigParser
 from functools import lru_cache
 from os import linesep
 
-from pkg_resources import resource_string, iter_entry_points
-
 from cascade_at.core.log import get_loggers
 
 LOG = get_loggers(__name__)
@@ -16,6 +14,9 @@ def application_config():
         ConfigParser.SectionProxy: This is a mapping type.
     """
 
+    # pkg_resources is slow to import, and only the production application needs it.
+    from pkg_resources import iter_entry_points
+
     parser = ConfigParser()
     config_sources = list()
 
@@ -1,9 +1,9 @@
 import os
-import dill
 import json
 from pathlib import Path
 
 from cascade_at.context.configuration import application_config
+from cascade_at.core.lazy import LazyModule
 from cascade_at.core.log import get_loggers
 from cascade_at.inputs.covariate_specs import CovariateSpecs
 from cascade_at.model.grid_alchemy import Alchemy
@@ -13,6 +13,8 @@ from cascade_at.core.db import db_tools
 
 LOG = get_loggers(__name__)
 
+dill = LazyModule("dill")
+
 
 class Context:
     def __init__(self, model_version_id,
@@ -58,9 +60,11 @@ class Context:
         self.outputs_dir = self.model_dir / 'outputs'
         self.database_dir = self.model_dir / 'dbs'
         self.draw_dir = self.outputs_dir / 'draws'
+        self.sample_draw_dir = self.outputs_dir / 'sample_draws'
 
         self.inputs_file = self.inputs_dir / 'inputs.p'
         self.settings_file = self.inputs_dir / 'settings.json'
+        self.inputs_summary_file = self.inputs_dir / 'inputs_summary.json'
 
         self.log_dir = (
             Path(self.root_directory)
@@ -68,6 +72,9 @@ class Context:
             / 'logs'
             / str(self.model_version_id)
         )
+        # The stage cache is shared by all model versions, so that
+        # versions with the same inputs can use each other's stages.
+        self.cache_dir = Path(self.root_directory) / self.cascade_dir / 'cache'
 
         if make:
             os.makedirs(self.inputs_dir, exist_ok=True)
@@ -106,11 +113,25 @@ class Context:
             with open(self.inputs_file, "wb") as f:
                 LOG.info(f"Writing input obj to {self.inputs_file}.")
                 dill.dump(inputs, f)
+            dismod_data = getattr(inputs, 'dismod_data', None)
+            with open(self.inputs_summary_file, 'w') as f:
+                json.dump({'n_data': None if dismod_data is None else len(dismod_data)}, f)
         if settings:
             with open(self.settings_file, 'w') as f:
                 LOG.info(f"Writing settings obj to {self.settings_file}.")
                 json.dump(settings, f)
 
+    def read_inputs_summary(self):
+        """
+        Read the summary of the inputs, like the number of rows of data,
+        without reading the inputs. Empty if the inputs aren't written yet.
+        :return: (dict)
+        """
+        if not self.inputs_summary_file.exists():
+            return dict()
+        with open(self.inputs_summary_file) as f:
+            return json.load(f)
+
     def read_inputs(self):
         """
         Read the inputs from disk.
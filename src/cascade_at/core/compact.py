@@ -0,0 +1,95 @@
+"""
+A compact representation of large intermediate data frames.
+
+Compact frames hold floats as float32, integer ids in the smallest integer type
+that fits them, and repeated strings, like measure and integrand names, as categoricals.
+They are for frames that are used along the way, like covariate values, population
+and draws, not for the values that dismod fits. Anything that is written to a
+dismod database is upcast back to float64, int64 and object columns first.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_float_dtype, is_integer_dtype, is_object_dtype
+
+MAX_CATEGORY_FRACTION = 0.5
+"""Object columns are made categorical if they have at most this fraction of unique values."""
+
+
+def _smallest_signed(values):
+    """
+    The smallest signed integer type for some integers. Unsigned types aren't used,
+    so that differences of ids don't wrap around.
+    """
+    for dtype in [np.int8, np.int16, np.int32]:
+        info = np.iinfo(dtype)
+        if info.min <= values.min() and values.max() <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def compact_frame(df, float_columns=None, max_category_fraction=MAX_CATEGORY_FRACTION):
+    """
+    Makes a compact copy of a data frame.
+
+    Args:
+        df: (pd.DataFrame)
+        float_columns: (List[str]) float columns to store as float32, default all of them
+        max_category_fraction: (float) largest fraction of unique values for
+            an object column to become categorical
+
+    Returns:
+        (pd.DataFrame)
+    """
+    if float_columns is None:
+        float_columns = [c for c in df.columns if is_float_dtype(df[c].dtype)]
+    dtypes = dict()
+    for column in df.columns:
+        dtype = df[column].dtype
+        if column in float_columns and dtype == np.float64:
+            dtypes[column] = np.float32
+        elif is_integer_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype) and len(df):
+            smallest = _smallest_signed(df[column].values)
+            if smallest.itemsize < dtype.itemsize:
+                dtypes[column] = smallest
+        elif is_object_dtype(dtype) and len(df):
+            if df[column].nunique(dropna=False) <= max_category_fraction * len(df):
+                dtypes[column] = 'category'
+    return df.astype(dtypes)
+
+
+def upcast_frame(df):
+    """
+    Undoes compact_frame: float32 columns become float64, small integers
+    become int64 and categoricals become their categories' type. Returns the
+    same data frame if there is nothing to upcast.
+
+    Args:
+        df: (pd.DataFrame)
+
+    Returns:
+        (pd.DataFrame)
+    """
+    dtypes = dict()
+    for column in df.columns:
+        dtype = df[column].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories = dtype.categories.dtype
+            if is_integer_dtype(categories):
+                dtypes[column] = np.float64 if df[column].isnull().any() else np.int64
+            elif is_float_dtype(categories):
+                dtypes[column] = np.float64
+            else:
+                dtypes[column] = object
+        elif is_float_dtype(dtype) and dtype != np.float64:
+            dtypes[column] = np.float64
+        elif is_integer_dtype(dtype) and not isinstance(dtype, pd.api.extensions.ExtensionDtype) \
+                and dtype != np.int64:
+            dtypes[column] = np.int64
+    if not dtypes:
+        return df
+    return df.astype(dtypes)
+
+
+def frame_memory(df):
+    """The memory that a data frame uses, in bytes, including the strings in object columns."""
+    return int(df.memory_usage(deep=True).sum())
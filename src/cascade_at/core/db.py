@@ -4,12 +4,6 @@ All other code which accesses the external databases should do so through the co
 have consistency and a single choke point for that access.
 """
 import importlib
-from contextlib import contextmanager
-from pathlib import Path
-from random import randint
-from time import sleep
-
-import sqlalchemy
 
 from cascade_at.core.errors import CascadeError
 from cascade_at.core.log import get_loggers
@@ -34,16 +28,27 @@ class ModuleProxy:
     This exists in order to actively turn off modules during testing.
     Ensure tests that claim not to use database functions
     really don't use them, so that their tests also pass outside IHME.
+
+    The module is imported the first time it is used, not when the proxy
+    is made, so that scripts that don't use it don't pay for importing it.
     """
     def __init__(self, module_name):
         if not isinstance(module_name, str):
             raise ValueError(f"This accepts a module name, not the module itself.")
 
         self.name = module_name
-        try:
-            self._module = importlib.import_module(module_name)
-        except ModuleNotFoundError:
-            self._module = None
+        self._imported = False
+        self._module_or_none = None
+
+    @property
+    def _module(self):
+        if not self._imported:
+            try:
+                self._module_or_none = importlib.import_module(self.name)
+            except ModuleNotFoundError:
+                self._module_or_none = None
+            self._imported = True
+        return self._module_or_none
 
     def __getattr__(self, name):
         if BLOCK_SHARED_FUNCTION_ACCESS:
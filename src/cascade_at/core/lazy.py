@@ -0,0 +1,43 @@
+"""
+Modules that are imported when they are first used, rather than when the
+module that uses them is imported.
+
+Every console script starts a new interpreter, and a cascade runs thousands
+of them, so the heavy libraries that only some code paths need, like
+scipy.stats, scipy.interpolate, networkx and dill, are imported lazily.
+Use ``stats = LazyModule("scipy.stats")`` where the module would have
+been ``import scipy.stats as stats``. Things that are used at import time,
+like base classes and constants, have to be imported as usual.
+"""
+import importlib
+
+
+class LazyModule:
+    """
+    Acts like a module, but imports it the first time one of its attributes is used.
+    """
+    def __init__(self, module_name):
+        if not isinstance(module_name, str):
+            raise ValueError(f"This accepts a module name, not the module itself.")
+        self.__dict__['name'] = module_name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self.name)
+        return self._module
+
+    @property
+    def loaded(self):
+        """Whether the module has been imported."""
+        return self._module is not None
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f"<LazyModule {self.name} ({state})>"
@@ -1,13 +1,78 @@
 import pandas as pd
 import numpy as np
 
+from cascade_at.core.compact import compact_frame
 from cascade_at.core.log import get_loggers
 from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.fill_extract_helpers import utils
+from cascade_at.dismod.api.fill_extract_helpers.draw_summaries import (
+    DEFAULT_QUANTILES, avgint_chunks, draw_frame, draw_matrix, summarize_draws
+)
+from cascade_at.dismod.api.fill_extract_helpers.warm_start import parent_location
 from cascade_at.dismod.integrand_mappings import reverse_integrand_map
 from cascade_at.dismod.integrand_mappings import PRIMARY_INTEGRANDS_TO_RATES
 
 LOG = get_loggers(__name__)
 
+GRID_TOLERANCE = 1e-6
+"""Largest difference, in years, between ages or times that are on the same grid."""
+
+
+def _same_grid(ages, times, other_ages, other_times):
+    return (len(ages) == len(other_ages) and np.allclose(ages, other_ages, rtol=0, atol=GRID_TOLERANCE) and
+            len(times) == len(other_times) and np.allclose(times, other_times, rtol=0, atol=GRID_TOLERANCE))
+
+
+def _draws_from_predictions(df, rates, value=True, dage=True, dtime=True):
+    """
+    Arranges the predictions for one location and sex into
+    (age, time, draw) arrays for each rate.
+    """
+    rate_dict = dict()
+    for r in rates:
+        rate_dict[r] = dict()
+
+    assert (df.age_lower.values == df.age_upper.values).all()
+    assert (df.time_lower.values == df.time_upper.values).all()
+
+    # Loop over rates, age, and time
+    for r in rates:
+        df2 = df.loc[df.rate == r].copy()
+
+        ages = np.asarray(sorted(df2.age_lower.unique().tolist()))
+        times = np.asarray(sorted(df2.time_lower.unique().tolist()))
+        n_draws = int(len(df2) / (len(ages) * len(times)))
+
+        # Save these for later for quality checks
+        rate_dict[r]['ages'] = ages
+        rate_dict[r]['times'] = times
+        rate_dict[r]['n_draws'] = n_draws
+
+        # Create template for filling in the draws
+        draw_data = np.zeros((len(ages), len(times), n_draws))
+        for age_idx, age in enumerate(ages):
+            for time_idx, time in enumerate(times):
+                # Subset to the draws that we want from avg_integrand
+                # but only for this particular age and time
+                draws = df2.loc[
+                    (df2.age_lower == age) &
+                    (df2.time_lower == time)
+                ]['avg_integrand'].values
+
+                # Check to makes sure that the number of draws corresponds to the number
+                # of draws for the whole thing per age and time
+                assert len(draws) == n_draws
+                draw_data[age_idx, time_idx, :] = draws
+
+        if value:
+            rate_dict[r]['value'] = draw_data
+        if dage:
+            rate_dict[r]['dage'] = np.diff(draw_data, n=1, axis=0)
+        if dtime:
+            rate_dict[r]['dtime'] = np.diff(draw_data, n=1, axis=1)
+
+    return rate_dict
+
 
 class DismodExtractor(DismodIO):
     """
@@ -15,25 +80,47 @@ class DismodExtractor(DismodIO):
     and takes everything from the collector module
     and puts them into the Dismod database tables
     in the correct construction.
+
+    With compact=True, predictions and draws are read as float32, with
+    small integer ids and categorical names, to use less memory.
     """
-    def __init__(self, path):
+    def __init__(self, path, compact=False):
         super().__init__(path=path)
+        self.compact = compact
 
     def get_predictions(self, location_id=None, sex_id=None):
         """
         Get the predictions from the predict table for a specific
-        location (rather than node) and sex ID.
+        location (rather than node) and sex ID. The location and sex
+        are filtered in the database so that only those rows are read.
 
         Returns:
             pd.DataFrame
         """
-        predictions = self.predict.merge(self.avgint, on=['avgint_id'])
-        predictions = predictions.merge(self.integrand, on=['integrand_id'])
-        predictions['rate'] = predictions['integrand_name'].map(PRIMARY_INTEGRANDS_TO_RATES)
+        conditions = list()
+        params = list()
         if location_id is not None:
-            predictions = predictions.loc[predictions.c_location_id == location_id].copy()
+            conditions.append("c_location_id = ?")
+            params.append(int(location_id))
         if sex_id is not None:
-            predictions = predictions.loc[predictions.c_sex_id == sex_id].copy()
+            conditions.append("c_sex_id = ?")
+            params.append(int(sex_id))
+
+        if conditions:
+            avgint_where = " AND ".join(conditions)
+            avgint = self.read_table('avgint', where=avgint_where, params=params)
+            predict = self.read_table(
+                'predict', where=f"avgint_id IN (SELECT avgint_id FROM avgint WHERE {avgint_where})",
+                params=params
+            )
+        else:
+            avgint = self.avgint
+            predict = self.predict
+        predictions = predict.merge(avgint, on=['avgint_id'])
+        predictions = predictions.merge(self.integrand, on=['integrand_id'])
+        predictions['rate'] = predictions['integrand_name'].map(PRIMARY_INTEGRANDS_TO_RATES)
+        if self.compact:
+            predictions = compact_frame(predictions, float_columns=['avg_integrand'])
         return predictions
 
     def gather_draws_for_prior_grid(self, location_id, sex_id, rates, value=True, dage=True, dtime=True):
@@ -56,83 +143,298 @@ class DismodExtractor(DismodIO):
             draw_dage: (np.ndarray) 3-d array of draws for dage over age and time for this loc and sex
             draw_dtime: (np.ndarray) 3-d array of draws for dtime over age and time for this loc and sex
         """
-        rate_dict = dict()
-        for r in rates:
-            rate_dict[r] = dict()
-
         df = self.get_predictions(location_id=location_id, sex_id=sex_id)
+        return _draws_from_predictions(df, rates=rates, value=value, dage=dage, dtime=dtime)
+
+    def gather_all_draws_for_prior_grid(self, rates, value=True, dage=True, dtime=True):
+        """
+        Same as ``gather_draws_for_prior_grid`` for every location and sex in the
+        predictions, reading the predict table once.
+
+        Args:
+            rates: List[str] list of rates to get the draws for
+            value: (bool) calculate value priors
+            dage: (bool) calculate dage priors
+            dtime: (bool) calculate dtime priors
+
+        Returns:
+            (dict) from (location_id, sex_id) to the draws for each rate
+        """
+        df = self.get_predictions()
+        return {
+            (int(location_id), int(sex_id)): _draws_from_predictions(
+                location_df, rates=rates, value=value, dage=dage, dtime=dtime
+            )
+            for (location_id, sex_id), location_df in df.groupby(['c_location_id', 'c_sex_id'])
+        }
+
+    def can_gather_draws_from_sample(self, location_ids, rates, grids=None):
+        """
+        Whether draws for the prior grids of these locations can come straight
+        from the sample table, rather than from predict sample. That is the case
+        when the sample table is there, the locations are the parent or its children,
+        the rates aren't changed by covariate multipliers on rate values, and
+        the parent's grid for each rate is the same as the grid it is going onto.
 
-        assert (df.age_lower.values == df.age_upper.values).all()
-        assert (df.time_lower.values == df.time_upper.values).all()
+        Args:
+            location_ids: (List[int]) locations to get draws for
+            rates: (List[str]) rates to get draws for
+            grids: (Dict[str, Tuple[np.array, np.array]]) optional ages and times
+                of the grid for each rate that the draws are for
+
+        Returns:
+            (bool)
+        """
+        try:
+            if self.read_table('sample', columns=['sample_index'], id_range=(0, 1)).empty:
+                return False
+        except ValueError:
+            return False
+
+        var = self.read_table('var', columns=['var_type', 'rate_id', 'node_id'],
+                              where="var_type IN ('rate', 'mulcov_rate_value')")
+        rate = self.read_table('rate', columns=['rate_id', 'rate_name'])
+        var['rate_name'] = var.rate_id.map(rate.set_index('rate_id').rate_name)
+        if var.loc[var.var_type == 'mulcov_rate_value'].rate_name.isin(rates).any():
+            return False
+
+        node = self.read_table('node', columns=['node_id', 'parent', 'c_location_id'])
+        parent_id = parent_location(self)
+        parent_node = node.loc[node.c_location_id == parent_id].node_id.iloc[0]
+        children = node.loc[node.parent == parent_node].c_location_id.tolist()
+        if not set(location_ids) <= set(children) | {parent_id}:
+            return False
 
-        # Loop over rates, age, and time
+        location_grids = self._sample_rate_grids(set(location_ids) | {parent_id}, rates)
+        parent = location_grids[parent_id]
         for r in rates:
-            df2 = df.loc[df.rate == r].copy()
-
-            ages = np.asarray(sorted(df2.age_lower.unique().tolist()))
-            times = np.asarray(sorted(df2.age_lower.unique().tolist()))
-            n_draws = int(len(df2) / (len(ages) * len(times)))
-
-            # Save these for later for quality checks
-            rate_dict[r]['ages'] = ages
-            rate_dict[r]['times'] = times
-            rate_dict[r]['n_draws'] = n_draws
-
-            # Create template for filling in the draws
-            draw_data = np.zeros((n_draws, len(ages), len(times)))
-            for age_idx, age in enumerate(ages):
-                for time_idx, time in enumerate(times):
-                    # Subset to the draws that we want from avg_integrand
-                    # but only for this particular age and time
-                    draws = df2.loc[
-                        (df2.age_lower == age) &
-                        (df2.time_lower == time)
-                    ]['avg_integrand'].values
-
-                    # Check to makes sure that the number of draws corresponds to the number
-                    # of draws for the whole thing per age and time
-                    assert len(draws) == n_draws
-                    draw_data[age_idx, time_idx, :] = draws
-
-            if value:
-                rate_dict[r]['value'] = draw_data
-            if dage:
-                rate_dict[r]['dage'] = np.diff(draw_data, n=1, axis=0)
-            if dtime:
-                rate_dict[r]['dtime'] = np.diff(draw_data, n=1, axis=1)
-
-        return rate_dict
-
-    def format_predictions_for_ihme(self):
+            if r not in parent:
+                return False
+            if grids is not None and r in grids:
+                if not _same_grid(parent[r]['ages'], parent[r]['times'], *grids[r]):
+                    return False
+        for location_id in set(location_ids) - {parent_id}:
+            for r, effect in location_grids[location_id].items():
+                constant = len(effect['ages']) == 1 and len(effect['times']) == 1
+                if not (constant or _same_grid(effect['ages'], effect['times'],
+                                               parent[r]['ages'], parent[r]['times'])):
+                    LOG.info(f"The random effect grid for {r} is not the same as the rate grid.")
+                    return False
+        return True
+
+    def _sample_rate_grids(self, location_ids, rates, sample=False):
         """
-        Gets the predictions from the predict table and transforms them
-        into the GBD ids that we expect.
-        :return:
+        The rate model variables for some nodes, as (age, time, draw) arrays for each rate
+        if sample is True, or just the ages and times otherwise. The var and sample
+        tables are read once for all of the nodes. A rate is left out for a node
+        if its variables don't make a complete age-time grid.
+
+        Returns:
+            (Dict[int, Dict]) the grids for each rate, by location
         """
-        predictions = self.get_predictions()[[
-            'c_location_id', 'c_age_group_id', 'c_year_id', 'c_sex_id',
-            'integrand_name', 'time_lower', 'time_upper', 'age_lower', 'age_upper',
-            'avg_integrand'
-        ]]
-        gbd_id_cols = ['location_id', 'sex_id', 'age_group_id', 'year_id']
+        location_ids = list(location_ids)
+        node = self.read_table('node', columns=['node_id', 'c_location_id'])
+        var = self.read_table('var', columns=['var_id', 'age_id', 'time_id', 'node_id', 'rate_id'],
+                              where="var_type = 'rate'")
+        var = utils.map_nodes_to_locations(var, node_df=node)
+        var = var.loc[var.c_location_id.isin(location_ids)]
+        var = utils.convert_id_to_age_time(var, age_df=self.age, time_df=self.time)
+        rate = self.read_table('rate', columns=['rate_id', 'rate_name'])
+        var['rate_name'] = var.rate_id.map(rate.set_index('rate_id').rate_name)
 
-        predictions.rename(columns={'c_' + x: x for x in gbd_id_cols}, inplace=True)
-        for col in gbd_id_cols:
-            predictions[col] = predictions[col].astype(int)
-        predictions.rename(columns={'avg_integrand': 'mean'}, inplace=True)
-        predictions['lower'] = predictions['mean']
-        predictions['upper'] = predictions['mean']
+        if sample and not var.empty:
+            samples = self.read_table(
+                'sample', columns=['sample_index', 'var_id', 'var_value'],
+                where=f"var_id IN ({', '.join(str(int(v)) for v in var.var_id)})"
+            )
+            sample_index = np.unique(samples.sample_index.values)
+            draw_lookup = utils.integer_lookup(keys=sample_index, values=np.arange(len(sample_index)))
+            row_lookup = utils.integer_lookup(keys=var.var_id.values, values=np.arange(len(var)))
+            values = np.full((len(var), len(sample_index)), np.nan)
+            values[
+                utils.apply_lookup(row_lookup, samples.var_id.values),
+                utils.apply_lookup(draw_lookup, samples.sample_index.values)
+            ] = samples.var_value.values
+
+        location_grids = dict()
+        for location_id in location_ids:
+            at_location = var.c_location_id.values == location_id
+            grids = dict()
+            for r in rates:
+                rows = np.flatnonzero(at_location & (var.rate_name.values == r))
+                if not len(rows):
+                    continue
+                ages = np.unique(var.age.values[rows])
+                times = np.unique(var.time.values[rows])
+                if len(rows) != len(ages) * len(times):
+                    continue
+                grids[r] = {'ages': ages, 'times': times}
+                if sample:
+                    order = rows[np.lexsort((var.time.values[rows], var.age.values[rows]))]
+                    grids[r]['draws'] = values[order].reshape((len(ages), len(times), values.shape[1]))
+            location_grids[location_id] = grids
+        return location_grids
+
+    def gather_draws_from_sample(self, location_id, rates, grids=None, value=True, dage=True, dtime=True):
+        """
+        Makes the same draws as ``gather_draws_for_prior_grid`` directly from the
+        sample and var tables, without a predict sample pass. The draws for a child
+        location are the parent rate draws times the exponential of the child's
+        random effect draws. See ``can_gather_draws_from_sample`` for when this is possible;
+        if it isn't, this returns None, and the draws have to come from predict.
+
+        Args:
+            location_id: (int)
+            rates: List[str] list of rates to get the draws for
+            grids: (Dict[str, Tuple[np.array, np.array]]) optional ages and times
+                of the grid for each rate that the draws are for
+            value: (bool) calculate value priors
+            dage: (bool) calculate dage priors
+            dtime: (bool) calculate dtime priors
+
+        Returns:
+            (dict) for each rate, or None
+        """
+        draws = self.gather_all_draws_from_sample(
+            location_ids=[location_id], rates=rates, grids=grids, value=value, dage=dage, dtime=dtime
+        )
+        if draws is None:
+            return None
+        return draws[location_id]
+
+    def gather_all_draws_from_sample(self, location_ids, rates, grids=None, value=True, dage=True, dtime=True):
+        """
+        Same as ``gather_draws_from_sample`` for several locations, checking
+        and reading the sample table once for all of them. The draws don't
+        depend on sex, so they are the same for each sex of a location.
+
+        Args:
+            location_ids: (List[int])
+            rates: List[str] list of rates to get the draws for
+            grids: (Dict[str, Tuple[np.array, np.array]]) optional ages and times
+                of the grid for each rate that the draws are for
+            value: (bool) calculate value priors
+            dage: (bool) calculate dage priors
+            dtime: (bool) calculate dtime priors
 
+        Returns:
+            (dict) from location_id to the draws for each rate, or None
+        """
+        if not self.can_gather_draws_from_sample(location_ids=location_ids, rates=rates, grids=grids):
+            return None
+
+        parent_id = parent_location(self)
+        location_grids = self._sample_rate_grids(set(location_ids) | {parent_id}, rates, sample=True)
+        parent = location_grids[parent_id]
+
+        draws = dict()
+        for location_id in location_ids:
+            effects = dict() if location_id == parent_id else location_grids[location_id]
+            rate_dict = dict()
+            for r in rates:
+                draw_data = parent[r]['draws']
+                if r in effects:
+                    # Random effects are either on the same grid or constant, so they broadcast
+                    draw_data = draw_data * np.exp(effects[r]['draws'])
+
+                rate_dict[r] = {
+                    'ages': parent[r]['ages'],
+                    'times': parent[r]['times'],
+                    'n_draws': draw_data.shape[2]
+                }
+                if value:
+                    rate_dict[r]['value'] = draw_data
+                if dage:
+                    rate_dict[r]['dage'] = np.diff(draw_data, n=1, axis=0)
+                if dtime:
+                    rate_dict[r]['dtime'] = np.diff(draw_data, n=1, axis=1)
+            draws[location_id] = rate_dict
+        return draws
+
+    def _ihme_avgint(self):
+        """
+        The avgint table with the GBD ids and measure of each row, sorted by avgint_id.
+        """
+        avgint = self.read_table('avgint', columns=[
+            'avgint_id', 'integrand_id', 'c_location_id', 'c_age_group_id', 'c_year_id', 'c_sex_id'
+        ])
+        integrand = self.read_table('integrand', columns=['integrand_id', 'integrand_name'])
+        gbd_id_cols = ['location_id', 'sex_id', 'age_group_id', 'year_id']
+        avgint.rename(columns={'c_' + x: x for x in gbd_id_cols}, inplace=True)
+        for col in gbd_id_cols:
+            avgint[col] = avgint[col].astype(int)
         integrand_map = reverse_integrand_map()
-        predictions['measure_id'] = predictions.integrand_name.apply(lambda x: integrand_map[x])
+        measures = integrand.integrand_name.map(integrand_map)
+        avgint['measure_id'] = avgint.integrand_id.map(dict(zip(integrand.integrand_id, measures)))
+        return avgint.sort_values('avgint_id').reset_index(drop=True)
+
+    def iter_prediction_draws(self, chunk_size=None):
+        """
+        Reads the predict table in chunks of avgint rows, as draw matrices.
+
+        Args:
+            chunk_size: (int) number of avgint rows in each chunk, or all of them at once if None
 
+        Returns:
+            generator of (pd.DataFrame, np.ndarray), the avgint rows from ``_ihme_avgint``
+            and their (avgint, draw) matrix from ``draw_matrix``
+        """
+        avgint = self._ihme_avgint()
+        start = 0
+        for avgint_ids in avgint_chunks(avgint.avgint_id.values, chunk_size=chunk_size):
+            if len(avgint_ids):
+                predict = self.read_table(
+                    'predict', columns=['sample_index', 'avgint_id', 'avg_integrand'],
+                    where="avgint_id >= ? AND avgint_id <= ?", params=(int(avgint_ids[0]), int(avgint_ids[-1]))
+                )
+            else:
+                predict = self.empty_table('predict')
+            draws = draw_matrix(predict, avgint_ids=avgint_ids, dtype=np.float32 if self.compact else np.float64)
+            yield avgint.iloc[start:start + len(avgint_ids)], draws
+            start += len(avgint_ids)
+
+    @staticmethod
+    def _duplicate_incidence(df):
         # Duplicate the Sincidence results to incidence hazard for the Viz tool
-        predictions_2 = predictions.loc[predictions.measure_id == 41].copy()
-        predictions_2['measure_id'] = 6
-        predictions = pd.concat([predictions, predictions_2], axis=0)
-        
+        incidence = df.loc[df.measure_id == 41].copy()
+        incidence['measure_id'] = 6
+        return pd.concat([df, incidence], axis=0)
+
+    def format_predictions_for_ihme(self, quantiles=DEFAULT_QUANTILES, chunk_size=None):
+        """
+        Gets the predictions from the predict table and transforms them
+        into the GBD ids that we expect, with the mean and the lower and upper
+        quantiles of the draws. If the predictions are from fit_var
+        there is only one draw, so the lower and upper are the mean.
+
+        :param quantiles: (Tuple[float, float]) quantiles for the lower and upper
+        :param chunk_size: (int) number of avgint rows to summarize at a time
+        :return: (pd.DataFrame)
+        """
+        summaries = list()
+        for avgint, draws in self.iter_prediction_draws(chunk_size=chunk_size):
+            mean, bounds = summarize_draws(draws, quantiles=quantiles)
+            summary = avgint.copy()
+            summary['mean'] = mean
+            summary['lower'] = bounds[:, 0]
+            summary['upper'] = bounds[:, -1]
+            summaries.append(summary.loc[~np.isnan(mean)])
+        predictions = self._duplicate_incidence(pd.concat(summaries, axis=0))
         return predictions[[
             'location_id', 'age_group_id', 'year_id', 'sex_id',
             'measure_id', 'mean', 'upper', 'lower'
         ]]
 
+    def format_draws_for_ihme(self, chunk_size=None):
+        """
+        Gets the draws from the predict table with the GBD ids that we expect,
+        with a column for each draw, one chunk of avgint rows at a time.
+
+        :param chunk_size: (int) number of avgint rows in each chunk
+        :return: generator of pd.DataFrame
+        """
+        for avgint, draws in self.iter_prediction_draws(chunk_size=chunk_size):
+            present = ~np.isnan(draws).all(axis=1)
+            ids = avgint.loc[present, ['location_id', 'age_group_id', 'year_id', 'sex_id', 'measure_id']]
+            df = pd.concat([ids.reset_index(drop=True), draw_frame(draws[present])], axis=1)
+            yield self._duplicate_incidence(df)
@@ -1,8 +1,13 @@
+import numpy as np
 import pandas as pd
 
 from cascade_at.core.log import get_loggers
 from cascade_at.dismod.api.dismod_io import DismodIO
 from cascade_at.dismod.api.fill_extract_helpers import reference_tables, data_tables, grid_tables
+from cascade_at.dismod.api.fill_extract_helpers.data_pruning import PRUNING_RULES, prune_data
+from cascade_at.dismod.api.fill_extract_helpers.table_hash import (
+    TABLE_HASH_TABLE, content_hash, invalidated_commands, split_options
+)
 
 LOG = get_loggers(__name__)
 
@@ -21,10 +26,28 @@ class DismodFiller(DismodIO):
         grid_alchemy: (cascade_at.collector.grid_alchemy.GridAlchemy)
         parent_location_id: (int) which parent location to construct the database for
         sex_id: (int) the sex that this database will be run for
+        child_prior: (dict) optional draws from a parent model to make the rate priors from
+        shared_tables: (dict) optional dictionary to share reference tables between databases
+            that are filled in the same process. Tables are made the first time they are asked for
+            and copied from there after.
+        pruning_rules: (List[str]) names of the rules in data_pruning.PRUNING_RULES that drop
+            data rows Dismod-AT would ignore before the data table is written, default all of them.
+            Pass an empty list to write every row.
+        keep_held_out: (bool) keep held out rows in the data table, for diagnostics,
+            even if the held_out rule is in pruning_rules
+        incremental: (bool) only write the tables whose content hashes differ from the
+            ones stored in the database the last time it was filled and run. Filling
+            removes the stored hashes, and write_table_hashes stores the new ones once
+            the commands have run, so a database whose commands didn't finish is
+            filled and run in full the next time.
 
     Attributes:
         self.parent_child_model: (cascade_at.model.model.Model) that was constructed from grid_alchemy parameter
             for one specific parent and its descendents
+        self.pruning_report: (dict) the number of data rows that each pruning rule dropped
+        self.table_hashes: (dict) the content hash of each table that was filled
+        self.changed_tables: (list) the tables that were written, which is all of them
+            unless filling incrementally
 
     Example:
         >>> from pathlib import Path
@@ -49,7 +72,8 @@ class DismodFiller(DismodIO):
         >>> da.fill_for_parent_child()
     """
     def __init__(self, path, settings_configuration, measurement_inputs, grid_alchemy, parent_location_id, sex_id,
-                 child_prior=None):
+                 child_prior=None, shared_tables=None, pruning_rules=None, keep_held_out=False,
+                 incremental=False):
         super().__init__(path=path)
 
         self.settings = settings_configuration
@@ -58,6 +82,17 @@ class DismodFiller(DismodIO):
         self.parent_location_id = parent_location_id
         self.sex_id = sex_id
         self.child_prior = child_prior
+        self.shared_tables = shared_tables
+        if pruning_rules is None:
+            pruning_rules = list(PRUNING_RULES.keys())
+        if keep_held_out:
+            pruning_rules = [r for r in pruning_rules if r != 'held_out']
+        self.pruning_rules = pruning_rules
+        self.pruning_report = dict()
+        self.incremental = incremental
+        self.table_hashes = dict()
+        self.changed_tables = list()
+        self._previous_hashes = self.read_table_hashes() if incremental else dict()
 
         self.omega_df = self.get_omega_df()
         self.covariate_reference_specs = self.calculate_reference_covariates()
@@ -117,12 +152,93 @@ class DismodFiller(DismodIO):
 
         Pass in some optional keyword arguments to fill the option
         table with additional info or to over-ride the defaults.
+
+        The content hashes of the tables are kept in table_hashes, not written.
+        Call write_table_hashes after the commands on the database have run.
         """
         LOG.info(f"Filling tables in {self.path.absolute()}")
+        if self.path.exists():
+            # Until the new tables have been run, no stored hashes should match them.
+            self.clear_table_hashes()
         self.fill_reference_tables()
         self.fill_grid_tables()
         self.fill_data_tables()
-        self.option = self.construct_option_table(**additional_option_kwargs)
+        self._fill_option_table(self.construct_option_table(**additional_option_kwargs))
+        if self.incremental:
+            LOG.info(f"Tables that changed since the last fill: {self.changed_tables}.")
+
+    def read_table_hashes(self):
+        """
+        Reads the content hashes from the last time the database was filled.
+
+        :return: (dict) of table name to hash, empty if there are none
+        """
+        if not self.path.exists():
+            return dict()
+        try:
+            hashes = self.read_table(TABLE_HASH_TABLE, columns=['table_name', 'table_hash'])
+        except ValueError:
+            return dict()
+        return dict(zip(hashes.table_name, hashes.table_hash))
+
+    def write_table_hashes(self):
+        """
+        Writes the content hashes of the tables that were filled. Call this only
+        after the commands that use the tables have succeeded, so that an incremental
+        fill never skips tables whose results aren't in the database.
+        """
+        self.write_table(TABLE_HASH_TABLE, pd.DataFrame({
+            'table_name': list(self.table_hashes.keys()),
+            'table_hash': list(self.table_hashes.values())
+        }))
+
+    def clear_table_hashes(self):
+        """
+        Removes the stored content hashes so that the next incremental fill writes
+        every table and runs every command.
+        """
+        self.write_table(TABLE_HASH_TABLE, self.empty_table(TABLE_HASH_TABLE))
+
+    def invalidated_commands(self, commands):
+        """
+        The dismod commands that need to run again because of the tables that changed.
+
+        :param commands: (List[str]) all commands for the database, in order
+        :return: (List[str])
+        """
+        return invalidated_commands(changed_tables=self.changed_tables, commands=commands)
+
+    def _table_changed(self, table_name, table_hash):
+        """
+        Records the hash of a table and whether it needs to be written.
+        """
+        self.table_hashes[table_name] = table_hash
+        if self.incremental and self._previous_hashes.get(table_name) == table_hash:
+            LOG.debug(f"Table {table_name} has not changed.")
+            return False
+        self.changed_tables.append(table_name)
+        return True
+
+    def _fill_table(self, table_name, table):
+        """
+        Writes a table that has been made, unless it is the same as the last time.
+        """
+        if self._table_changed(table_name, content_hash(table)):
+            self.write_table(table_name, table)
+
+    def _fill_option_table(self, option):
+        """
+        Writes the option table unless it is the same as the last time. The options
+        that init uses and the ones that only the fit uses have separate hashes,
+        so that changing a fit option doesn't run init again.
+        """
+        init_options, fit_options = split_options(option)
+        changed = [
+            self._table_changed('option', content_hash(init_options)),
+            self._table_changed('option_fit', content_hash(fit_options))
+        ]
+        if any(changed):
+            self.write_table('option', option)
 
     def node_id_from_location_id(self, location_id):
         """
@@ -133,53 +249,115 @@ class DismodFiller(DismodIO):
             raise RuntimeError("Problem with the node table -- should only be one node-id for each location_id.")
         return loc_df['node_id'].iloc[0]
 
+    def _shared_table(self, key, construct):
+        """
+        Makes a table, or copies it from the shared tables if it has been made already.
+        """
+        if self.shared_tables is None:
+            return construct()
+        if key not in self.shared_tables:
+            self.shared_tables[key] = construct()
+        return self.shared_tables[key].copy()
+
     def fill_reference_tables(self):
         """
         Fills all of the reference tables including density, node, covariate, age, and time.
 
         :return: self
         """
-        self.density = reference_tables.construct_density_table()
-        self.node = reference_tables.construct_node_table(location_dag=self.inputs.location_dag)
-        self.covariate = reference_tables.construct_covariate_table(covariates=self.parent_child_model.covariates)
-        self.age = reference_tables.construct_age_time_table(
-            variable_name='age', variable=self.parent_child_model.get_age_array(),
-            data_min=self.min_age, data_max=self.max_age
-        )
-        self.time = reference_tables.construct_age_time_table(
-            variable_name='time', variable=self.parent_child_model.get_time_array(),
-            data_min=self.min_time, data_max=self.max_time
-        )
-        self.integrand = reference_tables.construct_integrand_table(
-            data_cv_from_settings=self.inputs.data_cv_from_settings(settings=self.settings)
-        )
+        ages = self.parent_child_model.get_age_array()
+        times = self.parent_child_model.get_time_array()
+        self._fill_table('density', self._shared_table('density', reference_tables.construct_density_table))
+        self._fill_table('node', self._shared_table(
+            'node', lambda: reference_tables.construct_node_table(location_dag=self.inputs.location_dag)
+        ))
+        self._fill_table('covariate', reference_tables.construct_covariate_table(
+            covariates=self.parent_child_model.covariates
+        ))
+        self._fill_table('age', self._shared_table(
+            ('age', tuple(ages)), lambda: reference_tables.construct_age_time_table(
+                variable_name='age', variable=ages,
+                data_min=self.min_age, data_max=self.max_age
+            )
+        ))
+        self._fill_table('time', self._shared_table(
+            ('time', tuple(times)), lambda: reference_tables.construct_age_time_table(
+                variable_name='time', variable=times,
+                data_min=self.min_time, data_max=self.max_time
+            )
+        ))
+        self._fill_table('integrand', self._shared_table(
+            'integrand', lambda: reference_tables.construct_integrand_table(
+                data_cv_from_settings=self.inputs.data_cv_from_settings(settings=self.settings)
+            )
+        ))
         return self
 
+    def prune_data(self):
+        """
+        Drops the input data that Dismod-AT would ignore in this model, according
+        to the pruning rules, and records how many rows each rule dropped.
+
+        :return: pd.DataFrame
+        """
+        data, self.pruning_report = prune_data(
+            df=self.inputs.dismod_data,
+            rules=self.pruning_rules,
+            location_dag=self.inputs.location_dag,
+            parent_location_id=self.parent_location_id,
+            measures_to_exclude=getattr(self.inputs, 'measures_to_exclude', None),
+            covariate_df=self.covariate
+        )
+        return data
+
     def fill_data_tables(self):
         """
         Fills the data tables including data and avgint.
 
         :return: self
         """
-        self.data = data_tables.construct_data_table(
-            df=self.inputs.dismod_data,
-            node_df=self.node,
-            covariate_df=self.covariate,
-            ages=self.parent_child_model.get_age_array(),
-            times=self.parent_child_model.get_time_array()
-        )
-        avgint_df = self.inputs.to_gbd_avgint(
-            parent_location_id=self.parent_location_id,
-            sex_id=self.sex_id
+        node_df = self.node
+        covariate_df = self.covariate
+        integrand_df = self.integrand
+        ages = self.parent_child_model.get_age_array()
+        times = self.parent_child_model.get_time_array()
+
+        # The data and avgint tables take the longest to make, so their hashes
+        # are of the inputs they are made from rather than of the tables.
+        data = self.prune_data()
+        if self._table_changed('data', content_hash(data, node_df, covariate_df, ages, times)):
+            self.data = data_tables.construct_data_table(
+                df=data,
+                node_df=node_df,
+                covariate_df=covariate_df,
+                ages=ages,
+                times=times
+            )
+
+        avgint_hash = content_hash(
+            self.parent_location_id, self.sex_id,
+            self.inputs.location_dag.parent_children(self.parent_location_id),
+            np.asarray(self.inputs.demographics.age_group_id), np.asarray(self.inputs.demographics.year_id),
+            self.inputs.country_covariate_data, self.settings.country_covariate._to_dict_value(),
+            node_df, covariate_df, integrand_df, ages, times
         )
-        self.avgint = data_tables.construct_gbd_avgint_table(
-            df=avgint_df,
-            node_df=self.node,
-            covariate_df=self.covariate,
-            integrand_df=self.integrand,
-            ages=self.parent_child_model.get_age_array(),
-            times=self.parent_child_model.get_time_array()
+        if not self._table_changed('avgint', avgint_hash):
+            return self
+        avgint_chunks = (
+            data_tables.construct_gbd_avgint_table(
+                df=avgint_df,
+                node_df=node_df,
+                covariate_df=covariate_df,
+                integrand_df=integrand_df,
+                ages=ages,
+                times=times
+            ) for avgint_df in self.inputs.gbd_avgint_chunks(
+                parent_location_id=self.parent_location_id,
+                sex_id=self.sex_id
+            )
         )
+        n_avgint = self.write_table_in_chunks('avgint', avgint_chunks)
+        LOG.info(f"Wrote {n_avgint} rows to the avgint table.")
         return self
 
     def fill_grid_tables(self):
@@ -190,30 +368,25 @@ class DismodFiller(DismodIO):
 
         :return: self
         """
-        self.weight, self.weight_grid = grid_tables.construct_weight_grid_tables(
+        weight, weight_grid = grid_tables.construct_weight_grid_tables(
             weights=self.parent_child_model.get_weights(),
             age_df=self.age, time_df=self.time
         )
+        self._fill_table('weight', weight)
+        self._fill_table('weight_grid', weight_grid)
         model_tables = grid_tables.construct_model_tables(
             model=self.parent_child_model,
             location_df=self.node,
             age_df=self.age, time_df=self.time,
             covariate_df=self.covariate
         )
-        self.rate = model_tables['rate']
-        self.smooth = model_tables['smooth']
-        self.smooth_grid = model_tables['smooth_grid']
-        self.prior = model_tables['prior']
-        self.mulcov = model_tables['mulcov']
-        self.nslist = model_tables['nslist']
-        self.nslist_pair = model_tables['nslist_pair']
-        self.subgroup = model_tables['subgroup']
-
-        # Initialize empty tables that need to be there that may or may not
-        # be filled with relevant info, if they're currently empty.
-        for name in ["nslist", "nslist_pair", "mulcov", "smooth_grid", "smooth"]:
-            if getattr(self, name).empty:
-                setattr(self, name, self.empty_table(table_name=name))
+        for name in ['rate', 'smooth', 'smooth_grid', 'prior', 'mulcov', 'nslist', 'nslist_pair', 'subgroup']:
+            table = model_tables[name]
+            # Initialize empty tables that need to be there that may or may not
+            # be filled with relevant info, if they're currently empty.
+            if name in ["nslist", "nslist_pair", "mulcov", "smooth_grid", "smooth"] and table.empty:
+                table = self.empty_table(table_name=name)
+            self._fill_table(name, table)
 
     def construct_option_table(self, **kwargs):
         """
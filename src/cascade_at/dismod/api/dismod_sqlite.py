@@ -9,32 +9,167 @@ and validated. Then Pandas uses to_csv to write them to the sqlalchemy
 engine, which uses the metadata wrapper (and its custom conversions)
 to write them to a very specific format that Dismod-AT is able to read.
 """
-from copy import deepcopy
+import os
+import threading
+from collections import OrderedDict
 from textwrap import dedent
 
 import numpy as np
 import pandas as pd
 from pandas.core.dtypes.base import ExtensionDtype
 from sqlalchemy import Enum, Integer, Float
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, MetaData
 from sqlalchemy.exc import StatementError
 
+from cascade_at.core.compact import upcast_frame
 from cascade_at.core.log import get_loggers
 from cascade_at.core.errors import DismodFileError
 from cascade_at.dismod.api.table_metadata import Base, add_columns_to_table
 
 LOG = get_loggers(__name__)
 
+READ_BATCH_SIZE = 100000
+"""Number of rows to fetch at a time when reading a table."""
+
+_NUMPY_TYPES = {int: np.int64, float: np.float64, str: object}
+
+TABLE_INDEXES = {
+    'avgint': [('c_location_id', 'c_sex_id')],
+    'predict': [('avgint_id', 'sample_index', 'avg_integrand')],
+    'var': [('mulcov_id',)],
+    'sample': [('sample_index', 'var_id', 'var_value'), ('var_id',)],
+}
+"""
+Secondary indexes on the columns that extraction filters and joins on. The values
+of each index are put in the index too where that makes it a covering index, so that
+filtered reads don't have to go back to the table. The primary keys are rowids,
+so they are always part of an index.
+"""
+
+ENGINE_CACHE_SIZE = 128
+"""Number of file engines kept open for reuse."""
+
+_ENGINES = OrderedDict()
+_ENGINES_LOCK = threading.Lock()
+
 
 def get_engine(file_path):
-    if file_path is not None:
-        full_path = file_path.expanduser().absolute()
-        engine = create_engine("sqlite:///{}".format(str(full_path)))
-    else:
-        engine = create_engine("sqlite:///:memory:", echo=False)
+    """
+    Gets an engine for a sqlite file. Engines for files are shared, keyed
+    on the process and the resolved path, so that opening the same database
+    again doesn't create another engine. In-memory databases always get
+    a new engine because each one is a different database. The cache
+    is locked because databases are built in threads.
+    """
+    if file_path is None:
+        return create_engine("sqlite:///:memory:", echo=False)
+    full_path = file_path.expanduser().resolve()
+    key = (os.getpid(), str(full_path))
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            engine = create_engine("sqlite:///{}".format(str(full_path)))
+            _ENGINES[key] = engine
+            if len(_ENGINES) > ENGINE_CACHE_SIZE:
+                _, oldest = _ENGINES.popitem(last=False)
+                oldest.dispose()
+        else:
+            _ENGINES.move_to_end(key)
     return engine
 
 
+def _copy_table(table, metadata):
+    if hasattr(table, "to_metadata"):
+        return table.to_metadata(metadata)
+    return table.tometadata(metadata)
+
+
+class TableDefinitions:
+    def __init__(self, base):
+        """
+        The table definitions for one database. Tables are read from the shared
+        base metadata until a table needs columns that aren't in the base,
+        like the x_ covariate columns on data and avgint. Then that one table
+        is copied into metadata that belongs to this database, and the copy
+        is used from then on.
+
+        Args:
+            base: (sqlalchemy.MetaData) shared metadata, which is never modified
+        """
+        self._base = base
+        self._metadata = None
+
+    def __getitem__(self, table_name):
+        if self._metadata is not None and table_name in self._metadata.tables:
+            return self._metadata.tables[table_name]
+        return self._base.tables[table_name]
+
+    def __contains__(self, table_name):
+        return table_name in self._base.tables
+
+    def get(self, table_name, default=None):
+        if table_name in self:
+            return self[table_name]
+        return default
+
+    def keys(self):
+        return self._base.tables.keys()
+
+    @property
+    def overlays(self):
+        """Names of tables that have been copied from the base."""
+        if self._metadata is None:
+            return list()
+        return list(self._metadata.tables.keys())
+
+    def writable(self, table_name):
+        """
+        The definition of a table that it is safe to add columns to,
+        copying it from the base the first time.
+        """
+        if self._metadata is None:
+            self._metadata = MetaData()
+        if table_name not in self._metadata.tables:
+            _copy_table(self._base.tables[table_name], self._metadata)
+        return self._metadata.tables[table_name]
+
+
+def _declared_type(declared_type):
+    """
+    Python type for a declared sqlite column type, using
+    sqlite's rules for column affinity.
+    """
+    declared_type = declared_type.lower()
+    if "int" in declared_type:
+        return int
+    if any(t in declared_type for t in ["real", "floa", "doub"]):
+        return float
+    return str
+
+
+def _fill_column(array, start, stop, values):
+    """
+    Puts one batch of values into a preallocated column, moving integers
+    to floats if there are nulls or reals and anything to objects if it won't convert.
+    An integer column can hold reals, like 2.5, because sqlite only converts reals
+    that are whole numbers, and numpy would truncate them without complaint.
+    """
+    if array.dtype == np.int64 and float in set(map(type, values)):
+        array = array.astype(np.float64)
+    try:
+        array[start:stop] = values
+    except TypeError:
+        if array.dtype == np.int64:
+            array = array.astype(np.float64)
+        else:
+            array = array.astype(object)
+        return _fill_column(array, start, stop, values)
+    except ValueError:
+        array = array.astype(object)
+        array[start:stop] = values
+    return array
+
+
 class DismodSQLite:
     """
     Responsible for creation of a Dismod-AT file.
@@ -52,8 +187,10 @@ class DismodSQLite:
     to the avgint and data tables. These arguments are dictionaries from
     column name to column type.
 
-    This uses a deep copy of the metadata module so that, when it adds columns
-    to tables, it doesn't affect the module itself.
+    All instances share the table definitions in the metadata module. When
+    columns are added to a table, only that table is copied for this instance,
+    so that the module itself isn't affected. Engines are shared between
+    instances for the same file, so opening a database is cheap.
 
     Example:
     >>> from pathlib import Path
@@ -77,9 +214,7 @@ class DismodSQLite:
         self.path = path
         LOG.debug(f"Creating an engine at {path.absolute()}.")
         self.engine = get_engine(path)
-        self._metadata = deepcopy(Base.metadata)
-        self._table_definitions = self._metadata.tables
-        LOG.debug(f"dmfile tables {self._table_definitions.keys()}")
+        self._table_definitions = TableDefinitions(Base.metadata)
 
     def create_tables(self, tables=None):
         """
@@ -93,7 +228,7 @@ class DismodSQLite:
         Updates the table columns with additional columns like
         c_ which are comments and x_ which are covariates.
         """
-        table_definition = self._table_definitions[table_name]
+        table_definition = self._table_definitions.writable(table_name)
         new_columns = table.columns.difference(table_definition.c.keys())
         new_column_types = {c: table.dtypes[c] for c in new_columns}
 
@@ -115,25 +250,106 @@ class DismodSQLite:
 
         add_columns_to_table(table_definition, new_column_types)
 
-    def read_table(self, table_name):
+    def read_table(self, table_name, columns=None, where=None, params=None, id_range=None,
+                   batch_size=READ_BATCH_SIZE):
         """
         Read a table from the database in engine specified.
+
+        This reads with the sqlite3 cursor directly, fetching rows in batches
+        into numpy arrays that are allocated up front with the column types from the
+        table metadata, or from the declared column types for columns that the metadata
+        doesn't know about. Integer columns with nulls come back as floats, like pandas does.
+
+        Parameters:
+            table_name (str): the name of the table to read
+            columns (List[str]): only read these columns, in this order
+            where (str): SQL condition on the rows to read, with ? placeholders
+                for the params, e.g. "sample_index < ?"
+            params (tuple): values for the placeholders in where
+            id_range (tuple): (start, stop) range of the table's primary key to read,
+                including start and excluding stop
+
+        Returns:
+            pd.DataFrame
         """
-        return pd.read_sql_table(table_name=table_name, con=self.engine)
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            column_types = self._column_types(cursor, table_name)
+            if not column_types:
+                raise ValueError(f"Table {table_name} not found")
+            if columns is None:
+                columns = list(column_types.keys())
+            unknown = [c for c in columns if c not in column_types]
+            if unknown:
+                raise ValueError(f"Columns {unknown} are not in table {table_name}.")
+
+            conditions = list()
+            parameters = list()
+            if where is not None:
+                conditions.append(f"({where})")
+                parameters.extend(params or ())
+            if id_range is not None:
+                conditions.append(f'"{table_name}_id" >= ? AND "{table_name}_id" < ?')
+                parameters.extend(id_range)
+            where_clause = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+            n_rows = cursor.execute(
+                f'SELECT COUNT(*) FROM "{table_name}"{where_clause}', parameters
+            ).fetchone()[0]
+            arrays = [np.empty(n_rows, dtype=_NUMPY_TYPES[column_types[c]]) for c in columns]
+
+            selection = ", ".join(f'"{c}"' for c in columns)
+            cursor.execute(f'SELECT {selection} FROM "{table_name}"{where_clause}', parameters)
+            start = 0
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                stop = start + len(rows)
+                for i, values in enumerate(zip(*rows)):
+                    arrays[i] = _fill_column(arrays[i], start, stop, values)
+                start = stop
+            cursor.close()
+        finally:
+            connection.close()
+
+        return pd.DataFrame(
+            {c: array[:start] for c, array in zip(columns, arrays)},
+            columns=columns
+        )
+
+    def _column_types(self, cursor, table_name):
+        """
+        Python types of the columns that are in a table in the database,
+        in the order they are in the database.
+        """
+        table_definition = self._table_definitions.get(table_name)
+        column_types = dict()
+        for _, name, declared_type, _, _, _ in cursor.execute(f'PRAGMA table_info("{table_name}")'):
+            if table_definition is not None and name in table_definition.c:
+                column_types[name] = self._expected_type(table_definition.c[name])
+            else:
+                column_types[name] = _declared_type(declared_type)
+        return column_types
 
-    def write_table(self, table_name, table):
+    def write_table(self, table_name, table, if_exists="replace"):
         """
         Writes a table to the database in the engine specified.
 
         Parameters:
             table_name (str): the name of the table to write to
             table (pd.DataFrame): data frame to write
+            if_exists (str): "replace" to overwrite the table or "append" to add rows to it
         """
+        # Compact frames are written at full precision.
+        table = upcast_frame(table)
         table_definition = self._table_definitions[table_name]
 
         extra_columns = set(table.columns.difference(table_definition.c.keys()))
         if extra_columns:
             self.update_table_columns(table_name, table)
+            table_definition = self._table_definitions[table_name]
 
         # Force the table to have the dismod-required columns
         dtypes = {k: v.type for k, v in table_definition.c.items()}
@@ -156,12 +372,77 @@ class DismodSQLite:
                 name=table_name,
                 con=self.engine,
                 index_label=id_column,
-                if_exists="replace",
+                if_exists=if_exists,
                 dtype=dtypes
             )
         except StatementError:
             raise
 
+    def create_indexes(self, tables=None):
+        """
+        Creates the secondary indexes in TABLE_INDEXES, for the tables that are in the
+        database and have the index columns. Dismod-AT only reads input tables with
+        whole-table selects and drops its output tables when it rewrites them,
+        so this has to run again after any command that makes an output table
+        that should be indexed, e.g. after predict or sample.
+
+        Parameters:
+            tables (List[str]): only index these tables, otherwise all of TABLE_INDEXES
+
+        Returns:
+            List[str] of the names of the indexes that the database has now
+        """
+        if tables is None:
+            tables = list(TABLE_INDEXES.keys())
+        created = list()
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            for table_name in tables:
+                existing = {row[1] for row in cursor.execute(f'PRAGMA table_info("{table_name}")')}
+                for columns in TABLE_INDEXES.get(table_name, list()):
+                    if not set(columns) <= existing:
+                        continue
+                    index_name = f"ix_{table_name}_{'_'.join(columns)}"
+                    selection = ", ".join(f'"{c}"' for c in columns)
+                    LOG.debug(f"Creating index {index_name}.")
+                    cursor.execute(
+                        f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({selection})'
+                    )
+                    created.append(index_name)
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
+        return created
+
+    def write_table_in_chunks(self, table_name, chunks):
+        """
+        Writes a table to the database from an iterable of data frames,
+        so that only one chunk needs to be in memory at a time. The first chunk
+        replaces the table, and the primary key carries on from one chunk to the next.
+
+        Parameters:
+            table_name (str): the name of the table to write to
+            chunks: iterable of pd.DataFrame, all with the same columns
+
+        Returns:
+            (int) the number of rows written
+        """
+        id_column = f"{table_name}_id"
+        n_rows = 0
+        written = False
+        for chunk in chunks:
+            if written and chunk.empty:
+                continue
+            chunk[id_column] = np.arange(n_rows, n_rows + len(chunk))
+            self.write_table(table_name, chunk, if_exists="append" if written else "replace")
+            written = True
+            n_rows += len(chunk)
+        if not written:
+            self.write_table(table_name, self.empty_table(table_name))
+        return n_rows
+
     def empty_table(self, table_name, extra_columns=None):
         """
         Initializes an empty table for table_name.
@@ -0,0 +1,92 @@
+"""
+Drops rows of the input data that Dismod-AT would ignore, before they are written to the data table.
+
+Dismod-AT doesn't fit data that is held out, that belongs to a node outside of the
+subtree of the parent node, or whose covariates are farther than the max_difference
+from the reference, but it still has to read and subset every one of those rows.
+Each pruning rule takes the data frame of inputs and returns a boolean array
+that is True for the rows it drops. The rules are applied in order, so each row
+is counted against the first rule that drops it.
+"""
+import numpy as np
+
+from cascade_at.core.log import get_loggers
+
+LOG = get_loggers(__name__)
+
+
+def excluded_measures(df, measures_to_exclude=None, **kwargs):
+    """Rows for measures that the settings exclude from the fit."""
+    if not measures_to_exclude:
+        return np.zeros(len(df), dtype=bool)
+    return df.measure.isin(measures_to_exclude).values
+
+
+def held_out(df, **kwargs):
+    """Rows that are held out of the fit, like ASDR when omega is constrained."""
+    return (df.hold_out.fillna(0) == 1).values
+
+
+def outside_subtree(df, location_dag=None, parent_location_id=None, **kwargs):
+    """Rows for locations that aren't the parent location or one of its descendants."""
+    if location_dag is None or parent_location_id is None:
+        return np.zeros(len(df), dtype=bool)
+    return ~location_dag.in_subtree(df.location_id.values, ancestor_id=parent_location_id)
+
+
+def covariate_difference(df, covariate_df=None, **kwargs):
+    """
+    Rows where a covariate is farther than its max_difference from its reference value.
+    Missing covariate values aren't dropped.
+    """
+    drop = np.zeros(len(df), dtype=bool)
+    if covariate_df is None:
+        return drop
+    for covariate in covariate_df.itertuples():
+        if np.isnan(covariate.max_difference) or covariate.c_covariate_name not in df:
+            continue
+        values = df[covariate.c_covariate_name].values.astype(np.float64)
+        with np.errstate(invalid='ignore'):
+            drop |= np.abs(values - covariate.reference) > covariate.max_difference
+    return drop
+
+
+PRUNING_RULES = {
+    'excluded_measures': excluded_measures,
+    'held_out': held_out,
+    'outside_subtree': outside_subtree,
+    'covariate_difference': covariate_difference
+}
+"""The pruning rules, in the order they are applied."""
+
+
+def prune_data(df, rules=None, **kwargs):
+    """
+    Drops the rows of the input data that match any of the pruning rules.
+
+    Args:
+        df: (pd.DataFrame) the dismod_data from the measurement inputs
+        rules: (List[str]) names of the rules in PRUNING_RULES to apply, default all of them
+        **kwargs: passed to the rules, which are location_dag, parent_location_id,
+            measures_to_exclude and covariate_df
+
+    Returns:
+        (pd.DataFrame, Dict[str, int]) the rows that are left and the number of rows each rule dropped
+    """
+    if rules is None:
+        rules = list(PRUNING_RULES.keys())
+    unknown = set(rules) - set(PRUNING_RULES.keys())
+    if unknown:
+        raise ValueError(f"Unknown pruning rules {sorted(unknown)}, choose from {list(PRUNING_RULES.keys())}.")
+
+    keep = np.ones(len(df), dtype=bool)
+    report = dict()
+    for name, rule in PRUNING_RULES.items():
+        if name not in rules:
+            continue
+        drop = rule(df, **kwargs) & keep
+        report[name] = int(drop.sum())
+        keep &= ~drop
+        LOG.info(f"Pruning rule {name} dropped {report[name]} rows of data.")
+    LOG.info(f"Kept {int(keep.sum())} of {len(df)} rows of data.")
+    return df.loc[keep].copy(), report
@@ -18,9 +18,8 @@ def prep_data_avgint(df, node_df, covariate_df):
     but they need to be called separately because dismod requires
     different columns.
     """
-    data = df.copy()
-    data = utils.map_locations_to_nodes(df=data, node_df=node_df)
-    data = utils.map_covariate_names(df=data, covariate_df=covariate_df)
+    data = utils.map_locations_to_nodes(df=df, node_df=node_df)
+    data.rename(columns=utils.covariate_name_map(covariate_df), inplace=True)
 
     data.reset_index(inplace=True, drop=True)
     return data
@@ -39,9 +38,8 @@ def construct_data_table(df, node_df, covariate_df, ages, times):
     """
     LOG.info("Constructing data table.")
 
-    data = df.copy()
     data = prep_data_avgint(
-        df=data,
+        df=df,
         node_df=node_df,
         covariate_df=covariate_df
     )
@@ -67,39 +65,39 @@ def construct_data_table(df, node_df, covariate_df, ages, times):
 def construct_gbd_avgint_table(df, node_df, covariate_df, integrand_df, ages, times):
     """
     Constructs the avgint table using the output df
-    from the inputs.to_avgint() method.
+    from the inputs.to_avgint() method, or one chunk of
+    the inputs.gbd_avgint_chunks() method.
+
+    Each demographic cell is prepped once and then repeated
+    for every integrand, integrand by integrand.
     """
     LOG.info("Constructing the avgint table.")
-    avgint = df.copy()
+    avgint = df.loc[(df.time_lower >= times.min()) & (df.time_upper <= times.max())]
+    avgint = avgint.loc[(avgint.age_lower >= ages.min()) & (avgint.age_upper <= ages.max())]
     avgint = prep_data_avgint(
         df=avgint,
         node_df=node_df,
         covariate_df=covariate_df
     )
-    avgint_df = pd.DataFrame()
-    for i in integrand_df.integrand_name.unique():
-        if i == 'mtstandard' or i == 'relrisk':
-            continue
-        df = avgint.copy()
-        df['measure'] = i
-        avgint_df = avgint_df.append(df)
-
-    avgint_df = avgint_df.reset_index(drop=True)
-
-    avgint_df["integrand_id"] = avgint_df["measure"].apply(lambda x: IntegrandEnum[x].value)
-    avgint_df["weight_id"] = avgint_df["measure"].apply(lambda x: INTEGRAND_TO_WEIGHT[x].value)
-    avgint_df["subgroup_id"] = 0
-
-    avgint_df = avgint_df[[
-        'integrand_id', 'node_id', 'weight_id', 'subgroup_id', 'c_location_id',
-        'age_group_id', 'year_id', 'sex_id',
-        'age_lower', 'age_upper', 'time_lower', 'time_upper'
-    ] + [x for x in avgint_df.columns if x.startswith('x_')]]
-    
     gbd_id_cols = ['sex_id', 'age_group_id', 'year_id']
-    avgint_df.rename(columns={x: 'c_' + x for x in gbd_id_cols}, inplace=True)
-
-    avgint_df = avgint_df.loc[(avgint_df.time_lower >= times.min()) & (avgint_df.time_upper <= times.max())].copy()
-    avgint_df = avgint_df.loc[(avgint_df.age_lower >= ages.min()) & (avgint_df.age_upper <= ages.max())].copy()
-
+    avgint.rename(columns={x: 'c_' + x for x in gbd_id_cols}, inplace=True)
+
+    integrands = [
+        i for i in integrand_df.integrand_name.unique()
+        if i not in ['mtstandard', 'relrisk']
+    ]
+    n_cells = len(avgint)
+    cells = np.tile(np.arange(n_cells), len(integrands))
+
+    avgint_df = pd.DataFrame({
+        'integrand_id': np.repeat([IntegrandEnum[i].value for i in integrands], n_cells),
+        'node_id': avgint.node_id.values[cells],
+        'weight_id': np.repeat([INTEGRAND_TO_WEIGHT[i].value for i in integrands], n_cells),
+        'subgroup_id': 0
+    })
+    for col in [
+        'c_location_id', 'c_age_group_id', 'c_year_id', 'c_sex_id',
+        'age_lower', 'age_upper', 'time_lower', 'time_upper'
+    ] + [x for x in avgint.columns if x.startswith('x_')]:
+        avgint_df[col] = avgint[col].values[cells]
     return avgint_df
@@ -0,0 +1,84 @@
+"""
+Summaries of the draws in the predict table.
+
+After predict sample, the predict table has a row for each draw of each avgint row.
+The draws are put into an (avgint, draw) matrix by integer lookups, and the mean and
+quantiles are taken along the draw axis of the whole matrix at once, rather than
+by grouping the rows. Predictions from fit_var have one draw, so their
+quantiles are the mean.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.dismod.api.fill_extract_helpers import utils
+
+DEFAULT_QUANTILES = (0.025, 0.975)
+"""Quantiles for the lower and upper bounds of the IHME summaries."""
+
+
+def draw_matrix(predict, avgint_ids, dtype=np.float64):
+    """
+    Arranges predictions into a matrix with a row for each avgint row
+    and a column for each sample index.
+
+    Args:
+        predict: (pd.DataFrame) with avgint_id, sample_index and avg_integrand,
+            where sample_index is null for predictions from fit_var
+        avgint_ids: (np.ndarray) the avgint rows, in the order of the rows of the matrix
+        dtype: (np.dtype) of the matrix, float32 for compact draws
+
+    Returns:
+        (np.ndarray) of shape (len(avgint_ids), number of samples), with NaN
+        where there isn't a prediction
+    """
+    sample_index = predict.sample_index.fillna(0).values.astype(np.int64)
+    samples = np.zeros(sample_index.max() + 1 if len(sample_index) else 0, dtype=bool)
+    samples[sample_index] = True
+    samples = np.flatnonzero(samples)
+    column = utils.apply_lookup(utils.integer_lookup(keys=samples, values=np.arange(len(samples))), sample_index)
+    row_lookup = utils.integer_lookup(keys=np.asarray(avgint_ids), values=np.arange(len(avgint_ids)))
+    row = utils.apply_lookup(row_lookup, predict.avgint_id.values)
+    keep = row >= 0
+    draws = np.full((len(avgint_ids), max(len(samples), 1)), np.nan, dtype=dtype)
+    draws[row[keep], column[keep]] = predict.avg_integrand.values[keep]
+    return draws
+
+
+def summarize_draws(draws, quantiles=DEFAULT_QUANTILES):
+    """
+    The mean and quantiles of each row of a draw matrix. Missing draws
+    are left out, and rows without any draws are NaN.
+
+    Args:
+        draws: (np.ndarray) from draw_matrix
+        quantiles: (Tuple[float]) quantiles to take
+
+    Returns:
+        (np.ndarray, np.ndarray) the mean of each row, and an array with
+        a column for each quantile
+    """
+    quantiles = np.asarray(quantiles, dtype=np.float64)
+    if not np.isnan(draws).any():
+        return draws.mean(axis=1), np.quantile(draws, quantiles, axis=1).T
+    with warnings.catch_warnings():
+        # Rows without any draws warn that their mean is empty.
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        return np.nanmean(draws, axis=1), np.nanquantile(draws, quantiles, axis=1).T
+
+
+def avgint_chunks(avgint_ids, chunk_size=None):
+    """
+    Splits the avgint rows into chunks of at most chunk_size rows,
+    or one chunk if chunk_size is None.
+    """
+    avgint_ids = np.sort(np.asarray(avgint_ids))
+    if chunk_size is None or len(avgint_ids) == 0:
+        return [avgint_ids]
+    return [avgint_ids[start:start + chunk_size] for start in range(0, len(avgint_ids), chunk_size)]
+
+
+def draw_frame(draws):
+    """A data frame with a draw_i column for each column of a draw matrix."""
+    return pd.DataFrame(draws, columns=[f'draw_{i}' for i in range(draws.shape[1])])
@@ -6,7 +6,7 @@ from cascade_at.dismod.api.fill_extract_helpers.utils import vec_to_midpoint
 from cascade_at.dismod.constants import RateToIntegrand, IntegrandEnum, INTEGRAND_TO_WEIGHT
 
 
-def get_prior_avgint_grid(settings, integrands, sexes, locations, midpoint=False):
+def get_prior_avgint_grid(settings, integrands, sexes, locations, midpoint=False, alchemy=None):
     """
     Get a data frame to use for setting up posterior predictions on a grid.
 
@@ -20,6 +20,8 @@ def get_prior_avgint_grid(settings, integrands, sexes, locations, midpoint=False
         sexes: (list of int)
         locations: (list of int)
         midpoint: (bool)
+        alchemy: (cascade_at.model.grid_alchemy.Alchemy) optional alchemy for these settings,
+            to reuse its smoothing grids rather than making a new one
 
     Returns: (pd.DataFrame) with columns
         "avgint_id", "integrand_id", "location_id", "weight_id", "subgroup_id",
@@ -27,7 +29,8 @@ def get_prior_avgint_grid(settings, integrands, sexes, locations, midpoint=False
 
     """
     posterior_dfs = pd.DataFrame()
-    alchemy = Alchemy(settings)
+    if alchemy is None:
+        alchemy = Alchemy(settings)
     grids = integrand_grids(alchemy=alchemy, integrands=integrands)
     for k, v in grids.items():
         if midpoint:
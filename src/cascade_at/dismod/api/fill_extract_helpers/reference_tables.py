@@ -6,6 +6,7 @@ from collections import defaultdict
 from cascade_at.dismod.constants import DensityEnum, IntegrandEnum, \
     RateEnum, enum_to_dataframe
 from cascade_at.core.log import get_loggers
+from cascade_at.dismod.api.fill_extract_helpers import utils
 
 LOG = get_loggers(__name__)
 
@@ -81,10 +82,13 @@ def construct_node_table(location_dag):
     node = location_dag.to_dataframe()
     node = node.reset_index(drop=True)
     node["node_id"] = node.index
-    p_node = node[["node_id", "location_id"]].rename(
-        columns={"location_id": "parent_id", "node_id": "parent"}
+    lookup = utils.integer_lookup(keys=node.location_id.values, values=node.node_id.values.astype(np.float64),
+                                  fill_value=np.nan)
+    has_parent = node.parent_id.notna().values
+    node["parent"] = np.nan
+    node.loc[has_parent, "parent"] = utils.apply_lookup(
+        lookup, node.parent_id.values[has_parent], fill_value=np.nan
     )
-    node = node.merge(p_node, on="parent_id", how="left")
     node.rename(columns={
         "name": "node_name",
         "location_id": "c_location_id"
@@ -0,0 +1,120 @@
+"""
+Content hashes of the tables in a dismod database, so that a database can be
+rebuilt incrementally. Each table that DismodFiller makes has a hash, either of
+the table itself, for tables that are cheap to make, or of the inputs it is made from,
+for the data and avgint tables. The hashes are kept in the c_table_hash table. When a
+database is rebuilt, only the tables whose hashes changed are written again,
+and only the dismod commands that read those tables need to run again.
+"""
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.core.log import get_loggers
+
+LOG = get_loggers(__name__)
+
+TABLE_HASH_TABLE = 'c_table_hash'
+
+COMMAND_STAGES = {
+    'init': 0,
+    'fit': 1, 'set': 1, 'depend': 1,
+    'simulate': 2, 'sample': 2,
+    'predict': 3
+}
+"""The order in which dismod commands use the results of other commands."""
+
+FIT_OPTIONS = [
+    f'{option}_{kind}' for option in [
+        'derivative_test', 'max_num_iter', 'print_level', 'accept_after_max_steps', 'tolerance'
+    ] for kind in ['fixed', 'random']
+] + ['quasi_fixed', 'bound_frac_fixed', 'limited_memory_max_history_fixed', 'random_seed']
+"""
+Options that only the optimizer and the commands after it use. Init makes the
+var, start_var and scale_var tables from the others, like parent_node_id, rate_case,
+age_avg_split and zero_sum_child_rate, so a change to any of them goes back to init.
+"""
+
+TABLE_STAGES = {
+    'option_fit': COMMAND_STAGES['fit'],
+    'avgint': COMMAND_STAGES['predict']
+}
+"""
+The first stage that reads each table, for tables that init doesn't need. All others go back to init.
+The option table has two hashes, option for the options that init uses and option_fit for FIT_OPTIONS.
+"""
+
+
+def _update(digest, part):
+    if isinstance(part, pd.DataFrame):
+        digest.update(json.dumps([str(c) for c in part.columns]).encode())
+        digest.update(pd.util.hash_pandas_object(part, index=False).values.tobytes())
+    elif isinstance(part, pd.Series):
+        digest.update(pd.util.hash_pandas_object(part, index=False).values.tobytes())
+    elif isinstance(part, np.ndarray):
+        digest.update(f'{part.dtype}{part.shape}'.encode())
+        digest.update(np.ascontiguousarray(part).tobytes())
+    elif isinstance(part, dict) and any(isinstance(v, (pd.DataFrame, np.ndarray)) for v in part.values()):
+        for key in sorted(part.keys(), key=str):
+            digest.update(str(key).encode())
+            _update(digest, part[key])
+    else:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+
+
+def content_hash(*parts):
+    """
+    A hash of data frames, arrays, and anything that can be written as JSON,
+    like the dictionary of a settings form.
+
+    Returns:
+        (str) hex digest
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        _update(digest, part)
+    return digest.hexdigest()
+
+
+def split_options(option):
+    """
+    Splits the option table into the options that init uses and FIT_OPTIONS,
+    so that they can be hashed apart.
+
+    Args:
+        option: (pd.DataFrame) with option_name and option_value
+
+    Returns:
+        (pd.DataFrame, pd.DataFrame) the init options and the fit options
+    """
+    option = option[['option_name', 'option_value']].sort_values('option_name').reset_index(drop=True)
+    fit = option.option_name.isin(FIT_OPTIONS)
+    return option.loc[~fit].reset_index(drop=True), option.loc[fit].reset_index(drop=True)
+
+
+def command_stage(command):
+    """The stage of a dismod command, like 'fit both' or 'predict fit_var'."""
+    return COMMAND_STAGES.get(command.split()[0], COMMAND_STAGES['init'])
+
+
+def invalidated_commands(changed_tables, commands):
+    """
+    The commands that have to run again after some input tables changed. These are
+    all of the commands from the first one that reads a changed table onwards.
+
+    Args:
+        changed_tables: (List[str]) names of tables that were written
+        commands: (List[str]) dismod commands, in the order they run
+
+    Returns:
+        (List[str])
+    """
+    if not changed_tables:
+        return list()
+    first_stage = min(TABLE_STAGES.get(t, COMMAND_STAGES['init']) for t in changed_tables)
+    for i, command in enumerate(commands):
+        if command_stage(command) >= first_stage:
+            return list(commands[i:])
+    return list()
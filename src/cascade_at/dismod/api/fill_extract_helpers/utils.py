@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 
 
@@ -13,37 +14,125 @@ def vec_to_midpoint(array):
     return (array[1:] + array[:-1]) / 2
 
 
+def integer_lookup(keys, values, fill_value=-1):
+    """
+    Makes a dense lookup array so that lookup[key] = value
+    for non-negative integer keys, like location IDs or node IDs.
+
+    Args:
+        keys: (np.array) non-negative integer keys
+        values: (np.array) values for each key
+        fill_value: value for integers that aren't keys
+
+    Returns: (np.array)
+    """
+    keys = np.asarray(keys).astype(np.int64)
+    values = np.asarray(values)
+    lookup = np.full(keys.max() + 1 if len(keys) else 0, fill_value,
+                     dtype=np.result_type(values.dtype, np.min_scalar_type(fill_value)))
+    lookup[keys] = values
+    return lookup
+
+
+def apply_lookup(lookup, keys, fill_value=-1):
+    """
+    Looks up keys in a dense lookup array from integer_lookup,
+    giving fill_value for keys that are out of its range.
+
+    Args:
+        lookup: (np.array) from integer_lookup
+        keys: (np.array) integer keys to look up
+        fill_value: value for keys that aren't in the lookup
+
+    Returns: (np.array)
+    """
+    keys = np.asarray(keys).astype(np.int64)
+    in_range = (keys >= 0) & (keys < len(lookup))
+    result = np.full(keys.shape, fill_value, dtype=lookup.dtype)
+    result[in_range] = lookup[keys[in_range]]
+    return result
+
+
+def nearest_id(values, grid, ids):
+    """
+    Finds the ID of the closest grid point to each value, with ties going
+    to the smaller grid point. Missing values get a missing ID.
+
+    Args:
+        values: (np.array) values to snap to the grid, like ages or times
+        grid: (np.array) grid values
+        ids: (np.array) integer IDs for each grid value
+
+    Returns: (np.array) integers if no values are missing, otherwise floats with NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+    ids = np.asarray(ids)
+    order = np.argsort(grid, kind='stable')
+    grid = grid[order]
+    ids = ids[order]
+
+    missing = np.isnan(values)
+    position = np.zeros(values.shape, dtype=np.int64)
+    if len(grid) > 1:
+        position = np.clip(np.searchsorted(grid, values), 1, len(grid) - 1)
+        closer_below = (values - grid[position - 1]) <= (grid[position] - values)
+        position = position - closer_below
+    result = ids[position]
+    if missing.any():
+        result = result.astype(np.float64)
+        result[missing] = np.nan
+    return result
+
+
 def map_locations_to_nodes(df, node_df):
     """
     Maps the location ID to node ID and
-    changes column names in a df.
+    changes column names in a df. Rows for locations
+    that aren't in the node table are dropped.
     """
-    data = df.copy()
-    data.rename(columns={
+    lookup = integer_lookup(keys=node_df.c_location_id.values, values=node_df.node_id.values)
+    data = df.rename(columns={
         "location_id": "c_location_id",
         "location": "c_location"
-    }, inplace=True)
-    data['c_location_id'] = data['c_location_id'].astype(int)
-    data = data.merge(
-        node_df[["node_id", "c_location_id"]],
-        on=["c_location_id"]
-    )
+    })
+    if not np.issubdtype(data['c_location_id'].dtype, np.integer):
+        data['c_location_id'] = data['c_location_id'].astype(int)
+    node_id = apply_lookup(lookup, data['c_location_id'].values)
+    in_nodes = node_id >= 0
+    if not in_nodes.all():
+        data = data.loc[in_nodes]
+        node_id = node_id[in_nodes]
+    data['node_id'] = node_id
     return data
 
 
+def map_nodes_to_locations(df, node_df):
+    """
+    Maps the node ID to location ID, adding a c_location_id column.
+    This is the reverse of map_locations_to_nodes, for reading
+    results out of a dismod database.
+    """
+    lookup = integer_lookup(keys=node_df.node_id.values, values=node_df.c_location_id.values)
+    data = df.copy()
+    data['c_location_id'] = apply_lookup(lookup, data['node_id'].values)
+    return data
+
+
+def covariate_name_map(covariate_df):
+    """
+    Makes a dictionary from the covariate names in the inputs
+    to the covariate names in the covariate table (x_0, x_1, ...).
+    """
+    return dict(zip(covariate_df.c_covariate_name.values, covariate_df.covariate_name.values))
+
+
 def map_covariate_names(df, covariate_df):
     """
     Maps the covariate names to the covariate
     IDs in the covariate table.
     """
-    data = df.copy()
-    covariate_rename = pd.Series(
-        covariate_df.covariate_name.values,
-        index=covariate_df.c_covariate_name
-    ).to_dict()
-
-    data.rename(columns=covariate_rename, inplace=True)
-    return data
+    return df.rename(columns=covariate_name_map(covariate_df))
 
 
 def convert_age_time_to_id(df, age_df, time_df):
@@ -57,17 +146,34 @@ def convert_age_time_to_id(df, age_df, time_df):
     :param time_df: pdDataFrame
     :return:
     """
-    at_tables = {'age': age_df, 'time': time_df}
     assert "age" in df.columns
     assert "time" in df.columns
-    df = df.assign(save_idx=df.index)
-    for dat in ["age", "time"]:
-        col_id = f"{dat}_id"
-        sort_by = df.sort_values(dat)
-        in_grid = sort_by[dat].notna()
-        at_table = at_tables[dat]
-        aged = pd.merge_asof(sort_by[in_grid], at_table, on=dat, direction="nearest")
-        df = df.merge(aged[["save_idx", col_id]], on="save_idx", how="left")
-    assert "age_id" in df.columns
-    assert "time_id" in df.columns
-    return df.drop(["save_idx", "age", "time"], axis=1)
+    data = df.drop(["age", "time"], axis=1)
+    data['age_id'] = nearest_id(df['age'].values, age_df['age'].values, age_df['age_id'].values)
+    data['time_id'] = nearest_id(df['time'].values, time_df['time'].values, time_df['time_id'].values)
+    data.index = pd.RangeIndex(len(data))
+    return data
+
+
+def convert_id_to_age_time(df, age_df, time_df):
+    """
+    Converts age and time IDs to the ages and times from the
+    age and time tables. This is the reverse of convert_age_time_to_id,
+    for reading results out of a dismod database. Missing IDs
+    get missing ages and times.
+
+    :param df: pd.DataFrame with age_id and time_id
+    :param age_df: pd.DataFrame
+    :param time_df: pdDataFrame
+    :return:
+    """
+    data = df.copy()
+    for dat, at_table in [('age', age_df), ('time', time_df)]:
+        lookup = integer_lookup(keys=at_table[f'{dat}_id'].values,
+                                values=at_table[dat].values.astype(np.float64), fill_value=np.nan)
+        ids = data[f'{dat}_id'].values.astype(np.float64)
+        known = ~np.isnan(ids)
+        values = np.full(len(data), np.nan)
+        values[known] = apply_lookup(lookup, ids[known], fill_value=np.nan)
+        data[dat] = values
+    return data
@@ -0,0 +1,207 @@
+"""
+Warm starts for a child fit from the fit of its parent.
+
+The parent database has fit values for the parent rates and for the random effects
+of each child location. The child database, after ``init``, has model variables
+whose parent node is that child location. Each child model variable is matched
+to the parent fit by rate (or, for covariate multipliers, by multiplier type,
+rate or integrand and covariate name) and its value is interpolated from the parent's
+age-time grid with the same bilinear interpolation that Dismod-AT uses.
+"""
+import numpy as np
+import pandas as pd
+
+from cascade_at.core.log import get_loggers
+from cascade_at.model.var import Var
+from cascade_at.dismod.api.fill_extract_helpers.utils import convert_id_to_age_time, map_nodes_to_locations
+
+LOG = get_loggers(__name__)
+
+MULCOV_VAR_TYPES = ['mulcov_rate_value', 'mulcov_meas_value', 'mulcov_meas_noise']
+
+
+def read_vars(db, table=None):
+    """
+    Reads the var table with the ages, times, locations and names that identify
+    each model variable, rather than IDs that are specific to the database.
+
+    Args:
+        db: (cascade_at.dismod.api.dismod_io.DismodIO)
+        table: (str) optional table of values to attach, fit_var or start_var
+
+    Returns:
+        pd.DataFrame with var_id, var_type, age, time, c_location_id, rate_name,
+        integrand_name, c_covariate_name and smooth_id, plus value if a table was passed
+    """
+    var = db.read_table('var', columns=[
+        'var_id', 'var_type', 'smooth_id', 'age_id', 'time_id', 'node_id',
+        'rate_id', 'integrand_id', 'covariate_id'
+    ])
+    var = convert_id_to_age_time(var, age_df=db.age, time_df=db.time)
+    var['node_id'] = var.node_id.fillna(-1).astype(int)
+    var = map_nodes_to_locations(var, node_df=db.read_table('node', columns=['node_id', 'c_location_id']))
+
+    for name, table_name, id_column, name_column in [
+        ('rate_name', 'rate', 'rate_id', 'rate_name'),
+        ('integrand_name', 'integrand', 'integrand_id', 'integrand_name'),
+        ('c_covariate_name', 'covariate', 'covariate_id', 'c_covariate_name')
+    ]:
+        names = db.read_table(table_name, columns=[id_column, name_column]).set_index(id_column)[name_column]
+        var[name] = var[id_column].map(names)
+
+    if table is not None:
+        values = db.read_table(table)
+        var['value'] = values[f'{table}_value'].values[var.var_id.values]
+    return var
+
+
+def _interpolate(source, ages, times):
+    """
+    Interpolates the values of one age-time grid of model variables
+    at other ages and times.
+    """
+    var = Var(ages=sorted(source.age.unique()), times=sorted(source.time.unique()))
+    for age, time, value in zip(source.age, source.time, source.value):
+        var[age, time] = value
+    return np.array([var(age, time) for age, time in zip(ages, times)], dtype=np.float64)
+
+
+def _fill_from(target, source, keys):
+    """
+    For each group of target variables with the same keys, interpolates
+    the source variables with those keys onto the target ages and times.
+    Returns the values, with NaN where there is no matching source.
+    """
+    values = np.full(len(target), np.nan)
+    if target.empty or source.empty:
+        return values
+    groups = {k: df for k, df in source.groupby(keys)}
+    for key, rows in target.groupby(keys).indices.items():
+        if key not in groups:
+            continue
+        group = target.iloc[rows]
+        values[rows] = _interpolate(groups[key], ages=group.age.values, times=group.time.values)
+    return values
+
+
+def parent_location(db):
+    """
+    The location ID of the parent node of the model in a database.
+    """
+    option = db.read_table('option', columns=['option_name', 'option_value'])
+    option = option.set_index('option_name').option_value
+    node = db.read_table('node', columns=['node_id', 'node_name', 'c_location_id'])
+    if 'parent_node_id' in option and option['parent_node_id']:
+        node = node.loc[node.node_id == int(option['parent_node_id'])]
+    else:
+        node = node.loc[node.node_name == option['parent_node_name']]
+    return int(node.c_location_id.iloc[0])
+
+
+def warm_start_values(parent_vars, child_vars, parent_location_id, child_location_id):
+    """
+    Maps the fit of a parent model onto the model variables of a child model.
+
+    The rates for the child location are the parent rates times the exponential
+    of the child's random effects in the parent fit. Covariate multipliers
+    are carried over as they are. Child random effects and the standard deviation
+    multipliers aren't mapped, so they get NaN.
+
+    Args:
+        parent_vars: (pd.DataFrame) from read_vars on the parent database with fit_var values
+        child_vars: (pd.DataFrame) from read_vars on the child database
+        parent_location_id: (int) the location that is the parent of the parent model
+        child_location_id: (int) the location that is the parent of the child model
+
+    Returns:
+        (np.ndarray) start values for each of the child_vars, with NaN for ones not mapped
+    """
+    values = np.full(len(child_vars), np.nan)
+
+    parent_rates = parent_vars.loc[(parent_vars.var_type == 'rate') &
+                                   (parent_vars.c_location_id == parent_location_id)]
+    random_effects = parent_vars.loc[(parent_vars.var_type == 'rate') &
+                                     (parent_vars.c_location_id == child_location_id)]
+
+    is_rate = ((child_vars.var_type == 'rate') & (child_vars.c_location_id == child_location_id)).values
+    rates = child_vars.loc[is_rate]
+    rate_values = _fill_from(rates, parent_rates, keys='rate_name')
+    effects = _fill_from(rates, random_effects, keys='rate_name')
+    values[is_rate] = rate_values * np.exp(np.nan_to_num(effects))
+
+    is_mulcov = child_vars.var_type.isin(MULCOV_VAR_TYPES).values
+    for name in ['rate_name', 'integrand_name']:
+        keys = ['var_type', name, 'c_covariate_name']
+        subset = is_mulcov & child_vars[name].notnull().values
+        source = parent_vars.loc[parent_vars.var_type.isin(MULCOV_VAR_TYPES) & parent_vars[name].notnull()]
+        values[subset] = _fill_from(child_vars.loc[subset], source, keys=keys)
+    return values
+
+
+def clip_to_priors(db, var, values):
+    """
+    Moves start values inside the bounds of the value priors of each
+    model variable, and sets variables that are constant in the smoothing
+    to their constant values, because Dismod-AT won't start outside of the limits.
+
+    Args:
+        db: (cascade_at.dismod.api.dismod_io.DismodIO) database of the model
+        var: (pd.DataFrame) the var table of that database
+        values: (np.ndarray) start values for each var
+
+    Returns:
+        (np.ndarray)
+    """
+    grid = db.read_table('smooth_grid', columns=['smooth_id', 'age_id', 'time_id', 'value_prior_id', 'const_value'])
+    prior = db.read_table('prior', columns=['prior_id', 'lower', 'upper']).set_index('prior_id')
+    grid['lower'] = grid.value_prior_id.map(prior.lower)
+    grid['upper'] = grid.value_prior_id.map(prior.upper)
+    bounds = var[['smooth_id', 'age_id', 'time_id']].merge(
+        grid, on=['smooth_id', 'age_id', 'time_id'], how='left'
+    )
+    values = np.clip(values, bounds.lower.fillna(-np.inf).values, bounds.upper.fillna(np.inf).values)
+    constant = bounds.const_value.notnull().values
+    values[constant] = bounds.const_value.values[constant]
+    return values
+
+
+def warm_start(parent_db, child_db, child_location_id, scale=True):
+    """
+    Writes a start_var (and scale_var) table in the child database from the
+    fit_var table of the parent database. This has to happen after ``init``
+    on the child database, which makes the var, start_var and scale_var tables.
+    Variables that can't be mapped from the parent keep the values that ``init`` gave them.
+
+    Args:
+        parent_db: (cascade_at.dismod.api.dismod_io.DismodIO) database that has been fit
+        child_db: (cascade_at.dismod.api.dismod_io.DismodIO) database that has been initialized
+        child_location_id: (int) the parent location of the child model
+        scale: (bool) also write the scale_var table
+
+    Returns:
+        (int) the number of model variables that were warm started
+    """
+    parent_vars = read_vars(parent_db, table='fit_var')
+    child_vars = read_vars(child_db, table='start_var')
+    mapped = warm_start_values(
+        parent_vars, child_vars,
+        parent_location_id=parent_location(parent_db), child_location_id=child_location_id
+    )
+
+    var = child_db.read_table('var', columns=['var_id', 'smooth_id', 'age_id', 'time_id'])
+    has_value = ~np.isnan(mapped)
+    values = np.where(has_value, mapped, child_vars.value.values)
+    values = clip_to_priors(child_db, var=var, values=values)
+    LOG.info(f"Warm starting {has_value.sum()} of {len(values)} model variables "
+             f"for location {child_location_id} from {parent_db.path}.")
+
+    child_db.write_table('start_var', pd.DataFrame({
+        'start_var_id': child_vars.var_id.values, 'start_var_value': values
+    }))
+    if scale:
+        scale_values = child_db.read_table('scale_var').scale_var_value.values[child_vars.var_id.values]
+        child_db.write_table('scale_var', pd.DataFrame({
+            'scale_var_id': child_vars.var_id.values,
+            'scale_var_value': np.where(has_value, values, scale_values)
+        }))
+    return int(has_value.sum())
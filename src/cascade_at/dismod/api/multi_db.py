@@ -0,0 +1,209 @@
+"""
+Queries that span many dismod databases.
+
+Post-processing steps often need the same table out of the dismod databases
+for many locations and sexes. Rather than opening an engine per file and merging
+in pandas, the databases are ATTACHed to a single sqlite connection a batch at a time
+and one ``UNION ALL`` query is run over each batch. The query is written once
+as a template with a ``{db}`` placeholder for the schema name, so joins between
+tables in the same database happen inside sqlite, and each row is tagged with
+the location and sex of the database it came from.
+"""
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.core.log import get_loggers
+
+LOG = get_loggers(__name__)
+
+ATTACH_BATCH_SIZE = 10
+"""Number of databases attached at once. Sqlite allows 10 by default."""
+
+
+class AttachedDatabases:
+    def __init__(self, paths, tags=None, batch_size=ATTACH_BATCH_SIZE):
+        """
+        A set of dismod databases to query together.
+
+        Databases that don't exist are skipped with a warning.
+
+        Parameters:
+            paths: (List[pathlib.Path]) paths to the dismod databases
+            tags: (List[Dict]) optional tags for each database, like
+                {'location_id': 102, 'sex_id': 2}, that are added as columns to each
+                row that comes from that database. All databases need the same tag names.
+            batch_size: (int) number of databases to attach to a connection at once
+
+        Usage:
+        >>> databases = AttachedDatabases(
+        >>>     paths=[context.db_file(location_id=l, sex_id=s) for l, s in pairs],
+        >>>     tags=[dict(location_id=l, sex_id=s) for l, s in pairs]
+        >>> )
+        >>> df = databases.query("SELECT fit_var_id, fit_var_value FROM {db}.fit_var", tables=['fit_var'])
+        """
+        paths = [Path(p) for p in paths]
+        if tags is None:
+            tags = [dict() for _ in paths]
+        if len(tags) != len(paths):
+            raise ValueError(f"Got {len(tags)} tags for {len(paths)} databases.")
+        tag_names = {tuple(t.keys()) for t in tags}
+        if len(tag_names) > 1:
+            raise ValueError(f"All databases need the same tags, got {tag_names}.")
+        if batch_size < 1:
+            raise ValueError(f"The batch size has to be at least one, got {batch_size}.")
+
+        exists = [p.is_file() for p in paths]
+        for path, present in zip(paths, exists):
+            if not present:
+                LOG.warning(f"Database {path} does not exist and will be skipped.")
+        self.paths = [p for p, present in zip(paths, exists) if present]
+        self.tags = [t for t, present in zip(tags, exists) if present]
+        self.tag_names = list(tag_names.pop()) if tag_names else list()
+        self.batch_size = batch_size
+
+    def __len__(self):
+        return len(self.paths)
+
+    def batches(self):
+        """
+        Splits the databases into batches that can be attached to one connection.
+
+        Returns: list of (paths, tags) for each batch
+        """
+        return [
+            (self.paths[start:start + self.batch_size], self.tags[start:start + self.batch_size])
+            for start in range(0, len(self.paths), self.batch_size)
+        ]
+
+    def query(self, template, params=None, tables=None, dtypes=None):
+        """
+        Runs the query template on every database and stacks the results.
+
+        Parameters:
+            template: (str) a SELECT statement where every table is qualified
+                with the ``{db}`` schema placeholder, e.g. "SELECT * FROM {db}.var"
+            params: (tuple) values for ? placeholders in the template, which are
+                passed again for each database
+            tables: (List[str]) tables the template reads. Databases that are missing any
+                of them are skipped with a warning, rather than failing the query.
+            dtypes: (Dict[str, type]) optional types for result columns
+
+        Returns:
+            pd.DataFrame with the tag columns followed by the columns of the query
+        """
+        dfs = list(self.query_batches(template=template, params=params, tables=tables, dtypes=dtypes))
+        if not dfs:
+            return _empty_result(self.tag_names, columns=list(), dtypes=dtypes)
+        return pd.concat(dfs, ignore_index=True, sort=False)
+
+    def query_batches(self, template, params=None, tables=None, dtypes=None):
+        """
+        Same as query, but yields one data frame per batch of databases so that
+        results can be processed without holding them all in memory at once.
+        """
+        for paths, tags in self.batches():
+            yield query_attached(
+                paths=paths, tags=tags, tag_names=self.tag_names, template=template,
+                params=params, tables=tables, dtypes=dtypes
+            )
+
+    def read_table(self, table_name, columns=None, where=None, params=None):
+        """
+        Reads the same table from every database.
+
+        Parameters:
+            table_name: (str) name of the table
+            columns: (List[str]) columns to read, or all of them
+            where: (str) SQL condition on the rows to read
+            params: (tuple) values for ? placeholders in where
+
+        Returns:
+            pd.DataFrame
+        """
+        selection = "*" if columns is None else ", ".join(f'"{c}"' for c in columns)
+        template = f'SELECT {selection} FROM {{db}}."{table_name}"'
+        if where is not None:
+            template += f" WHERE {where}"
+        return self.query(template=template, params=params, tables=[table_name])
+
+
+def query_attached(paths, tags, tag_names, template, params=None, tables=None, dtypes=None):
+    """
+    Attaches a batch of databases to one in-memory connection and runs the
+    template over all of them as a single UNION ALL query.
+
+    Parameters:
+        paths: (List[pathlib.Path]) databases to attach, no more than the sqlite attach limit
+        tags: (List[Dict]) tag values for each database
+        tag_names: (List[str]) names of the tag columns
+        template: (str) query with a ``{db}`` schema placeholder
+        params: (tuple) values for ? placeholders in the template
+        tables: (List[str]) tables that each database must have
+        dtypes: (Dict[str, type]) optional types for result columns
+
+    Returns:
+        pd.DataFrame
+    """
+    params = tuple(params or ())
+    connection = sqlite3.connect(":memory:", uri=True)
+    try:
+        schemas = list()
+        for i, (path, tag) in enumerate(zip(paths, tags)):
+            schema = f"db{i}"
+            connection.execute(f"ATTACH DATABASE ? AS {schema}", (f"{path.absolute().as_uri()}?mode=ro",))
+            if tables and not _has_tables(connection, schema, tables):
+                LOG.warning(f"Database {path} is missing one of the tables {tables} and will be skipped.")
+                continue
+            schemas.append((schema, tag))
+
+        if not schemas:
+            return _empty_result(tag_names, columns=list(), dtypes=dtypes)
+
+        selects = list()
+        parameters = list()
+        for schema, tag in schemas:
+            tag_columns = "".join(f'? AS "{name}", ' for name in tag_names)
+            selects.append(f"SELECT {tag_columns}q.* FROM ({template.format(db=schema)}) AS q")
+            parameters.extend(tag[name] for name in tag_names)
+            parameters.extend(params)
+        cursor = connection.execute(" UNION ALL ".join(selects), parameters)
+        columns = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        connection.close()
+
+    if not rows:
+        return _empty_result(tag_names, columns=columns[len(tag_names):], dtypes=dtypes)
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    return _apply_dtypes(df, dtypes)
+
+
+def _has_tables(connection, schema, tables):
+    found = connection.execute(
+        f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' AND name IN "
+        f"({', '.join('?' for _ in tables)})", tuple(tables)
+    ).fetchall()
+    return len(found) == len(set(tables))
+
+
+def _apply_dtypes(df, dtypes):
+    """
+    Casts columns to the requested types. Integer columns with
+    nulls become floats, the same way that read_table does it.
+    """
+    for column, dtype in (dtypes or dict()).items():
+        if column not in df:
+            continue
+        if dtype is int and df[column].isnull().any():
+            dtype = float
+        df[column] = df[column].astype(dtype)
+    return df
+
+
+def _empty_result(tag_names, columns, dtypes):
+    df = pd.DataFrame({c: np.array([], dtype=object) for c in tag_names + columns}, columns=tag_names + columns)
+    return _apply_dtypes(df, dtypes)
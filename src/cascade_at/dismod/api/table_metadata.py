@@ -367,6 +367,18 @@ class ExecutionData(Base):
     value = Column(String(), nullable=False)
 
 
+class TableHash(Base):
+    """
+    Not a dismod table. Content hashes of the input tables that were written,
+    so that a database can be rebuilt incrementally.
+    """
+    __tablename__ = "c_table_hash"
+
+    c_table_hash_id = Column(Integer(), primary_key=True, autoincrement=False)
+    table_name = Column(String(), unique=True)
+    table_hash = Column(String(), nullable=False)
+
+
 class DataSubset(Base):
     """
     Output, identifies which rows of the data table are included in
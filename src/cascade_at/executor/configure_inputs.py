@@ -4,6 +4,7 @@ from argparse import ArgumentParser
 from cascade_at.context.model_context import Context
 from cascade_at.settings.settings import settings_json_from_model_version_id, load_settings
 from cascade_at.inputs.measurement_inputs import MeasurementInputsFromSettings
+from cascade_at.inputs.utilities.stage_cache import StageCache
 from cascade_at.core.log import get_loggers, LEVELS
 
 LOG = get_loggers(__name__)
@@ -21,6 +22,14 @@ def get_args():
                         help="whether or not to make the file structure for cascade")
     parser.add_argument("--configure", action='store_true',
                         help="whether or not to configure the application")
+    parser.add_argument("--compact", action='store_true',
+                        help="whether to keep the population and covariates in compact form, as float32")
+    parser.add_argument("--n-processes", type=int, required=False, default=1,
+                        help="number of processes to prepare the country covariates in")
+    parser.add_argument("--no-stage-cache", action='store_true',
+                        help="whether to make every stage of the inputs rather than reading them from the cache")
+    parser.add_argument("--stage-cache-gb", type=float, required=False, default=10.,
+                        help="largest size of the stage cache, in GB")
     parser.add_argument("--loglevel", type=str, required=False, default='info')
     return parser.parse_args()
 
@@ -51,9 +60,19 @@ def main():
     )
     settings = load_settings(settings_json=parameter_json)
 
-    inputs = MeasurementInputsFromSettings(settings=settings)
+    inputs = MeasurementInputsFromSettings(
+        settings=settings, compact=args.compact, n_processes=args.n_processes
+    )
+    if args.no_stage_cache:
+        stage_cache = None
+    else:
+        stage_cache = StageCache(
+            directory=context.cache_dir, max_bytes=int(args.stage_cache_gb * 1024 ** 3)
+        )
     inputs.get_raw_inputs()
-    inputs.configure_inputs_for_dismod(settings=settings)
+    inputs.configure_inputs_for_dismod(settings=settings, stage_cache=stage_cache)
+    if stage_cache is not None:
+        LOG.info(f"Stage cache had {len(stage_cache.hits)} hits and {len(stage_cache.misses)} misses.")
 
     context.write_inputs(inputs=inputs, settings=parameter_json)
 
@@ -1,15 +1,25 @@
 import logging
+import itertools as it
+import multiprocessing
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 from cascade_at.context.model_context import Context
 from cascade_at.dismod.api.dismod_filler import DismodFiller
 from cascade_at.dismod.api.dismod_extractor import DismodExtractor
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.fill_extract_helpers.warm_start import warm_start
+from cascade_at.dismod.api.fill_extract_helpers.data_pruning import PRUNING_RULES
 from cascade_at.context.arg_utils import parse_options, parse_commands
 from cascade_at.dismod.api.run_dismod import run_dismod_commands
+from cascade_at.saver.draw_cache import DrawCache
 from cascade_at.core.log import get_loggers, LEVELS
 
 LOG = get_loggers(__name__)
 
+FIT_FIXED_COMMANDS = ['fit fixed', 'set start_var fit_var', 'set scale_var fit_var']
+"""Commands that a warm start replaces when skipping the fit fixed pre-pass."""
+
 
 def get_args():
     """
@@ -18,13 +28,35 @@ def get_args():
     """
     parser = ArgumentParser()
     parser.add_argument("-model-version-id", type=int, required=True)
-    parser.add_argument("-parent-location-id", type=int, required=True)
-    parser.add_argument("-sex-id", type=int, required=True)
+    parser.add_argument("-parent-location-id", type=int, nargs="+", required=True,
+                        help="one or more parent locations to build databases for")
+    parser.add_argument("-sex-id", type=int, nargs="+", required=True,
+                        help="one or more sexes to build databases for, for each parent")
     parser.add_argument("--options", metavar="KEY=VALUE=TYPE", nargs="+", required=False,
                         help="optional key-value-type pairs to set in the option table of dismod")
     parser.add_argument("--prior-parent", type=int, required=False, default=None)
     parser.add_argument("--prior-sex", type=int, required=False, default=None)
     parser.add_argument("--commands", nargs="+", required=False, default=[])
+    parser.add_argument("--warm-start", action='store_true', required=False,
+                        help="after init, start from the fit of the prior parent database")
+    parser.add_argument("--skip-fit-fixed", action='store_true', required=False,
+                        help="with --warm-start, skip fit fixed and setting start_var and scale_var from it")
+    parser.add_argument("--index-tables", action='store_true', required=False,
+                        help="index the tables that extraction filters and joins on, "
+                             "after filling and after the commands")
+    parser.add_argument("--prune-rules", nargs="*", required=False, default=None,
+                        choices=list(PRUNING_RULES.keys()),
+                        help="rules for dropping data that dismod would ignore, default all of them. "
+                             "Pass the flag with no rules to write all of the data.")
+    parser.add_argument("--keep-held-out", action='store_true', required=False,
+                        help="keep held out data in the data table, for diagnostics")
+    parser.add_argument("--incremental", action='store_true', required=False,
+                        help="only rewrite the tables that changed since the database was last filled, "
+                             "and only run the commands that depend on them")
+    parser.add_argument("--n-workers", type=int, required=False, default=1,
+                        help="number of databases to build at the same time")
+    parser.add_argument("--pool", type=str, required=False, default='thread', choices=['thread', 'process'],
+                        help="build databases concurrently in threads or in forked processes")
     parser.add_argument("--loglevel", type=str, required=False, default='info')
 
     arguments = parser.parse_args()
@@ -41,55 +73,190 @@ def get_args():
         arguments.commands = parse_commands(arguments.commands)
     else:
         arguments.commands = list()
+    if arguments.skip_fit_fixed and not arguments.warm_start:
+        parser.error("--skip-fit-fixed can only be used with --warm-start.")
     return arguments
 
 
-def main():
+def rate_grids(alchemy):
     """
-    Creates a dismod database using the saved inputs and the file
-    structure specified in the context.
-    
-    Then runs an optional set of commands on the database passed
-    in the --commands argument.
-    
-    Also passes an optional argument --options as a dictionary to
-    the dismod database to fill/modify the options table.
+    The ages and times of the smoothing grid for each rate.
     """
-    args = get_args()
-    logging.basicConfig(level=LEVELS[args.loglevel])
+    return {rate: (grid.ages, grid.times) for rate, grid in alchemy.get_all_rates_grids().items()}
+
+
+def split_commands_for_warm_start(commands, skip_fit_fixed=False):
+    """
+    Splits the dismod commands into the ones before and after the warm start,
+    which goes right after init because init writes the start_var table.
+
+    Args:
+        commands: (List[str]) dismod commands
+        skip_fit_fixed: (bool) drop the fit fixed pre-pass and the commands that use its results
+
+    Returns:
+        (List[str], List[str]) commands before and after the warm start
+    """
+    if 'init' not in commands:
+        raise ValueError(f"A warm start goes after init, which isn't in the commands {commands}.")
+    if skip_fit_fixed:
+        commands = [c for c in commands if c not in FIT_FIXED_COMMANDS]
+    split = commands.index('init') + 1
+    return commands[:split], commands[split:]
+
+
+_SHARED = dict()
+"""Inputs shared by all of the databases in one call. Forked workers inherit them."""
+
+
+def database_executor(pool, n_workers):
+    """
+    An executor that builds databases concurrently. Processes are forked,
+    whatever the platform's default start method is, so that they inherit
+    the shared inputs without pickling them. Where fork isn't available,
+    the databases are built in threads instead.
+
+    Args:
+        pool: (str) 'thread' or 'process'
+        n_workers: (int) number of databases to build at the same time
+
+    Returns:
+        (concurrent.futures.Executor)
+    """
+    if pool == 'process':
+        if 'fork' in multiprocessing.get_all_start_methods():
+            return ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context('fork'))
+        LOG.warning("Processes can't be forked on this platform, so building the databases in threads.")
+    return ThreadPoolExecutor(max_workers=n_workers)
+
+
+def get_child_prior(context, alchemy, settings, prior_parent, prior_sex, location_id, sex_id):
+    """
+    Gets the draws from a previous database that become the priors
+    for a location and sex. They come from the cache that predict_sample wrote,
+    or straight from the parent's sample table if the grids line up,
+    otherwise from the predictions made by predict_sample.
+    """
+    prior_db = context.db_file(location_id=prior_parent, sex_id=prior_sex)
+    rates = [r.rate for r in settings.rate]
+    child_prior = DrawCache(directory=prior_db.parent, source=prior_db).read(
+        location_id=location_id,
+        sex_id=sex_id,
+        rates=rates
+    )
+    if child_prior is None:
+        extractor = DismodExtractor(path=prior_db)
+        child_prior = extractor.gather_draws_from_sample(
+            location_id=location_id,
+            rates=rates,
+            grids=rate_grids(alchemy)
+        )
+        if child_prior is None:
+            child_prior = extractor.gather_draws_for_prior_grid(
+                location_id=location_id,
+                sex_id=sex_id,
+                rates=rates
+            )
+    return child_prior
 
-    context = Context(model_version_id=args.model_version_id)
 
-    inputs, alchemy, settings = context.read_inputs()
+def fill_and_run(parent_location_id, sex_id):
+    """
+    Builds the database for one parent and sex from the shared inputs
+    and runs the commands on it.
+    """
+    args = _SHARED['args']
+    context = _SHARED['context']
+    inputs, alchemy, settings = _SHARED['inputs']
 
     # If we want to override the rate priors with posteriors from a previous
     # database, pass them in here.
-    if args.prior_parent or args.prior_sex:
-        if not (args.prior_parent and args.prior_sex):
-            raise RuntimeError("Need to pass both prior parent and sex or neither.")
-        child_prior = DismodExtractor(path=context.db_file(
-            location_id=args.prior_parent,
-            sex_id=args.prior_sex
-        )).gather_draws_for_prior_grid(
-            location_id=args.parent_location_id,
-            sex_id=args.sex_id,
-            rates=[r.rate for r in settings.rate]
+    if args.prior_parent:
+        prior_db = context.db_file(location_id=args.prior_parent, sex_id=args.prior_sex)
+        child_prior = get_child_prior(
+            context=context, alchemy=alchemy, settings=settings,
+            prior_parent=args.prior_parent, prior_sex=args.prior_sex,
+            location_id=parent_location_id, sex_id=sex_id
         )
     else:
+        prior_db = None
         child_prior = None
 
     df = DismodFiller(
-        path=context.db_file(location_id=args.parent_location_id, sex_id=args.sex_id),
+        path=context.db_file(location_id=parent_location_id, sex_id=sex_id),
         settings_configuration=settings,
         measurement_inputs=inputs,
         grid_alchemy=alchemy,
-        parent_location_id=args.parent_location_id,
-        sex_id=args.sex_id,
-        child_prior=child_prior
+        parent_location_id=parent_location_id,
+        sex_id=sex_id,
+        child_prior=child_prior,
+        shared_tables=_SHARED['tables'],
+        pruning_rules=args.prune_rules,
+        keep_held_out=args.keep_held_out,
+        incremental=args.incremental
     )
     df.fill_for_parent_child(**args.options)
+    if args.index_tables:
+        df.create_indexes()
+
+    commands = args.commands
+    if args.incremental:
+        commands = df.invalidated_commands(commands)
+        LOG.info(f"Running {commands} of {args.commands} because of the tables that changed.")
+    if args.warm_start and commands and 'init' not in commands:
+        # Without init, the var table may not match the start_var that a warm start would write.
+        LOG.info(f"Not warm starting {df.path} because init isn't in the commands {commands}.")
+    if args.warm_start and 'init' in commands:
+        before, after = split_commands_for_warm_start(commands, skip_fit_fixed=args.skip_fit_fixed)
+        run_dismod_commands(dm_file=df.path.absolute(), commands=before)
+        warm_start(parent_db=DismodIO(path=prior_db), child_db=df, child_location_id=parent_location_id)
+        run_dismod_commands(dm_file=df.path.absolute(), commands=after)
+    else:
+        run_dismod_commands(dm_file=df.path.absolute(), commands=commands)
+    # The hashes are stored only now that the results of the tables are in the database.
+    # If this task is killed before here, the next incremental run starts over.
+    df.write_table_hashes()
+    if args.index_tables and commands:
+        df.create_indexes()
+    return parent_location_id, sex_id
+
+
+def main():
+    """
+    Creates dismod databases using the saved inputs and the file
+    structure specified in the context, one for each of the parent
+    locations and sexes passed. The inputs are read once and the
+    tables that are the same for all of the databases are made once.
+    
+    Then runs an optional set of commands on each database passed
+    in the --commands argument.
+    
+    Also passes an optional argument --options as a dictionary to
+    the dismod database to fill/modify the options table.
+    """
+    args = get_args()
+    logging.basicConfig(level=LEVELS[args.loglevel])
 
-    run_dismod_commands(dm_file=df.path.absolute(), commands=args.commands)
+    if args.prior_parent or args.prior_sex:
+        if not (args.prior_parent and args.prior_sex):
+            raise RuntimeError("Need to pass both prior parent and sex or neither.")
+    if args.warm_start and not args.prior_parent:
+        raise RuntimeError("Need to pass a prior parent and sex to warm start from.")
+
+    context = Context(model_version_id=args.model_version_id)
+    _SHARED.update(args=args, context=context, inputs=context.read_inputs(), tables=dict())
+
+    databases = list(it.product(args.parent_location_id, args.sex_id))
+    LOG.info(f"Building {len(databases)} databases for parents {args.parent_location_id} "
+             f"and sexes {args.sex_id}.")
+    if args.n_workers > 1 and len(databases) > 1:
+        with database_executor(pool=args.pool, n_workers=args.n_workers) as executor:
+            futures = [executor.submit(fill_and_run, location_id, sex_id) for location_id, sex_id in databases]
+            for future in futures:
+                LOG.info(f"Finished the database for location and sex {future.result()}.")
+    else:
+        for location_id, sex_id in databases:
+            fill_and_run(location_id, sex_id)
 
 
 if __name__ == '__main__':
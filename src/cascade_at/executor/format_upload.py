@@ -19,6 +19,14 @@ def get_args():
                         help="model version ID (need this from database entry)")
     parser.add_argument("-parent-location-id", type=int, required=True)
     parser.add_argument("-sex-id", type=int, required=True)
+    parser.add_argument("--chunk-size", type=int, required=False, default=None,
+                        help="number of avgint rows to summarize at a time, or all of them if not given")
+    parser.add_argument("--quantiles", type=float, nargs=2, required=False, default=[0.025, 0.975],
+                        help="quantiles of the draws for the lower and upper bounds")
+    parser.add_argument("--save-draws", action='store_true',
+                        help="whether to save the draws from predict sample as well as the summaries")
+    parser.add_argument("--compact", action='store_true',
+                        help="whether to read the predictions and draws in compact form, as float32")
     parser.add_argument("--loglevel", type=str, required=False, default='info')
 
     return parser.parse_args()
@@ -45,11 +53,16 @@ def main():
 
     LOG.info("Extracting results from DisMod SQLite Database.")
     dismod_file = context.db_file(location_id=args.parent_location_id, sex_id=args.sex_id, make=False)
-    da = DismodExtractor(path=dismod_file)
-    predictions = da.format_predictions_for_ihme()
+    da = DismodExtractor(path=dismod_file, compact=args.compact)
+    predictions = da.format_predictions_for_ihme(quantiles=args.quantiles, chunk_size=args.chunk_size)
 
     LOG.info("Saving the results.")
     rh = ResultsHandler(model_version_id=args.model_version_id)
     rh.save_draw_files(df=predictions, directory=context.draw_dir)
+    if args.save_draws:
+        rh.save_sample_draws(
+            chunks=da.format_draws_for_ihme(chunk_size=args.chunk_size),
+            directory=context.sample_draw_dir
+        )
     rh.upload_summaries(directory=context.draw_dir, conn_def=context.model_connection)
 
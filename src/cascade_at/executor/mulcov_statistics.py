@@ -1,10 +1,11 @@
 import logging
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 
 from cascade_at.context.model_context import Context
-from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.multi_db import AttachedDatabases, ATTACH_BATCH_SIZE
 from cascade_at.core.log import get_loggers, LEVELS
 
 
@@ -27,55 +28,192 @@ def get_args():
     parser.add_argument("--mean", action='store_true', required=False)
     parser.add_argument("--std", action='store_true', required=False)
     parser.add_argument("--quantile", required=False, nargs="+", type=float)
+    parser.add_argument("--n-workers", type=int, required=False, default=1,
+                        help="Number of batches of databases to read at the same time")
+    parser.add_argument("--attach-batch-size", type=int, required=False, default=ATTACH_BATCH_SIZE,
+                        help="Number of databases to attach to one connection")
     parser.add_argument("--loglevel", type=str, required=False, default='info')
     return parser.parse_args()
 
 
-def common_covariate_names(dbs):
-    return set.intersection(
-        *map(set, [d.covariate.c_covariate_name.tolist() for d in dbs])
-    )
+MULCOV_GROUP_COLUMNS = ['c_covariate_name', 'mulcov_type', 'rate_name', 'integrand_name']
+
+MULCOV_QUERY = """
+    SELECT covariate.c_covariate_name, mulcov.mulcov_type, rate.rate_name,
+        integrand.integrand_name, value.{val_col} AS mulcov_value
+    FROM {{db}}.{table} AS value
+    JOIN {{db}}.var AS var ON var.var_id = value.{id_col}
+    JOIN {{db}}.mulcov AS mulcov ON mulcov.mulcov_id = var.mulcov_id
+    JOIN {{db}}.covariate AS covariate ON covariate.covariate_id = mulcov.covariate_id
+    LEFT JOIN {{db}}.rate AS rate ON rate.rate_id = mulcov.rate_id
+    LEFT JOIN {{db}}.integrand AS integrand ON integrand.integrand_id = mulcov.integrand_id
+    WHERE covariate.c_covariate_name IN ({placeholders})
+"""
+
+
+def _value_columns(table):
+    if table == 'fit_var':
+        return 'fit_var_id', 'fit_var_value'
+    elif table == 'sample':
+        return 'var_id', 'var_value'
+    raise ValueError("Must pass tables fit_var or sample.")
+
+
+def attached_common_covariate_names(databases):
+    """
+    The covariate names that are in every one of the attached databases.
+
+    Args:
+        databases: cascade_at.dismod.api.multi_db.AttachedDatabases
+    """
+    names = databases.query("SELECT c_covariate_name FROM {db}.covariate", tables=['covariate'])
+    counts = names.groupby('c_covariate_name').size()
+    return set(counts.index[counts == len(databases)])
 
 
-def get_mulcovs(dbs, covs, table='fit_var'):
+def query_mulcov_values(databases, covs, table='fit_var', n_workers=1):
     """
-    Get mulcov values from all of the dbs, with all of the common covariates.
+    Read the mulcov values from all of the attached databases, joining the value
+    table to var, mulcov, covariate, rate and integrand inside sqlite.
+    Yields one data frame per batch of attached databases.
+
     Args:
-        dbs: list of cascade_at.dismod.api.dismod_io.DismodIO
+        databases: cascade_at.dismod.api.multi_db.AttachedDatabases
         covs: set of covariate names
         table: name of the table to pull from (can be fit_var or sample)
+        n_workers: number of batches to read at the same time
 
-    Returns:
+    Returns: generator of pd.DataFrame with the mulcov group columns and mulcov_value
+    """
+    id_col, val_col = _value_columns(table)
+    covs = sorted(covs)
+    if not covs:
+        return
+    template = MULCOV_QUERY.format(
+        table=table, id_col=id_col, val_col=val_col, placeholders=", ".join("?" for _ in covs)
+    )
+    tables = [table, 'var', 'mulcov', 'covariate', 'rate', 'integrand']
+    batches = [AttachedDatabases(paths=paths, batch_size=databases.batch_size) for paths, _ in databases.batches()]
+    for df in _map_databases(
+            lambda batch: batch.query(template=template, params=covs, tables=tables,
+                                      dtypes={'mulcov_value': float}),
+            batches, n_workers):
+        yield df[MULCOV_GROUP_COLUMNS + ['mulcov_value']]
 
+
+def _map_databases(function, dbs, n_workers):
     """
-    if table == 'fit_var':
-        id_col = 'fit_var_id'
-        val_col = 'fit_var_value'
-    elif table == 'sample':
-        id_col = 'var_id'
-        val_col = 'var_value'
+    Calls function on each batch of databases, in threads if there is more than
+    one worker. Yields the results as they finish.
+    """
+    if n_workers > 1:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(function, db) for db in dbs]
+            for future in as_completed(futures):
+                yield future.result()
     else:
-        raise ValueError("Must pass tables fit_var or sample.")
-
-    dfs = pd.DataFrame()
-    for db in dbs:
-        mulcov = db.covariate[db.covariate.c_covariate_name.isin(covs)].merge(db.mulcov)
-        try:
-            df = db.var.merge(getattr(db, table), left_on='var_id', right_on=id_col)
-            df = df.fillna(np.nan)
-
-            df = df.merge(db.integrand, on='integrand_id', how='left')
-            df = df.merge(db.rate, on='rate_id', how='left')
-            df = mulcov.merge(df)
-            df.rename(columns={val_col: 'mulcov_value'}, inplace=True)
-            df = df[[
-                'c_covariate_name', 'mulcov_type', 'rate_name',
-                'integrand_name', 'mulcov_value'
-            ]]
-        except AttributeError:
-            df = pd.DataFrame()
-        dfs = dfs.append(df)
-    return dfs
+        for db in dbs:
+            yield function(db)
+
+
+class MulcovStatistics:
+    def __init__(self):
+        """
+        Accumulates mulcov values one data frame at a time (e.g. one per database)
+        so that statistics can be computed in one pass at the end. Means and standard
+        deviations come from running moments that are merged across data frames,
+        and quantiles are exact, from one sort of all of the values.
+
+        Groups are in the order they are first seen.
+        """
+        self.groups = dict()
+        self.count = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.n_rows = 0
+        self._codes = list()
+        self._values = list()
+
+    def add(self, df):
+        """
+        Adds the mulcov values from a data frame with the mulcov group columns
+        and mulcov_value.
+        """
+        if df.empty:
+            return self
+        keys = df[MULCOV_GROUP_COLUMNS].fillna('none').itertuples(index=False, name=None)
+        codes = np.array([self.groups.setdefault(k, len(self.groups)) for k in keys], dtype=np.int64)
+        values = df.mulcov_value.values.astype(np.float64)
+        n_groups = len(self.groups)
+
+        count = np.bincount(codes, minlength=n_groups).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.bincount(codes, weights=values, minlength=n_groups) / count
+        m2 = np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=n_groups)
+
+        # Chan et al. combination of the moments so far with the moments of this frame
+        previous = n_groups - len(self.count)
+        old_count = np.concatenate([self.count, np.zeros(previous)])
+        old_mean = np.concatenate([self.mean, np.zeros(previous)])
+        old_m2 = np.concatenate([self.m2, np.zeros(previous)])
+        total = old_count + count
+        delta = mean - old_mean
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.mean = np.where(count > 0, old_mean + delta * count / total, old_mean)
+            self.m2 = np.where(count > 0, old_m2 + m2 + delta ** 2 * old_count * count / total, old_m2)
+        self.count = total
+
+        self.n_rows += len(df)
+        self._codes.append(codes)
+        self._values.append(values)
+        return self
+
+    def _group_frame(self, values, stat):
+        ds = pd.DataFrame.from_records(list(self.groups.keys()), columns=MULCOV_GROUP_COLUMNS)
+        ds['mulcov_value'] = values
+        ds['stat'] = stat
+        return ds
+
+    def quantiles(self, quantile):
+        """
+        Exact quantiles of each group, with linear interpolation.
+        """
+        codes = np.concatenate(self._codes)
+        values = np.concatenate(self._values)
+        order = np.lexsort((values, codes))
+        values = values[order]
+        starts = np.concatenate([[0], np.cumsum(self.count)[:-1]]).astype(np.int64)
+        result = list()
+        for q in quantile:
+            position = (self.count - 1) * q
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            low_values = values[starts + lower]
+            high_values = values[starts + upper]
+            result.append(low_values + (high_values - low_values) * (position - lower))
+        return result
+
+    def to_frame(self, mean=True, std=True, quantile=None):
+        """
+        Statistics for each group as a data frame, with one row
+        per group and statistic.
+        """
+        stats = list()
+        if not self.groups:
+            return pd.DataFrame()
+        if mean:
+            stats.append(self._group_frame(self.mean, 'mean'))
+        if std:
+            degrees_of_freedom = int(len(self.groups) > self.n_rows)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = np.sqrt(self.m2 / (self.count - degrees_of_freedom))
+            stats.append(self._group_frame(values, 'std'))
+        if quantile is not None:
+            for q, values in zip(quantile, self.quantiles(quantile)):
+                stats.append(self._group_frame(values, f'quantile_{q}'))
+        if not stats:
+            return pd.DataFrame()
+        return pd.concat(stats)
 
 
 def compute_statistics(df, mean=True, std=True, quantile=None):
@@ -90,25 +228,7 @@ def compute_statistics(df, mean=True, std=True, quantile=None):
     Returns: dictionary with requested statistics
 
     """
-    stats_df = pd.DataFrame()
-    group_cols = ['c_covariate_name', 'mulcov_type', 'rate_name', 'integrand_name']
-    df_groups = df.fillna('none').copy().groupby(group_cols, sort=False)
-
-    if mean:
-        ds = df_groups.mean().reset_index()
-        ds['stat'] = 'mean'
-        stats_df = stats_df.append(ds)
-    if std:
-        degrees_of_freedom = int(df_groups.ngroups > len(df))
-        ds = df_groups.std(ddof=degrees_of_freedom).reset_index()
-        ds['stat'] = 'std'
-        stats_df = stats_df.append(ds)
-    if quantile is not None:
-        for q in quantile:
-            ds = df_groups.quantile(q=q).reset_index()
-            ds['stat'] = f'quantile_{q}'
-            stats_df = stats_df.append(ds)
-    return stats_df
+    return MulcovStatistics().add(df).to_frame(mean=mean, std=std, quantile=quantile)
 
 
 def main():
@@ -121,11 +241,14 @@ def main():
     logging.basicConfig(level=LEVELS[args.loglevel])
 
     context = Context(model_version_id=args.model_version_id)
-    db_files = [DismodIO(context.db_file(location_id=loc, sex_id=sex))
-                for loc in args.locations for sex in args.sexes]
-    LOG.info(f"There are {len(db_files)} databases that will be aggregated.")
+    databases = AttachedDatabases(
+        paths=[context.db_file(location_id=loc, sex_id=sex, make=False)
+               for loc in args.locations for sex in args.sexes],
+        batch_size=args.attach_batch_size
+    )
+    LOG.info(f"There are {len(databases)} databases that will be aggregated.")
 
-    common_covariates = common_covariate_names(db_files)
+    common_covariates = attached_common_covariate_names(databases)
     LOG.info(f"The common covariates in the passed databases are {common_covariates}.")
 
     if args.sample:
@@ -134,13 +257,12 @@ def main():
         table_name = 'fit_var'
 
     LOG.info(f"Will pull from the {table_name} table from each database.")
-    mulcov_estimates = get_mulcovs(
-        dbs=db_files, covs=common_covariates, table=args.sample
-    )
-    mulcov_statistics = compute_statistics(
-        df=mulcov_estimates, mean=args.mean, std=args.std, quantile=args.quantile
-    )
-    LOG.info()
+    statistics = MulcovStatistics()
+    for df in query_mulcov_values(databases=databases, covs=common_covariates,
+                                  table=table_name, n_workers=args.n_workers):
+        statistics.add(df)
+    mulcov_statistics = statistics.to_frame(mean=args.mean, std=args.std, quantile=args.quantile)
+    LOG.info(f"Writing mulcov statistics to {args.outfile_name}.csv.")
     mulcov_statistics.to_csv(context.outputs_dir / f'{args.outfile_name}.csv', index=False)
 
 
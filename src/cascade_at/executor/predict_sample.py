@@ -2,11 +2,13 @@ import logging
 from argparse import ArgumentParser
 
 from cascade_at.context.model_context import Context
-from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.dismod_extractor import DismodExtractor
 from cascade_at.dismod.api.fill_extract_helpers.data_tables import prep_data_avgint
 from cascade_at.dismod.api.fill_extract_helpers.posterior_to_prior import get_prior_avgint_grid
 from cascade_at.core.log import get_loggers, LEVELS
 from cascade_at.dismod.api.run_dismod import run_dismod_commands
+from cascade_at.executor.dismod_db import rate_grids
+from cascade_at.saver.draw_cache import DrawCache
 
 
 LOG = get_loggers(__name__)
@@ -30,17 +32,33 @@ def main():
     context = Context(model_version_id=args.model_version_id)
     inputs, alchemy, settings = context.read_inputs()
 
-    sourceDB = DismodIO(path=context.db_file(
+    sourceDB = DismodExtractor(path=context.db_file(
         location_id=args.source_location, sex_id=args.source_sex, make=False
     ))
 
     rates = [r.rate for r in settings.rate]
+    grids = rate_grids(alchemy)
+    cache = DrawCache(directory=sourceDB.path.parent, source=sourceDB.path)
+    draws = sourceDB.gather_all_draws_from_sample(
+        location_ids=args.target_locations, rates=rates, grids=grids, dage=False, dtime=False
+    )
+    if draws is not None:
+        LOG.info("The prior draws for the targets came straight from the sample table, "
+                 "so predict sample is not needed.")
+        # The draws from the sample table don't depend on sex.
+        cache.write({
+            (location_id, sex_id): draws[location_id]
+            for location_id in args.target_locations for sex_id in args.target_sexes
+        })
+        return
+
     posterior_grid = get_prior_avgint_grid(
         settings=settings,
         integrands=rates,
         sexes=args.target_sexes,
         locations=args.target_locations,
-        midpoint=False
+        midpoint=False,
+        alchemy=alchemy
     )
     posterior_grid = inputs.add_covariates_to_data(df=posterior_grid)
     posterior_grid = prep_data_avgint(
@@ -51,9 +69,10 @@ def main():
     posterior_grid.rename(columns={'sex_id': 'c_sex_id'}, inplace=True)
     sourceDB.avgint = posterior_grid
     run_dismod_commands(
-        dm_file=sourceDB,
+        dm_file=sourceDB.path.absolute(),
         commands=['predict sample']
     )
+    cache.write(sourceDB.gather_all_draws_for_prior_grid(rates=rates, dage=False, dtime=False))
 
 
 if __name__ == '__main__':
@@ -1,13 +1,16 @@
 import logging
-import subprocess
 from argparse import ArgumentParser
 
 from cascade_at.core.log import get_loggers, LEVELS
 from cascade_at.cascade.cascade_commands import CASCADE_COMMANDS
+from cascade_at.cascade.completion import CompletionManifest, MANIFEST_FILE, input_hash, is_complete
 from cascade_at.settings.settings import settings_from_model_version_id
 from cascade_at.context.model_context import Context
 from cascade_at.inputs.locations import LocationDAG
-from cascade_at.jobmon.workflow import jobmon_workflow_from_cascade_command
+from cascade_at.jobmon.resources import (
+    METRICS_FILE, ResourceEstimator, assign_resources, critical_path_order,
+    measure_command, read_task_metrics, record_task_metrics
+)
 
 LOG = get_loggers(__name__)
 
@@ -24,10 +27,56 @@ def get_args():
                              "run as a sequence of command line tasks")
     parser.add_argument("--make", action='store_true',
                         help="whether or not to make the file structure for cascade")
+    parser.add_argument("--resume", action='store_true',
+                        help="without jobmon, skip the commands that finished before "
+                             "and whose outputs are still good")
     parser.add_argument("--loglevel", type=str, required=False, default="info")
     return parser.parse_args()
 
 
+def run_commands(cascade_command, context, resume=False, priorities=None):
+    """
+    Runs the commands of a cascade command in sequence, without jobmon.
+    Each command that finishes is recorded in the completion manifest
+    in the model directory, and its runtime and memory are recorded in
+    the metrics log in the log directory. When resuming, a command is skipped
+    if it is complete and none of its upstream commands ran again.
+
+    :param cascade_command: (cascade_at.cascade.cascade_commands.CascadeCommand)
+    :param context: (cascade_at.context.model_context.Context)
+    :param resume: (bool) skip the commands that are complete
+    :param priorities: (Dict[str, int]) critical path priorities from assign_resources,
+        to run the commands on the critical path first
+    :return: (List[str]) the commands that ran
+    """
+    manifest = CompletionManifest(context.model_dir / MANIFEST_FILE)
+    if priorities is None:
+        commands = list(cascade_command.task_dict.keys())
+    else:
+        commands = critical_path_order(cascade_command.task_dict, priorities)
+    ran = list()
+    for c in commands:
+        operation = cascade_command.task_dict[c]
+        upstream_ran = any(u in ran for u in operation.upstream_commands)
+        if resume and not upstream_ran and is_complete(operation, context, manifest):
+            LOG.info(f"Skipping {c} because it is complete.")
+            continue
+        LOG.info(f"Running {c}.")
+        measurement = measure_command(c)
+        features = dict(operation.features)
+        features.setdefault('n_data', context.read_inputs_summary().get('n_data'))
+        record_task_metrics(
+            path=context.log_dir / METRICS_FILE, operation=operation,
+            measurement=measurement, features={k: v for k, v in features.items() if v is not None}
+        )
+        if measurement['returncode']:
+            raise RuntimeError(f"Command {c} failed with error"
+                               f"{measurement['stderr']}")
+        manifest.record(c, input_hash(c, operation.inputs(context)))
+        ran.append(c)
+    return ran
+
+
 def main():
     args = get_args()
     logging.basicConfig(level=LEVELS[args.loglevel])
@@ -56,24 +105,34 @@ def main():
     else:
         raise NotImplementedError(f"The drill/cascade setting {settings.model.drill} is not implemented.")
 
+    estimator = ResourceEstimator(history=read_task_metrics(context.log_dir.parent.glob(f'*/{METRICS_FILE}')))
+    location_dag = LocationDAG(
+        location_set_version_id=settings.location_set_version_id,
+        gbd_round_id=settings.gbd_round_id
+    )
+    priorities = assign_resources(
+        cascade_command=cascade_command, estimator=estimator,
+        settings=settings, location_dag=location_dag,
+        n_data=context.read_inputs_summary().get('n_data')
+    )
+
     if args.jobmon:
         LOG.info("Configuring jobmon.")
-        wf = jobmon_workflow_from_cascade_command(cc=cascade_command, context=context)
+        # Jobmon is imported here so that running without it doesn't need it.
+        from cascade_at.jobmon.workflow import jobmon_workflow_from_cascade_command
+        wf = jobmon_workflow_from_cascade_command(cc=cascade_command, context=context, priorities=priorities)
         error = wf.run()
         if error:
             context.update_status(status='Failed')
             raise RuntimeError("Jobmon workflow failed.")
     else:
         LOG.info("Running without jobmon.")
-        for c in cascade_command.get_commands():
-            LOG.info(f"Running {c}.")
-            process = subprocess.run(
-                c, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-            if process.returncode:
-                context.update_status(status='Failed')
-                raise RuntimeError(f"Command {c} failed with error"
-                                   f"{process.stderr.decode()}")
+        try:
+            run_commands(cascade_command=cascade_command, context=context,
+                         resume=args.resume, priorities=priorities)
+        except RuntimeError:
+            context.update_status(status='Failed')
+            raise
     
     context.update_status(status='Complete')
 
@@ -0,0 +1,201 @@
+"""
+A benchmark of the startup time of the console scripts.
+
+Each script is imported in a new interpreter with ``python -X importtime``,
+which writes the time to import each module to stderr. The benchmark
+reports the total time to import each script, the slowest modules under it,
+and any of the modules that should be imported lazily that were imported anyway.
+Its results can be written to a JSON file and compared with an earlier run to
+track startup time as the code changes::
+
+    python -m cascade_at.executor.utils.startup --output startup.json
+    python -m cascade_at.executor.utils.startup --baseline startup.json
+"""
+import json
+import logging
+import re
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+import pandas as pd
+
+from cascade_at.core.log import get_loggers, LEVELS
+
+LOG = get_loggers(__name__)
+
+ENTRY_POINTS = {
+    'configure_inputs': 'cascade_at.executor.configure_inputs',
+    'dismod_db': 'cascade_at.executor.dismod_db',
+    'sample_simulate': 'cascade_at.executor.sample_simulate',
+    'format_upload': 'cascade_at.executor.format_upload',
+    'cleanup': 'cascade_at.executor.cleanup',
+    'run_cascade': 'cascade_at.executor.run',
+    'run_dmdismod': 'cascade_at.executor.run_dmdismod'
+}
+"""The modules of the console scripts in setup.py, by the name of the script."""
+
+LAZY_MODULES = ['scipy.stats', 'scipy.interpolate', 'scipy.special', 'networkx', 'dill', 'pkg_resources']
+"""Modules that the scripts import when they are used, rather than at startup."""
+
+_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$')
+
+
+def parse_importtime(stderr):
+    """
+    Reads the output of ``python -X importtime``.
+
+    Args:
+        stderr: (str) the output
+
+    Returns:
+        (pd.DataFrame) with the module, the depth at which it was imported,
+        and its own and cumulative import times in seconds, in the order they were printed
+    """
+    rows = list()
+    for line in stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append({
+                'module': module,
+                'depth': len(indent) // 2,
+                'self_seconds': int(self_us) / 1e6,
+                'cumulative_seconds': int(cumulative_us) / 1e6
+            })
+    return pd.DataFrame(rows, columns=['module', 'depth', 'self_seconds', 'cumulative_seconds'])
+
+
+def measure_import(module, repeats=3, python=sys.executable):
+    """
+    Imports a module in new interpreters and times it.
+
+    Args:
+        module: (str) name of the module
+        repeats: (int) number of interpreters to start; the fastest is kept,
+            because the slower ones are slow from other things on the machine
+        python: (str) the interpreter
+
+    Returns:
+        (float, pd.DataFrame) seconds to import the module, and the import
+        times of every module from the fastest run
+    """
+    fastest = None
+    for _ in range(repeats):
+        process = subprocess.run(
+            [python, '-X', 'importtime', '-c', f'import {module}'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+        )
+        if process.returncode:
+            raise RuntimeError(f"Could not import {module}: {process.stderr.strip().splitlines()[-1]}")
+        times = parse_importtime(process.stderr)
+        total = times.loc[times.module == module, 'cumulative_seconds'].iloc[-1]
+        if fastest is None or total < fastest[0]:
+            fastest = (total, times)
+    return fastest
+
+
+def startup_report(entry_points=None, repeats=3, top=5):
+    """
+    Times the startup of the console scripts.
+
+    Args:
+        entry_points: (Dict[str, str]) modules of the scripts, by name; default ENTRY_POINTS
+        repeats: (int) number of times to import each script
+        top: (int) number of the slowest modules to report for each script
+
+    Returns:
+        (Dict[str, Dict]) for each script, its total seconds to import, the
+        slowest modules by their own time, and the lazy modules that it imported,
+        or the error if it couldn't be imported
+    """
+    if entry_points is None:
+        entry_points = ENTRY_POINTS
+    report = dict()
+    for name, module in entry_points.items():
+        try:
+            total, times = measure_import(module, repeats=repeats)
+        except RuntimeError as error:
+            LOG.warning(f"Skipping {name}. {error}")
+            report[name] = {'error': str(error)}
+            continue
+        slowest = times.sort_values('self_seconds', ascending=False).head(top)
+        report[name] = {
+            'seconds': total,
+            'slowest': dict(zip(slowest.module, slowest.self_seconds)),
+            'lazy_imported': [m for m in LAZY_MODULES if m in set(times.module)]
+        }
+    return report
+
+
+def compare_reports(report, baseline, tolerance=0.2):
+    """
+    Finds the scripts that start more slowly than they did in a baseline report.
+
+    Args:
+        report: (Dict) from startup_report
+        baseline: (Dict) from an earlier startup_report
+        tolerance: (float) fraction slower that is still counted as the same
+
+    Returns:
+        (Dict[str, Tuple[float, float]]) the baseline and current seconds of the slower scripts
+    """
+    slower = dict()
+    for name, result in report.items():
+        before = baseline.get(name, dict()).get('seconds')
+        if before is None or 'seconds' not in result:
+            continue
+        if result['seconds'] > before * (1 + tolerance):
+            slower[name] = (before, result['seconds'])
+    return slower
+
+
+def get_args():
+    parser = ArgumentParser()
+    parser.add_argument("--scripts", type=str, nargs='+', required=False, default=list(ENTRY_POINTS),
+                        help="names of the console scripts to time")
+    parser.add_argument("--repeats", type=int, required=False, default=3,
+                        help="number of times to import each script, keeping the fastest")
+    parser.add_argument("--output", type=str, required=False,
+                        help="JSON file to write the report to")
+    parser.add_argument("--baseline", type=str, required=False,
+                        help="JSON file of an earlier report to compare with")
+    parser.add_argument("--tolerance", type=float, required=False, default=0.2,
+                        help="fraction slower than the baseline that isn't reported")
+    parser.add_argument("--loglevel", type=str, required=False, default='info')
+    return parser.parse_args()
+
+
+def main():
+    """
+    Times the startup of the console scripts and reports the ones
+    that import lazy modules or are slower than the baseline.
+    """
+    args = get_args()
+    logging.basicConfig(level=LEVELS[args.loglevel])
+
+    report = startup_report(
+        entry_points={name: ENTRY_POINTS[name] for name in args.scripts},
+        repeats=args.repeats
+    )
+    for name, result in report.items():
+        if 'seconds' not in result:
+            continue
+        LOG.info(f"{name} starts in {result['seconds'] * 1000:.0f} ms.")
+        if result['lazy_imported']:
+            LOG.warning(f"{name} imports {', '.join(result['lazy_imported'])} at startup.")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = compare_reports(report, baseline, tolerance=args.tolerance)
+        for name, (before, after) in slower.items():
+            LOG.warning(f"{name} starts in {after * 1000:.0f} ms, up from {before * 1000:.0f} ms.")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
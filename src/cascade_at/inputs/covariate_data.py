@@ -1,8 +1,10 @@
+import numpy as np
 import pandas as pd
 
 from cascade_at.core.db import db_queries
 from cascade_at.core.log import get_loggers
 from cascade_at.inputs.base_input import BaseInput
+from cascade_at.inputs.utilities.gbd_ids import CascadeConstants
 
 LOG = get_loggers(__name__)
 
@@ -43,86 +45,160 @@ class CovariateData(BaseInput):
         )
         return self
 
-    def configure_for_dismod(self, pop_df, loc_df):
+    def configure_for_dismod(self, pop_df, location_dag):
         """
         Configures covariates for DisMod.
+
+        Covariates that are not age-specific are completed over sexes and
+        locations with a single age group, and only copied to all of the
+        demographic age groups at the end. Covariates given for males and females
+        need the age groups first to population-weight the both-sex values.
+
+        :param pop_df: (pd.DataFrame) population for all demographics
+        :param location_dag: (cascade_at.inputs.locations.LocationDAG)
         :return: self
         """
         df = self.raw[[
             'location_id', 'year_id', 'age_group_id', 'sex_id', 'mean_value'
         ]]
-        df = self.complete_covariate_ages(cov_df=df)
+        if set(df.sex_id) == {1, 2}:
+            df = self.complete_covariate_ages(cov_df=df)
         df = self.complete_covariate_sex(cov_df=df, pop_df=pop_df)
-        df = self.complete_covariate_locations(cov_df=df, pop_df=pop_df, loc_df=loc_df,
+        df = self.complete_covariate_locations(cov_df=df, pop_df=pop_df, location_dag=location_dag,
                                                locations=self.demographics.location_id)
+        df = self.complete_covariate_ages(cov_df=df)
         df = self.convert_to_age_lower_upper(df)
         return df
-    
+
     def complete_covariate_ages(self, cov_df):
         """
-        Adds on covariate ages for all age group IDs.
+        Adds on covariate ages for all age group IDs. Rows that
+        are not age-specific are repeated for every demographic age group,
+        and age-specific rows are kept as they are.
         """
-        if (22 in cov_df.age_group_id.tolist()) or (27 in cov_df.age_group_id.tolist()):
-            covs = pd.DataFrame()
-            for age in self.demographics.age_group_id:
-                df = cov_df.copy()
-                df['age_group_id'] = age
-                covs = covs.append(df)
-        else:
-            covs = cov_df.copy()
-        return covs
+        not_age_specific = cov_df.age_group_id.isin(CascadeConstants.NON_AGE_SPECIFIC_ID).values
+        if not not_age_specific.any():
+            return cov_df.copy()
+        ages = np.asarray(self.demographics.age_group_id)
+        rows = np.flatnonzero(not_age_specific)
+        covs = pd.DataFrame({
+            c: np.tile(cov_df[c].values[rows], len(ages)) for c in cov_df.columns
+        })
+        covs['age_group_id'] = np.repeat(ages, len(rows))
+        return pd.concat([covs, cov_df.loc[~not_age_specific]], ignore_index=True, sort=False)
 
     @staticmethod
-    def complete_covariate_locations(cov_df, pop_df, loc_df, locations):
+    def complete_covariate_locations(cov_df, pop_df, location_dag, locations):
         """
         Completes the covariate locations that aren't in the database as a population-weighted average.
+        Every level of the location hierarchy that has no covariate values at all is filled in
+        from the level below it, from the bottom of the tree up.
+
+        The aggregation is done on dense (location, age, sex, year) arrays over the locations
+        and their parents, with np.add.at over the parent index of each location. If the covariate
+        is not age-specific, its values are broadcast over the population age groups rather
+        than copied, so the values filled in for the parents are age-specific.
+
         :param cov_df: (pd.DataFrame)
         :param pop_df: (pd.DataFrame)
-        :param loc_df: (pd.DataFrame)
+        :param location_dag: (cascade_at.inputs.locations.LocationDAG)
         :param locations: (list)
         :return:
         """
-        parent_pop = pop_df[['location_id', 'age_group_id', 'sex_id', 'year_id', 'population']].copy()
-        parent_pop.rename(columns={'location_id': 'parent_id', 'population': 'parent_population'}, inplace=True)
-
-        loc_subset_df = loc_df.loc[loc_df.location_id.isin(locations)]
-        all_levels = loc_subset_df.level.unique().tolist()
-        cov_locations = cov_df.location_id.unique().tolist()
-        cov_levels = loc_subset_df.loc[loc_subset_df.location_id.isin(cov_locations)].level.unique().tolist()
-        missing_levels = [x for x in all_levels if x not in cov_levels]
-
-        df = cov_df.copy()
+        subset = location_dag.index_of(locations)
+        subset = subset[subset >= 0]
+        subset_levels = location_dag.level[subset]
+
+        has_covariate = np.zeros(len(location_dag), dtype=bool)
+        cov_index = location_dag.index_of(cov_df.location_id.unique())
+        has_covariate[cov_index[cov_index >= 0]] = True
+        cov_levels = set(subset_levels[has_covariate[subset]].tolist())
+        missing_levels = sorted(set(subset_levels.tolist()) - cov_levels, reverse=True)
+        if not missing_levels:
+            return cov_df.copy()
+
+        # Dense positions for the locations and their parents
+        nodes = np.unique(np.concatenate([subset, location_dag.parent_index[subset]]))
+        nodes = nodes[nodes >= 0]
+        node_position = np.full(len(location_dag), -1, dtype=np.int64)
+        node_position[nodes] = np.arange(len(nodes))
+
+        def location_codes(location_ids):
+            index = location_dag.index_of(location_ids)
+            return np.where(index >= 0, node_position[index], -1)
+
+        ages = np.unique(pop_df.age_group_id.values)
+        sexes = np.unique(pop_df.sex_id.values)
+        years = np.unique(pop_df.year_id.values)
+        shape = (len(nodes), len(ages), len(sexes), len(years))
+
+        population = np.full(shape, np.nan)
+        codes = (
+            location_codes(pop_df.location_id.values),
+            _axis_codes(pop_df.age_group_id.values, ages),
+            _axis_codes(pop_df.sex_id.values, sexes),
+            _axis_codes(pop_df.year_id.values, years)
+        )
+        valid = np.logical_and.reduce([c >= 0 for c in codes])
+        population[tuple(c[valid] for c in codes)] = pop_df.population.values[valid]
+
+        age_specific = not cov_df.age_group_id.isin(CascadeConstants.NON_AGE_SPECIFIC_ID).all()
+        values = np.full((len(nodes), len(ages) if age_specific else 1, len(sexes), len(years)), np.nan)
+        codes = (
+            location_codes(cov_df.location_id.values),
+            _axis_codes(cov_df.age_group_id.values, ages) if age_specific else np.zeros(len(cov_df), dtype=np.int64),
+            _axis_codes(cov_df.sex_id.values, sexes),
+            _axis_codes(cov_df.year_id.values, years)
+        )
+        valid = np.logical_and.reduce([c >= 0 for c in codes])
+        values[tuple(c[valid] for c in codes)] = cov_df.mean_value.values[valid]
 
-        for level in sorted(missing_levels, reverse=True):
+        filled = dict()
+        new_rows = list()
+        for level in missing_levels:
             LOG.info(f"Filling in covariate values at location hierarchy level {level}.")
             # Get one location below this level
-            ldf = loc_subset_df.loc[loc_subset_df.level == level + 1].copy()
-
-            # Merge on the population just for these locations (left) --
-            # builds out the full age-sex-year data frame for populations
-            lp = ldf.merge(pop_df, on=['location_id'], how='left')
-
-            # Merge on the covariate data just for these location-populations
-            clp = lp.merge(df, on=['location_id', 'age_group_id', 'sex_id', 'year_id'], how='left')
-
-            # Get the parent population based on parent ID
-            dp = clp.merge(parent_pop, on=['parent_id', 'age_group_id', 'sex_id', 'year_id'], how='left')
-            dp.drop('location_id', inplace=True, axis=1)
-            
-            # Calculate the weighted value for each row
-            dp['cov_weighted'] = dp.mean_value * dp.population / dp.parent_population
-
-            # Group by parent ID and other demographics, over location IDs, summing
-            # to get the final weighted covariate value
-            dp = dp.groupby([
-                'parent_id', 'year_id', 'age_group_id', 'sex_id'
-            ])['cov_weighted'].sum().reset_index()
-
-            # Set the new parent ID as location ID so that it can be used one level up the tree
-            dp.rename(columns={'parent_id': 'location_id', 'cov_weighted': 'mean_value'}, inplace=True)
-            df = df.append(dp)
-
-        return df
+            children = subset[subset_levels == level + 1]
+            if not len(children):
+                continue
+            child_codes = node_position[children]
+            parent_codes = node_position[location_dag.parent_index[children]]
+
+            # If the level below was also missing, its values were filled in the last pass
+            if level + 1 in filled:
+                filled_codes, filled_values = filled[level + 1]
+                position = np.full(len(nodes), -1, dtype=np.int64)
+                position[filled_codes] = np.arange(len(filled_codes))
+                child_values = np.where(
+                    (position[child_codes] >= 0)[:, None, None, None],
+                    filled_values[position[child_codes]],
+                    np.nan
+                )
+            else:
+                child_values = values[child_codes]
+
+            # Sum the population-weighted values over the children of each parent
+            child_population = population[child_codes]
+            parents, parent_index = np.unique(parent_codes, return_inverse=True)
+            weighted = np.zeros((len(parents),) + shape[1:])
+            np.add.at(weighted, parent_index, np.nan_to_num(child_values * child_population))
+            has_population = np.zeros((len(parents),) + shape[1:], dtype=bool)
+            np.logical_or.at(has_population, parent_index, ~np.isnan(child_population))
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                parent_values = weighted / population[parents]
+            filled[level] = (parents, parent_values)
+
+            p, a, s, y = np.nonzero(has_population)
+            new_rows.append(pd.DataFrame({
+                'location_id': location_dag.location_ids[nodes[parents[p]]],
+                'year_id': years[y],
+                'age_group_id': ages[a],
+                'sex_id': sexes[s],
+                'mean_value': parent_values[p, a, s, y]
+            }))
+
+        return pd.concat([cov_df] + new_rows, ignore_index=True, sort=False)
 
     @staticmethod
     def complete_covariate_sex(cov_df, pop_df):
@@ -156,3 +232,13 @@ class CovariateData(BaseInput):
         else:
             raise RuntimeError(f"Unknown covariate sex IDs {set(cov_df.sex_id)}.")
         return result_df
+
+
+def _axis_codes(values, axis):
+    """
+    Positions of values in a sorted array of unique axis values,
+    with -1 for values that are not on the axis.
+    """
+    codes = np.searchsorted(axis, values)
+    codes[codes == len(axis)] = 0
+    return np.where(axis[codes] == values, codes, -1)
@@ -1,48 +1,243 @@
-import networkx as nx
+import heapq
+
 import numpy as np
 import pandas as pd
 
 from cascade_at.inputs.utilities.gbd_ids import CascadeConstants
 from cascade_at.core.db import db_queries
+from cascade_at.core.lazy import LazyModule
 from cascade_at.core.log import get_loggers
 
 LOG = get_loggers(__name__)
 
+nx = LazyModule("networkx")
+
 
 class LocationDAG:
-    def __init__(self, location_set_version_id, gbd_round_id):
+    def __init__(self, location_set_version_id=None, gbd_round_id=None, df=None,
+                 root=CascadeConstants.GLOBAL_LOCATION_ID):
         """
-        Create a location DAG from the GBD location hierarchy, using
-        networkx graph where each node is the location ID, and its properties
-        are all properties from db_queries.
+        Create a location DAG from the GBD location hierarchy.
+
+        The hierarchy is stored as flat numpy arrays indexed by the position
+        of each location in the metadata data frame: a parent index,
+        the children in compressed sparse row form, the depth of each location,
+        and a preorder (Euler tour) numbering, so that children, descendants and
+        subtree membership are array lookups. A networkx graph where each node
+        is the location ID, and its properties are all properties from db_queries,
+        is only built if it is asked for through the ``dag`` attribute.
 
         The root of this dag is the global location ID.
+
+        Parameters:
+            location_set_version_id: (int)
+            gbd_round_id: (int)
+            df: (pd.DataFrame) optional location metadata with at least the columns
+                location_id, parent_id and location_name. If passed, nothing is
+                pulled from the databases.
+            root: (int) location ID of the root of the hierarchy
         """
-        LOG.info(f"Creating a location DAG for location_set_version_id {location_set_version_id}")
         self.location_set_version_id = location_set_version_id
+        self.root = root
+
+        if df is None:
+            LOG.info(f"Creating a location DAG for location_set_version_id {location_set_version_id}")
+            df = db_queries.get_location_metadata(
+                location_set_version_id=location_set_version_id,
+                location_set_id=CascadeConstants.ESTIMATION_LOCATION_HIERARCHY_ID,
+                gbd_round_id=gbd_round_id
+            )
+        self.df = df
+        self._dag = None
+        self._build_indexes()
+
+    def _build_indexes(self):
+        """
+        Builds the parent, children, depth and preorder arrays from the metadata.
+        """
+        self.location_ids = self.df.location_id.values.astype(np.int64)
+        n_locations = len(self.location_ids)
+        self._build_lookup()
 
-        self.df = db_queries.get_location_metadata(
-            location_set_version_id=location_set_version_id,
-            location_set_id=CascadeConstants.ESTIMATION_LOCATION_HIERARCHY_ID,
-            gbd_round_id=gbd_round_id
-        )
-
-        self.dag = nx.DiGraph()
-        for index, row in self.df.iterrows():
-            self.dag.add_node(int(row['location_id']), **row.to_dict())
-        self.dag.add_edges_from([
-            (int(row.parent_id), int(row.location_id))
-            for row in self.df.loc[self.df.location_id != CascadeConstants.GLOBAL_LOCATION_ID].itertuples()
-        ])
-        self.dag.graph["root"] = CascadeConstants.GLOBAL_LOCATION_ID
+        if self.root not in self:
+            raise ValueError(f"The root location {self.root} is not in the location hierarchy.")
+
+        is_root = self.location_ids == self.root
+        parent_ids = self.df.parent_id.values.astype(np.int64)
+        self.parent_index = np.where(is_root, -1, self.index_of(parent_ids))
+        if (self.parent_index[~is_root] < 0).any():
+            missing = parent_ids[~is_root & (self.parent_index < 0)]
+            raise ValueError(f"Parent locations {sorted(set(missing))} are not in the location hierarchy.")
+
+        # Children in compressed sparse row form. The stable sort keeps
+        # siblings in the order they have in the metadata.
+        child_rows = np.argsort(self.parent_index, kind='stable')
+        child_rows = child_rows[self.parent_index[child_rows] >= 0]
+        counts = np.bincount(self.parent_index[~is_root], minlength=n_locations)
+        self.child_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.child_index = child_rows.astype(np.int64)
+
+        # Preorder traversal from the root. The subtree of a location is the
+        # contiguous range [tin, tout) in this order.
+        self.level = np.full(n_locations, -1, dtype=np.int64)
+        self.tin = np.full(n_locations, -1, dtype=np.int64)
+        root_index = self._index(self.root)
+        self.level[root_index] = 0
+        preorder = list()
+        stack = [root_index]
+        while stack:
+            index = stack.pop()
+            self.tin[index] = len(preorder)
+            preorder.append(index)
+            children = self.child_index[self.child_offsets[index]:self.child_offsets[index + 1]]
+            self.level[children] = self.level[index] + 1
+            stack.extend(children[::-1].tolist())
+        self.preorder = np.array(preorder, dtype=np.int64)
+        if len(self.preorder) < n_locations:
+            LOG.warning(f"{n_locations - len(self.preorder)} locations are not connected to "
+                        f"the root location {self.root}.")
+
+        subtree_size = (self.tin >= 0).astype(np.int64)
+        for level in range(self.level.max(), 0, -1):
+            at_level = np.flatnonzero(self.level == level)
+            np.add.at(subtree_size, self.parent_index[at_level], subtree_size[at_level])
+        self.tout = np.where(self.tin >= 0, self.tin + subtree_size, -1)
+
+    def _build_lookup(self):
+        """
+        Dense array from location ID to the position of that location.
+        """
+        self._lookup = np.full(self.location_ids.max() + 1, -1, dtype=np.int64)
+        self._lookup[self.location_ids] = np.arange(len(self.location_ids))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_dag'] = None
+        del state['_lookup']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_lookup()
+
+    def __contains__(self, location_id):
+        return 0 <= location_id < len(self._lookup) and self._lookup[location_id] >= 0
+
+    def __len__(self):
+        return len(self.location_ids)
+
+    def _index(self, location_id):
+        if location_id not in self:
+            raise KeyError(f"Location {location_id} is not in the location hierarchy.")
+        return self._lookup[location_id]
+
+    def index_of(self, location_ids):
+        """
+        Vectorized lookup of the position of each location ID in the hierarchy arrays.
+
+        Args:
+            location_ids: array-like of location IDs
+
+        Returns:
+            np.ndarray of positions, with -1 for locations not in the hierarchy
+        """
+        location_ids = np.asarray(location_ids, dtype=np.int64)
+        known = (location_ids >= 0) & (location_ids < len(self._lookup))
+        index = np.full(location_ids.shape, -1, dtype=np.int64)
+        index[known] = self._lookup[location_ids[known]]
+        return index
+
+    @property
+    def dag(self):
+        """
+        A networkx graph of the hierarchy, with all metadata as node properties.
+        It is built the first time it is asked for.
+        """
+        if self._dag is None:
+            dag = nx.DiGraph()
+            for row in self.df.to_dict('records'):
+                dag.add_node(int(row['location_id']), **row)
+            has_parent = self.parent_index >= 0
+            dag.add_edges_from(zip(
+                self.location_ids[self.parent_index[has_parent]].tolist(),
+                self.location_ids[has_parent].tolist()
+            ))
+            dag.graph["root"] = self.root
+            self._dag = dag
+        return self._dag
+
+    def parent(self, location_id):
+        """
+        Gets the parent location ID of a location, or None for the root.
+        :param location_id: (int)
+        :return:
+        """
+        parent = self.parent_index[self._index(location_id)]
+        if parent < 0:
+            return None
+        return int(self.location_ids[parent])
+
+    def children(self, location_id):
+        """
+        Gets the direct children of a location ID.
+        :param location_id: (int)
+        :return: (list)
+        """
+        index = self._index(location_id)
+        children = self.child_index[self.child_offsets[index]:self.child_offsets[index + 1]]
+        return self.location_ids[children].tolist()
 
     def descendants(self, location_id):
         """
         Gets all descendants (not just direct children) for a location ID.
         :param location_id: (int)
-        :return:
+        :return: (set)
+        """
+        index = self._index(location_id)
+        if self.tin[index] < 0:
+            # Locations that can't be reached from the root aren't in the preorder.
+            return set()
+        subtree = self.preorder[self.tin[index] + 1:self.tout[index]]
+        return set(self.location_ids[subtree].tolist())
+
+    def is_descendant(self, location_id, ancestor_id):
+        """
+        Checks whether a location is a descendant of another location
+        (not including the location itself), in constant time.
+        :param location_id: (int)
+        :param ancestor_id: (int)
+        :return: (bool)
         """
-        return nx.algorithms.dag.descendants(G=self.dag, source=location_id)
+        index = self._index(location_id)
+        ancestor = self._index(ancestor_id)
+        return bool(self.tin[ancestor] < self.tin[index] < self.tout[ancestor])
+
+    def in_subtree(self, location_ids, ancestor_id, include_ancestor=True):
+        """
+        Vectorized check of which locations are in the subtree of a location.
+        This is the fast version of ``location_ids.isin(descendants(ancestor_id))``.
+
+        Args:
+            location_ids: array-like of location IDs
+            ancestor_id: (int) root of the subtree
+            include_ancestor: (bool) whether the ancestor itself counts as in its subtree
+
+        Returns:
+            np.ndarray of booleans
+        """
+        ancestor = self._index(ancestor_id)
+        index = self.index_of(location_ids)
+        tin = np.where(index >= 0, self.tin[index], -1)
+        lower = self.tin[ancestor] if include_ancestor else self.tin[ancestor] + 1
+        return (tin >= lower) & (tin < self.tout[ancestor])
+
+    def depth(self, location_id):
+        """
+        Gets the depth of a location in the hierarchy, where the root has depth 0.
+        :param location_id: (int)
+        :return: (int)
+        """
+        return int(self.level[self._index(location_id)])
 
     def parent_children(self, location_id):
         """
@@ -50,30 +245,30 @@ class LocationDAG:
         :param location_id: (int)
         :return:
         """
-        return [location_id] + list(self.dag.successors(location_id))
-    
+        return [location_id] + self.children(location_id)
+
     def to_dataframe(self):
         """
         Converts the location DAG to a data frame with location ID and parent ID
         and name. Helpful for debugging, and putting into the dismod database.
 
+        Locations are in lexicographical topological order, that is parents
+        come before their children and otherwise smaller location IDs come first.
+
         Returns:
             pd.DataFrame
         """
-        sorted_locations = list(nx.lexicographical_topological_sort(self.dag))
-        parents = list()
-        names = list()
-        for l in sorted_locations:
-            parent = list(self.dag.predecessors(l))
-            if parent:
-                parents.append(int(parent[0]))
-            else:
-                parents.append(np.nan)
-            names.append(self.dag.nodes[l]["location_name"])
+        order = list()
+        heap = [(self.root, self._index(self.root))]
+        while heap:
+            location_id, index = heapq.heappop(heap)
+            order.append(index)
+            for child in self.child_index[self.child_offsets[index]:self.child_offsets[index + 1]]:
+                heapq.heappush(heap, (self.location_ids[child], child))
+        order = np.array(order, dtype=np.int64)
+        parents = self.parent_index[order]
         return pd.DataFrame(dict(
-            location_id=sorted_locations,
-            parent_id=parents,
-            name=names
+            location_id=self.location_ids[order],
+            parent_id=np.where(parents >= 0, self.location_ids[parents], np.nan),
+            name=self.df.location_name.values[order]
         ))
-
-
@@ -3,6 +3,7 @@ import pandas as pd
 from copy import copy
 from collections import defaultdict
 
+from cascade_at.core.compact import compact_frame, frame_memory, upcast_frame
 from cascade_at.core.db import decomp_step as ds
 
 from cascade_at.core.log import get_loggers
@@ -16,17 +17,31 @@ from cascade_at.inputs.demographics import Demographics
 from cascade_at.inputs.locations import LocationDAG
 from cascade_at.inputs.population import Population
 from cascade_at.inputs.utilities.covariate_weighting import get_interpolated_covariate_values
+from cascade_at.inputs.utilities.shared_pool import SHARED, map_with_shared
+from cascade_at.inputs.utilities.stage_cache import cached
 from cascade_at.inputs.utilities.gbd_ids import get_location_set_version_id
 from cascade_at.dismod.integrand_mappings import INTEGRAND_MAP
 from cascade_at.dismod.constants import IntegrandEnum
 from cascade_at.inputs.utilities.transformations import COVARIATE_TRANSFORMS
 from cascade_at.inputs.utilities.gbd_ids import SEX_ID_TO_NAME, SEX_NAME_TO_ID
-from cascade_at.inputs.utilities.reduce_data_volume import decimate_years
+from cascade_at.inputs.utilities.reduce_data_volume import decimate_years, reduce_data_volume, \
+    strategies_from_settings
 from cascade_at.inputs.utilities.gbd_ids import CascadeConstants, StudyCovConstants
 from cascade_at.model.utilities.grid_helpers import expand_grid
 
 LOG = get_loggers(__name__)
 
+AVGINT_CHUNK_SIZE = 100000
+"""
+Default maximum number of demographic cells in each chunk of the avgint grid.
+"""
+
+
+def _configure_covariate(index):
+    return SHARED['covariate_data'][index].configure_for_dismod(
+        pop_df=SHARED['pop_df'], location_dag=SHARED['location_dag']
+    )
+
 
 class MeasurementInputs:
     def __init__(self, model_version_id, gbd_round_id,
@@ -35,7 +50,7 @@ class MeasurementInputs:
                  country_covariate_id,
                  conn_def,
                  location_set_version_id=None,
-                 drill=None):
+                 drill=None, compact=False, n_processes=1):
         """
         The class that constructs all of the measurement inputs. Pulls ASDR, CSMR, crosswalk versions,
         and country covariates, and puts them into one data frame that then formats itself
@@ -54,6 +69,10 @@ class MeasurementInputs:
             location_set_version_id: (int) can be None, if it's none, get the
                 best location_set_version_id for estimation hierarchy of this GBD round.
             drill: (int) optional, which location ID to drill from as the parent
+            compact: (bool) keep the population and covariate frames in compact form,
+                with float32 values and small integer ids, to use less memory
+            n_processes: (int) number of processes to prepare the country covariates in,
+                one covariate at a time in each
 
         Attributes:
             self.decomp_step: (str) the decomp step in string form
@@ -139,6 +158,9 @@ class MeasurementInputs:
         self.density = None
         self.nu = None
         self.measures_to_exclude = None
+        self.data_reduction_report = list()
+        self.compact = compact
+        self.n_processes = n_processes
 
         self.dismod_data = None
         self.covariate_data = None
@@ -184,13 +206,30 @@ class MeasurementInputs:
             decomp_step=self.decomp_step,
             gbd_round_id=self.gbd_round_id
         ).get_population()
+        if self.compact:
+            self.compact_raw_inputs()
 
-    def configure_inputs_for_dismod(self, settings, mortality_year_reduction=5):
+    def compact_raw_inputs(self):
+        """
+        Puts the population and covariate estimates, which are only used
+        to get the covariate values, into compact form. The measurements aren't changed.
+        """
+        before = frame_memory(self.population.raw) + sum(frame_memory(c.raw) for c in self.covariate_data)
+        self.population.raw = compact_frame(self.population.raw)
+        for c in self.covariate_data:
+            c.raw = compact_frame(c.raw)
+        after = frame_memory(self.population.raw) + sum(frame_memory(c.raw) for c in self.covariate_data)
+        LOG.info(f"Compacted population and covariates from {before} to {after} bytes.")
+
+    def configure_inputs_for_dismod(self, settings, mortality_year_reduction=5, stage_cache=None):
         """
         Modifies the inputs for DisMod based on model-specific settings.
 
         :param settings: (cascade.settings.configuration.Configuration)
         :param mortality_year_reduction: (int) number of years to decimate csmr and asdr
+        :param stage_cache: (cascade_at.inputs.utilities.stage_cache.StageCache) cache
+            of the derived stages, like the configured data, omega and covariates, or None
+            to make all of them
         :return: self
         """
         self.data_eta = self.data_eta_from_settings(settings)
@@ -200,22 +239,41 @@ class MeasurementInputs:
 
         # If we are constraining omega, then we want to hold out the data
         # from the DisMod fit for ASDR (but never CSMR -- always want to fit CSMR).
-        data = self.data.configure_for_dismod(
-            measures_to_exclude=self.measures_to_exclude,
-            relabel_incidence=settings.model.relabel_incidence
+        data = cached(
+            stage_cache, 'crosswalk_data',
+            [self.data.raw, self.data.exclude_outliers, self.data.conn_def,
+             self.demographics.location_id, self.demographics.sex_id,
+             self.measures_to_exclude, settings.model.relabel_incidence],
+            lambda: self.data.configure_for_dismod(
+                measures_to_exclude=self.measures_to_exclude,
+                relabel_incidence=settings.model.relabel_incidence
+            )
+        )
+        # Thin out the bundle data with the strategies in the settings, if there are any.
+        data, self.data_reduction_report = reduce_data_volume(
+            data=data, strategies=strategies_from_settings(settings)
         )
         asdr = self.asdr.configure_for_dismod(hold_out=settings.model.constrain_omega)
         csmr = self.csmr.configure_for_dismod(hold_out=0)
 
         if settings.model.constrain_omega:
-            self.omega = self.calculate_omega(asdr=asdr, csmr=csmr)
+            self.omega = cached(
+                stage_cache, 'omega', [asdr, csmr],
+                lambda: self.calculate_omega(asdr=asdr, csmr=csmr)
+            )
         else:
             self.omega = None
 
         if not csmr.empty:
-            csmr = decimate_years(data=csmr, num_years=mortality_year_reduction)
+            csmr = cached(
+                stage_cache, 'decimated_csmr', [csmr, mortality_year_reduction],
+                lambda: decimate_years(data=csmr, num_years=mortality_year_reduction)
+            )
         if not asdr.empty:
-            asdr = decimate_years(data=asdr, num_years=mortality_year_reduction)
+            asdr = cached(
+                stage_cache, 'decimated_asdr', [asdr, mortality_year_reduction],
+                lambda: decimate_years(data=asdr, num_years=mortality_year_reduction)
+            )
 
         self.dismod_data = pd.concat([data, asdr, csmr], axis=0, sort=True)
         self.dismod_data.reset_index(drop=True, inplace=True)
@@ -230,22 +288,66 @@ class MeasurementInputs:
             country_covariates=settings.country_covariate,
             study_covariates=settings.study_covariate
         )
-        self.country_covariate_data = {c.covariate_id: c.configure_for_dismod(
-            pop_df=self.population.configure_for_dismod(),
-            loc_df=self.location_dag.df
-        ) for c in self.covariate_data}
+        self.country_covariate_data = self.configure_country_covariates(stage_cache=stage_cache)
+        if self.compact:
+            self.country_covariate_data = {
+                k: compact_frame(v) for k, v in self.country_covariate_data.items()
+            }
 
-        self.dismod_data = self.add_covariates_to_data(df=self.dismod_data)
+        self.dismod_data = self.add_covariates_to_data(df=self.dismod_data, stage_cache=stage_cache)
         self.dismod_data.loc[self.dismod_data.hold_out.isnull(), 'hold_out'] = 0.
         self.dismod_data.drop(['age_group_id'], inplace=True, axis=1)
+        if self.compact:
+            # The data goes into dismod, so its covariate values go back to full precision.
+            self.dismod_data = upcast_frame(self.dismod_data)
 
         return self
 
-    def add_covariates_to_data(self, df):
+    def configure_country_covariates(self, stage_cache=None):
+        """
+        Completes each country covariate over ages, sexes and locations.
+        The covariates are independent, so they are done in parallel
+        if there is more than one process. Covariates that are in the stage
+        cache are read rather than done again.
+
+        :param stage_cache: (cascade_at.inputs.utilities.stage_cache.StageCache)
+        :return: Dict[int, pd.DataFrame] configured covariate data by covariate ID
+        """
+        pop_df = self.population.configure_for_dismod()
+        configured = dict()
+        cache_keys = dict()
+        if stage_cache is not None:
+            locations = self.location_dag.to_dataframe()
+            for index, c in enumerate(self.covariate_data):
+                cache_keys[index], df = stage_cache.lookup('country_covariate', [
+                    c.covariate_id, c.raw, pop_df, locations,
+                    self.demographics.age_group_id, self.demographics.location_id
+                ])
+                if df is not None:
+                    configured[index] = df
+        missing = [index for index in range(len(self.covariate_data)) if index not in configured]
+        made = map_with_shared(
+            _configure_covariate, missing,
+            shared={
+                'covariate_data': self.covariate_data,
+                'pop_df': pop_df,
+                'location_dag': self.location_dag
+            },
+            n_processes=self.n_processes
+        )
+        for index, df in zip(missing, made):
+            configured[index] = df
+            if stage_cache is not None:
+                stage_cache.put(cache_keys[index], df)
+        return {c.covariate_id: configured[index] for index, c in enumerate(self.covariate_data)}
+
+    def add_covariates_to_data(self, df, stage_cache=None):
         """
         Add on covariates to a data frame that has age_group_id, year_id
         or time-age upper / lower, and location_id and sex_id. Adds both
         country-level and study-level covariates.
+        :param stage_cache: (cascade_at.inputs.utilities.stage_cache.StageCache)
+            cache of the interpolated covariate values
         :return:
         """
         cov_dict_for_interpolation = {
@@ -254,12 +356,22 @@ class MeasurementInputs:
             if c.study_country == 'country'
         }
 
-        df = self.interpolate_country_covariate_values(df=df, cov_dict=cov_dict_for_interpolation)
+        df = self.interpolate_country_covariate_values(
+            df=df, cov_dict=cov_dict_for_interpolation, stage_cache=stage_cache
+        )
         df = self.transform_country_covariates(df=df)
+        df = self.add_study_covariates(df=df)
+        return df
 
+    @staticmethod
+    def add_study_covariates(df):
+        """
+        Adds the sex and one study covariates to a data frame with sex_id.
+        :param df: (pd.DataFrame)
+        :return:
+        """
         df['s_sex'] = df.sex_id.map(SEX_ID_TO_NAME).map(StudyCovConstants.SEX_COV_VALUE_MAP)
         df['s_one'] = StudyCovConstants.ONE_COV_VALUE
-
         return df
 
     def to_gbd_avgint(self, parent_location_id, sex_id):
@@ -267,22 +379,84 @@ class MeasurementInputs:
         Converts the demographics of the model to the avgint table.
         :return:
         """
+        return pd.concat(
+            list(self.gbd_avgint_chunks(parent_location_id=parent_location_id, sex_id=sex_id, chunk_size=None)),
+            ignore_index=True
+        )
+
+    def gbd_avgint_chunks(self, parent_location_id, sex_id, chunk_size=AVGINT_CHUNK_SIZE):
+        """
+        Generates the avgint grid of GBD demographics for a parent location and its children,
+        a group of locations at a time so that each chunk has at most about chunk_size
+        rows (at least one location per chunk).
+
+        Every row of the grid is a single GBD age group and year, so the covariate
+        values are looked up directly for each demographic cell rather than interpolated.
+
+        :param parent_location_id: (int)
+        :param sex_id: (int)
+        :param chunk_size: (int) maximum number of demographic cells in a chunk,
+            or None for a single chunk
+        :return: generator of pd.DataFrame
+        """
         LOG.info(f"Getting grid for the avgint table "
                  f"for parent location ID {parent_location_id} "
                  f"and sex_id {sex_id}.")
-        grid = expand_grid({
-            'sex_id': [sex_id],
-            'location_id': self.location_dag.parent_children(parent_location_id),
-            'year_id': self.demographics.year_id,
-            'age_group_id': self.demographics.age_group_id
-        })
-        grid['time_lower'] = grid['year_id'].astype(int)
-        grid['time_upper'] = grid['year_id'] + 1.
-        grid = BaseInput(gbd_round_id=self.gbd_round_id).convert_to_age_lower_upper(df=grid)
-
-        LOG.info("Adding covariates to avgint grid.")
-        grid = self.add_covariates_to_data(df=grid)
-        return grid
+        locations = self.location_dag.parent_children(parent_location_id)
+        cells_per_location = len(self.demographics.year_id) * len(self.demographics.age_group_id)
+        if chunk_size is None:
+            locations_per_chunk = len(locations)
+        else:
+            locations_per_chunk = max(1, chunk_size // max(1, cells_per_location))
+
+        base_input = BaseInput(gbd_round_id=self.gbd_round_id)
+        covariate_values = self.country_covariate_lookup(location_ids=locations, sex_id=sex_id)
+
+        for start in range(0, len(locations), locations_per_chunk):
+            grid = expand_grid({
+                'sex_id': [sex_id],
+                'location_id': locations[start:start + locations_per_chunk],
+                'year_id': self.demographics.year_id,
+                'age_group_id': self.demographics.age_group_id
+            })
+            grid['time_lower'] = grid['year_id'].astype(int)
+            grid['time_upper'] = grid['year_id'] + 1.
+            grid = base_input.convert_to_age_lower_upper(df=grid)
+
+            LOG.info("Adding covariates to avgint grid.")
+            keys = pd.MultiIndex.from_arrays([
+                grid[col].values.astype(int) for col in ['location_id', 'age_group_id', 'year_id']
+            ])
+            for name, values in covariate_values.items():
+                grid[name] = values.reindex(keys).values
+            grid = self.transform_country_covariates(df=grid)
+            grid = self.add_study_covariates(df=grid)
+            yield grid
+
+    def country_covariate_lookup(self, location_ids, sex_id):
+        """
+        Country covariate values for GBD demographic cells of some locations and one sex.
+
+        :param location_ids: (list) locations to keep
+        :param sex_id: (int)
+        :return: Dict[str, pd.Series] covariate name to values indexed by
+            location_id, age_group_id, and year_id
+        """
+        lookup = dict()
+        for c in self.covariate_specs.covariate_specs:
+            if c.study_country != 'country':
+                continue
+            cov_df = self.country_covariate_data[c.covariate_id]
+            cov_df = cov_df.loc[cov_df.location_id.isin(location_ids) & (cov_df.sex_id == sex_id)]
+            missing = set(location_ids) - set(cov_df.location_id.unique())
+            if missing:
+                LOG.warning(f"Covariate {c.name} is missing for location_ids {sorted(missing)}, "
+                            f"sex_id {sex_id} -- setting the value to None.")
+            values = pd.Series(cov_df.mean_value.values.astype(float), index=pd.MultiIndex.from_arrays([
+                cov_df[col].values.astype(int) for col in ['location_id', 'age_group_id', 'year_id']
+            ]))
+            lookup[c.name] = values.loc[~values.index.duplicated(keep='last')]
+        return lookup
 
     @staticmethod
     def calculate_omega(asdr, csmr):
@@ -313,7 +487,7 @@ class MeasurementInputs:
 
         return omega
 
-    def interpolate_country_covariate_values(self, df, cov_dict):
+    def interpolate_country_covariate_values(self, df, cov_dict, stage_cache=None):
         """
         Interpolates the covariate values onto the data
         so that the non-standard ages and years match up to meaningful
@@ -321,12 +495,15 @@ class MeasurementInputs:
 
         :param df: (pd.DataFrame)
         :param cov_dict: (Dict)
+        :param stage_cache: (cascade_at.inputs.utilities.stage_cache.StageCache)
         """
         LOG.info(f"Interpolating and merging the country covariates.")
         interp_df = get_interpolated_covariate_values(
             data_df=df,
             covariate_dict=cov_dict,
-            population_df=self.population.configure_for_dismod()
+            population_df=self.population.configure_for_dismod(),
+            n_processes=getattr(self, 'n_processes', 1),
+            stage_cache=stage_cache
         )
         return interp_df
 
@@ -339,9 +516,7 @@ class MeasurementInputs:
         for c in self.covariate_specs.covariate_specs:
             if c.study_country == 'country':
                 LOG.info(f"Transforming the data for country covariate {c.covariate_id}.")
-                df[c.name] = df[c.name].apply(
-                    lambda x: COVARIATE_TRANSFORMS[c.transformation_id](x)
-                )
+                df[c.name] = COVARIATE_TRANSFORMS[c.transformation_id](df[c.name].astype(float))
         return df
 
     def calculate_country_covariate_reference_values(self, parent_location_id, sex_id):
@@ -357,14 +532,17 @@ class MeasurementInputs:
         :param sex_id: (int)
         :return: List[CovariateSpec] list of the covariate specs with the correct reference values and max diff.
         """
+        # The specs are copied, not just the list of them, because databases for
+        # different parents and sexes are built from these inputs at the same time.
         covariate_specs = copy(self.covariate_specs)
+        covariate_specs.covariate_specs = [copy(c) for c in self.covariate_specs.covariate_specs]
 
         age_min = self.dismod_data.age_lower.min()
         age_max = self.dismod_data.age_upper.max()
         time_min = self.dismod_data.time_lower.min()
         time_max = self.dismod_data.time_upper.max()
 
-        children = list(self.location_dag.dag.successors(parent_location_id))
+        children = self.location_dag.children(parent_location_id)
         
         for c in covariate_specs.covariate_specs:
             if c.study_country == 'study':
@@ -507,7 +685,7 @@ class MeasurementInputs:
 
 
 class MeasurementInputsFromSettings(MeasurementInputs):
-    def __init__(self, settings):
+    def __init__(self, settings, compact=False, n_processes=1):
         """
         Wrapper for MeasurementInputs that takes a settings object rather than the
         individual arguments. For convenience.
@@ -539,5 +717,7 @@ class MeasurementInputsFromSettings(MeasurementInputs):
             country_covariate_id=covariate_ids,
             conn_def='epi',
             location_set_version_id=settings.location_set_version_id,
-            drill=drill
+            drill=drill,
+            compact=compact,
+            n_processes=n_processes
         )
@@ -1,11 +1,13 @@
 import numpy as np
-from scipy import stats
 
 from cascade_at.dismod.constants import DensityEnum
+from cascade_at.core.lazy import LazyModule
 from cascade_at.core.log import get_loggers
 
 LOG = get_loggers(__name__)
 
+stats = LazyModule("scipy.stats")
+
 
 def meas_bounds_to_stdev(df):
     """
@@ -4,6 +4,7 @@ import itertools
 from intervaltree import IntervalTree
 
 from cascade_at.core.log import get_loggers
+from cascade_at.inputs.utilities.shared_pool import SHARED, map_with_shared
 
 LOG = get_loggers(__name__)
 
@@ -106,37 +107,92 @@ class CovariateInterpolator:
         return cov_value
 
 
+GROUP_COLUMNS = ['location_id', 'sex_id', 'age_lower', 'age_upper', 'time_lower', 'time_upper']
+"""Columns of the data that a covariate value depends on."""
+
+
+def data_groups(data_df):
+    """
+    The unique location, sex, age and time combinations in the data.
+
+    :param data_df: (pd.DataFrame)
+    :return: (np.ndarray, np.ndarray) the combinations, with a row for each and the
+        columns in GROUP_COLUMNS, and the combination of each row of the data
+    """
+    keys, group = np.unique(data_df[GROUP_COLUMNS].values.astype(np.float64), axis=0, return_inverse=True)
+    return keys, group.ravel()
+
+
+def interpolate_groups(covariate_df, population_df, keys):
+    """
+    Interpolates one covariate onto each combination from data_groups.
+
+    :param covariate_df: (pd.DataFrame)
+    :param population_df: (pd.DataFrame)
+    :param keys: (np.ndarray) from data_groups
+    :return: (np.ndarray) covariate value for each combination, NaN where the location is missing
+    """
+    interpolator = CovariateInterpolator(covariate=covariate_df, population=population_df)
+    values = np.empty(len(keys))
+    for i, (loc_id, sex_id, age_lower, age_upper, time_lower, time_upper) in enumerate(keys):
+        if i % 1000 == 0:
+            LOG.info(f"Processed {i} of {len(keys)} data groups.")
+        value = interpolator.interpolate(
+            loc_id=int(loc_id), sex_id=int(sex_id),
+            age_lower=age_lower, age_upper=age_upper,
+            time_lower=time_lower, time_upper=time_upper
+        )
+        values[i] = np.nan if value is None else value
+    return values
+
+
+def _interpolate_shared(name):
+    return interpolate_groups(
+        covariate_df=SHARED['covariate_dict'][name],
+        population_df=SHARED['population_df'],
+        keys=SHARED['keys']
+    )
+
+
 def get_interpolated_covariate_values(data_df, covariate_dict,
-                                      population_df):
+                                      population_df, n_processes=1, stage_cache=None):
     """
     Gets the unique age-time combinations from the data_df, and creates
     interpolated covariate values for each of these combinations by population-weighting
     the standard GBD age-years that span the non-standard combinations.
 
+    Each covariate is independent of the others, so with more than one process they are
+    interpolated in parallel, with the population and data combinations shared by the processes.
+
     :param data_df: (pd.DataFrame)
     :param covariate_dict: Dict[pd.DataFrame] with covariate names as keys
     :param population_df: (pd.DataFrame)
+    :param n_processes: (int) number of processes to interpolate the covariates in
+    :param stage_cache: (cascade_at.inputs.utilities.stage_cache.StageCache) cache of the
+        interpolated values of each covariate, by the data combinations, covariate and population
     :return: pd.DataFrame
     """
     data = data_df.copy()
-    pop = population_df.copy()
-
-    data_groups = data.groupby([
-        'location_id', 'sex_id', 'age_lower', 'age_upper', 'time_lower', 'time_upper'
-    ], as_index=False)
-
-    cov_objects = {cov_name: CovariateInterpolator(covariate=raw_cov, population=pop)
-                   for cov_name, raw_cov in covariate_dict.items()}
-    num_groups = len(data_groups)
-    for i, (k, v) in enumerate(data_groups):
-        if i % 1000 == 0:
-            LOG.info(f"Processed {i} of {num_groups} data groups.")
-        [loc_id, sex_id, age_lower, age_upper, time_lower, time_upper] = k
-        for cov_id, cov_obj in cov_objects.items():
-            cov_value = cov_obj.interpolate(
-                loc_id=loc_id, sex_id=sex_id,
-                age_lower=age_lower, age_upper=age_upper,
-                time_lower=time_lower, time_upper=time_upper
+    keys, group = data_groups(data)
+    cache_keys = dict()
+    interpolated = dict()
+    for name, covariate_df in covariate_dict.items():
+        if stage_cache is not None:
+            cache_keys[name], df = stage_cache.lookup(
+                'interpolated_covariate', [keys, covariate_df, population_df]
             )
-            data.loc[v.index, cov_id] = cov_value
+            if df is not None:
+                interpolated[name] = df.value.values
+    names = [name for name in covariate_dict if name not in interpolated]
+    values = map_with_shared(
+        _interpolate_shared, names,
+        shared={'covariate_dict': covariate_dict, 'population_df': population_df, 'keys': keys},
+        n_processes=n_processes
+    )
+    for name, cov_values in zip(names, values):
+        interpolated[name] = cov_values
+        if stage_cache is not None:
+            stage_cache.put(cache_keys[name], pd.DataFrame({'value': cov_values}))
+    for name in covariate_dict:
+        data[name] = interpolated[name][group]
     return data
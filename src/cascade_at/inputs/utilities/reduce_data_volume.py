@@ -1,4 +1,12 @@
 import numpy as np
+import pandas as pd
+
+from cascade_at.core.log import get_loggers
+
+LOG = get_loggers(__name__)
+
+CELL_COLUMNS = ['location_id', 'sex_id', 'measure', 'hold_out']
+"""Columns that have to match for observations to be combined. Any that aren't in the data are left out."""
 
 
 def decimate_years(data, num_years=5):
@@ -35,3 +43,226 @@ def decimate_years(data, num_years=5):
     group.reset_index(inplace=True)
 
     return group[group_columns + ['meas_value', 'meas_std']]
+
+
+def cell_codes(df, columns, extra_codes=()):
+    """
+    Gives each row an integer code for the cell it belongs to, where a cell
+    is a unique combination of the values in the columns and the extra codes.
+
+    Args:
+        df: (pd.DataFrame)
+        columns: (List[str]) columns that define the cells
+        extra_codes: (List[np.ndarray]) integer arrays that also define the cells, like age bins
+
+    Returns:
+        (np.ndarray) integer codes from 0 to the number of cells - 1
+    """
+    codes = [pd.factorize(df[c])[0] for c in columns if c in df]
+    codes.extend(np.asarray(e, dtype=np.int64) for e in extra_codes)
+    if not codes:
+        return np.zeros(len(df), dtype=np.int64)
+    _, inverse = np.unique(np.column_stack(codes), axis=0, return_inverse=True)
+    return inverse.ravel()
+
+
+def collapse_cells(df, codes, inverse_variance=False):
+    """
+    Makes one observation for each cell. The ages and times span those of the
+    observations in the cell, and the other columns come from the first observation
+    in the cell. The value is the mean, or the inverse-variance weighted mean,
+    in which case the standard deviation is that of the pooled estimate.
+
+    Args:
+        df: (pd.DataFrame) with meas_value, meas_std, age_lower, age_upper, time_lower and time_upper
+        codes: (np.ndarray) cell of each row from cell_codes
+        inverse_variance: (bool) pool with inverse-variance weights rather than averaging
+
+    Returns:
+        (pd.DataFrame) with one row per cell, in the order of the first row in each cell
+    """
+    _, first, inverse, counts = np.unique(codes, return_index=True, return_inverse=True, return_counts=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    cell = rank[inverse]
+
+    value = df.meas_value.values.astype(np.float64)
+    std = df.meas_std.values.astype(np.float64)
+    result = df.iloc[first[order]].copy()
+    n = counts[order]
+    # Cells with one observation keep it as it is.
+    combined = n > 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if inverse_variance:
+            weight = 1 / std ** 2
+            total = np.bincount(cell, weights=weight)
+            pooled_value = np.bincount(cell, weights=weight * value) / total
+            pooled_std = np.sqrt(1 / total)
+        else:
+            pooled_value = np.bincount(cell, weights=value) / n
+            pooled_std = np.bincount(cell, weights=std) / n
+    result['meas_value'] = np.where(combined, pooled_value, result.meas_value.values)
+    result['meas_std'] = np.where(combined, pooled_std, result.meas_std.values)
+    for column, reduce in [('age_lower', np.minimum), ('time_lower', np.minimum),
+                           ('age_upper', np.maximum), ('time_upper', np.maximum)]:
+        extent = result[column].values.astype(np.float64)
+        reduce.at(extent, cell, df[column].values.astype(np.float64))
+        result[column] = extent
+    return result.reset_index(drop=True)
+
+
+def bin_ages(data, age_bins):
+    """
+    Averages observations whose age midpoints are in the same age band and that
+    have the same location, sex, measure, hold out and times.
+
+    Args:
+        data: (pd.DataFrame)
+        age_bins: (List[float]) edges of the age bands
+
+    Returns:
+        (pd.DataFrame)
+    """
+    age_bins = np.sort(np.asarray(age_bins, dtype=np.float64))
+    midpoint = (data.age_lower.values + data.age_upper.values) / 2
+    band = np.searchsorted(age_bins, midpoint, side='right')
+    codes = cell_codes(data, CELL_COLUMNS + ['time_lower', 'time_upper'], extra_codes=[band])
+    return collapse_cells(data, codes)
+
+
+def bin_years(data, num_years=5):
+    """
+    Averages observations whose time midpoints are in the same num_years-year band
+    and that have the same location, sex, measure, hold out and ages. Unlike
+    decimate_years, which is for square CSMR and ASDR, this is for bundle data: other
+    columns, like the name of the observation, don't keep rows apart, missing values
+    are kept, and the times of the combined observation span those of the observations in it.
+    Observations over more than num_years years aren't combined.
+
+    Args:
+        data: (pd.DataFrame)
+        num_years: (int) width of the time bands in years
+
+    Returns:
+        (pd.DataFrame)
+    """
+    midpoint = (data.time_lower.values + data.time_upper.values) / 2
+    band = np.floor(midpoint / num_years).astype(np.int64)
+    # Observations over longer intervals get a cell of their own.
+    long_interval = (data.time_upper.values - data.time_lower.values) > num_years
+    alone = np.where(long_interval, np.arange(len(data)), -1)
+    codes = cell_codes(data, CELL_COLUMNS + ['age_lower', 'age_upper'], extra_codes=[band, alone])
+    return collapse_cells(data, codes)
+
+
+def cap_rows(data, max_rows):
+    """
+    Keeps at most max_rows observations for each location and measure,
+    choosing the ones with the smallest standard deviations.
+
+    Args:
+        data: (pd.DataFrame)
+        max_rows: (int)
+
+    Returns:
+        (pd.DataFrame)
+    """
+    codes = cell_codes(data, ['location_id', 'measure'])
+    order = np.lexsort((np.arange(len(data)), data.meas_std.values, codes))
+    sorted_codes = codes[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_codes)) + 1]
+    position = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    keep = np.zeros(len(data), dtype=bool)
+    keep[order[position < max_rows]] = True
+    return data.loc[keep].reset_index(drop=True)
+
+
+def pool_observations(data, age_width=5., time_width=5.):
+    """
+    Pools near-duplicate observations with inverse-variance weights, where near-duplicates
+    are in the same location, sex, measure, hold out, and age and time bins of the given widths,
+    by their midpoints. Observations without a positive standard deviation aren't pooled.
+
+    Args:
+        data: (pd.DataFrame)
+        age_width: (float) width of the age bins in years
+        time_width: (float) width of the time bins in years
+
+    Returns:
+        (pd.DataFrame)
+    """
+    std = data.meas_std.values.astype(np.float64)
+    poolable = np.isfinite(std) & (std > 0)
+    age_bin = np.floor((data.age_lower.values + data.age_upper.values) / 2 / age_width).astype(np.int64)
+    time_bin = np.floor((data.time_lower.values + data.time_upper.values) / 2 / time_width).astype(np.int64)
+    # Observations that can't be pooled get a cell of their own.
+    alone = np.where(poolable, -1, np.arange(len(data)))
+    codes = cell_codes(data, CELL_COLUMNS, extra_codes=[age_bin, time_bin, alone])
+    return collapse_cells(data, codes, inverse_variance=True)
+
+
+THINNING_STRATEGIES = {
+    'bin_years': bin_years,
+    'bin_ages': bin_ages,
+    'cap_rows': cap_rows,
+    'pool_observations': pool_observations
+}
+"""Strategies for reducing the volume of data, by name. Each takes a data frame and keyword arguments."""
+
+STRATEGY_ARGUMENTS = {
+    'bin_years': ['num_years'],
+    'bin_ages': ['age_bins'],
+    'cap_rows': ['max_rows'],
+    'pool_observations': ['age_width', 'time_width']
+}
+"""The settings that each strategy uses."""
+
+
+def reduce_data_volume(data, strategies):
+    """
+    Applies data volume reduction strategies in order.
+
+    Args:
+        data: (pd.DataFrame) data prepped for dismod
+        strategies: (List[Tuple[str, Dict]]) the name of each strategy in
+            THINNING_STRATEGIES and its keyword arguments
+
+    Returns:
+        (pd.DataFrame, List[Dict]) the reduced data and the number of rows
+        before and after each strategy
+    """
+    report = list()
+    for name, kwargs in strategies:
+        if name not in THINNING_STRATEGIES:
+            raise ValueError(f"Unknown data reduction strategy {name}, "
+                             f"choose from {list(THINNING_STRATEGIES.keys())}.")
+        before = len(data)
+        if before:
+            data = THINNING_STRATEGIES[name](data, **kwargs)
+        report.append({'strategy': name, 'rows_before': before, 'rows_after': len(data)})
+        LOG.info(f"Data reduction {name} went from {before} to {len(data)} rows.")
+    return data, report
+
+
+def strategies_from_settings(settings):
+    """
+    Gets the data reduction strategies and their arguments from the
+    data_reduction section of the settings.
+
+    Args:
+        settings: (cascade_at.settings.settings_configuration.SettingsConfiguration)
+
+    Returns:
+        (List[Tuple[str, Dict]])
+    """
+    strategies = list()
+    if settings.is_field_unset("data_reduction"):
+        return strategies
+    for reduction in settings.data_reduction:
+        kwargs = dict()
+        for argument in STRATEGY_ARGUMENTS[reduction.strategy]:
+            if not reduction.is_field_unset(argument):
+                kwargs[argument] = getattr(reduction, argument)
+        strategies.append((reduction.strategy, kwargs))
+    return strategies
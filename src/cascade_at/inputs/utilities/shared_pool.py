@@ -0,0 +1,50 @@
+"""
+Maps a function over items in a pool of processes that share large inputs.
+
+The inputs are put in SHARED before the pool starts, and the processes are
+started with fork, whatever the platform's default start method is, so each one
+inherits them copy-on-write rather than having them pickled for every task.
+Where fork isn't available, the function is called in this process instead. Only the items and the results are sent between processes,
+so the function should take something small, like a name, and return something
+small, like an array of values.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from cascade_at.core.log import get_loggers
+
+LOG = get_loggers(__name__)
+
+SHARED = dict()
+"""Inputs for the functions that run in the pool."""
+
+
+def map_with_shared(function, items, shared, n_processes=1):
+    """
+    Calls a function on each item, with shared inputs in SHARED.
+
+    Args:
+        function: a module-level function of one item that reads its inputs from SHARED
+        items: (Iterable) items to call the function on
+        shared: (Dict) the inputs to share
+        n_processes: (int) number of processes, or 1 to call the function in this process
+
+    Returns:
+        (List) the results, in the order of the items
+    """
+    items = list(items)
+    SHARED.update(shared)
+    try:
+        if n_processes > 1 and len(items) > 1:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                n_processes = min(n_processes, len(items))
+                LOG.info(f"Mapping {function.__name__} over {len(items)} items in {n_processes} processes.")
+                with ProcessPoolExecutor(max_workers=n_processes,
+                                         mp_context=multiprocessing.get_context('fork')) as executor:
+                    return list(executor.map(function, items))
+            LOG.warning(f"Processes can't be forked on this platform, so mapping "
+                        f"{function.__name__} in this process.")
+        return [function(item) for item in items]
+    finally:
+        for key in shared:
+            SHARED.pop(key, None)
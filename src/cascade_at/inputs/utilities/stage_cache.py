@@ -0,0 +1,167 @@
+"""
+A content-addressed cache of the derived stages of the inputs, like the
+configured crosswalk data, omega, decimated mortality and completed covariates.
+
+Each stage is keyed by the name of the stage and a hash of everything it is made
+from, its upstream data frames and the settings that it uses, so a new model version
+with the same inputs and different priors reads the stages instead of
+making them again. The stages are stored as HDF5 files in a directory that
+is shared by model versions. When the directory is bigger than its maximum
+size, the stages that were used least recently are removed.
+"""
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from cascade_at.core.compact import upcast_frame
+from cascade_at.core.log import get_loggers
+from cascade_at.dismod.api.fill_extract_helpers.table_hash import content_hash
+
+LOG = get_loggers(__name__)
+
+STAGE_CACHE_VERSION = 1
+"""Part of every key, to change when the code that makes the stages changes what they are."""
+
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+STAGE_SUFFIX = '.h5'
+
+
+class StageCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            directory: (pathlib.Path) directory for the stages
+            max_bytes: (int) the largest total size of the stages
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = list()
+        self.misses = list()
+
+    def key(self, stage, *parts):
+        """
+        The key of a stage made from some parts.
+
+        Args:
+            stage: (str) name of the stage
+            *parts: data frames, arrays and settings that the stage is made from
+
+        Returns:
+            (str)
+        """
+        return f'{stage}_{content_hash(STAGE_CACHE_VERSION, stage, *parts)}'
+
+    def _path(self, key):
+        return self.directory / f'{key}{STAGE_SUFFIX}'
+
+    def get(self, key):
+        """
+        Reads a stage, or None if it isn't in the cache.
+        """
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            df = pd.read_hdf(path, key='stage')
+        except (OSError, KeyError, ValueError, RuntimeError) as error:
+            # A stage that was cut off or isn't HDF5 is a miss, and is written over.
+            LOG.warning(f"Could not read stage {key} from the cache: {error}.")
+            return None
+        # Reading a stage makes it the most recently used.
+        os.utime(path)
+        return df
+
+    def put(self, key, df):
+        """
+        Writes a stage, then removes the least recently used stages if the cache is too big.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        temporary = self.directory / f'.{path.name}.{os.getpid()}.tmp'
+        try:
+            upcast_frame(df).to_hdf(temporary, key='stage', mode='w', format='fixed')
+        except (TypeError, ValueError, OSError) as error:
+            LOG.warning(f"Could not write stage {key} to the cache: {error}.")
+            if temporary.exists():
+                temporary.unlink()
+            return
+        os.replace(temporary, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used stages until the cache is at most max_bytes.
+
+        Returns:
+            (List[str]) the keys that were removed
+        """
+        stages = list()
+        for path in self.directory.glob(f'*{STAGE_SUFFIX}'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            stages.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in stages)
+        removed = list()
+        for _, size, path in sorted(stages, key=lambda s: s[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed.append(path.name[:-len(STAGE_SUFFIX)])
+        if removed:
+            LOG.info(f"Evicted {len(removed)} stages from the cache.")
+        return removed
+
+    def lookup(self, stage, parts):
+        """
+        Looks up a stage and logs whether it was in the cache.
+
+        Args:
+            stage: (str) name of the stage
+            parts: (List) what the stage is made from, for the key
+
+        Returns:
+            (str, pd.DataFrame) the key, and the stage or None if it isn't in the cache
+        """
+        key = self.key(stage, *parts)
+        df = self.get(key)
+        if df is not None:
+            LOG.info(f"Stage cache hit for {stage} ({key}).")
+            self.hits.append(stage)
+        else:
+            LOG.info(f"Stage cache miss for {stage} ({key}).")
+            self.misses.append(stage)
+        return key, df
+
+    def cached(self, stage, parts, compute):
+        """
+        Reads a stage from the cache, or makes it and writes it to the cache.
+
+        Args:
+            stage: (str) name of the stage
+            parts: (List) what the stage is made from, for the key
+            compute: function of no arguments that makes the stage as a data frame
+
+        Returns:
+            (pd.DataFrame)
+        """
+        key, df = self.lookup(stage, parts)
+        if df is None:
+            df = compute()
+            self.put(key, df)
+        return df
+
+
+def cached(stage_cache, stage, parts, compute):
+    """
+    Like StageCache.cached, but just makes the stage if there isn't a cache.
+    """
+    if stage_cache is None:
+        return compute()
+    return stage_cache.cached(stage, parts, compute)
@@ -1,5 +1,8 @@
 import numpy as np
-from scipy.special import logit
+
+from cascade_at.core.lazy import LazyModule
+
+special = LazyModule("scipy.special")
 
 
 def identity(x):
@@ -10,6 +13,10 @@ def squared(x):
     return np.power(x, 2)
 
 
+def logit(x):
+    return special.logit(x)
+
+
 def scale1000(x):
     return x * 1000
 
@@ -1,3 +1,29 @@
+"""
+Executor parameters for cascade operations.
+
+Each operation gets its memory, cores and runtime from a resource model
+that learns from the metrics of past runs. Each run of a command records its
+runtime and peak memory with features of the operation, like the number of data
+rows, children and grid points, in a metrics log in the log directory
+of the model version. For each kind of operation, the estimator fits a regression
+of log memory and log runtime on the log of the features, and asks for the
+prediction one residual standard deviation up, with a margin. Operations
+that haven't run before get defaults for their kind of operation.
+"""
+import heapq
+import json
+import math
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from cascade_at.core.log import get_loggers
+
+LOG = get_loggers(__name__)
 
 DEFAULT_EXECUTOR_PARAMETERS = {
     'm_mem_free': '30G',
@@ -9,3 +35,286 @@ DEFAULT_EXECUTOR_PARAMETERS = {
     }
 }
 
+OPERATION_PARAMETERS = {
+    'configure_inputs': {'m_mem_free': '15G', 'num_cores': 1, 'max_runtime_seconds': 60*60*6},
+    'format_upload': {'m_mem_free': '4G', 'num_cores': 1, 'max_runtime_seconds': 60*60*2},
+    'cleanup': {'m_mem_free': '2G', 'num_cores': 1, 'max_runtime_seconds': 60*60}
+}
+"""Parameters for operations that haven't run before, by the name of their command. Others get the defaults."""
+
+METRICS_FILE = 'task_metrics.jsonl'
+
+FEATURES = ['n_data', 'n_children', 'grid_size', 'n_databases', 'n_simulations']
+"""Features of an operation that its memory and runtime depend on."""
+
+MIN_MEMORY_GB = 1
+MIN_RUNTIME_SECONDS = 60*10
+
+
+def _as_list(ids):
+    if ids is None:
+        return list()
+    return list(ids) if isinstance(ids, (list, tuple)) else [ids]
+
+
+def operation_name(operation):
+    """The name of the command that an operation runs, like dismod_db."""
+    return operation.command.split(' ')[0]
+
+
+def operation_features(operation, settings=None, location_dag=None, n_data=None):
+    """
+    Features of a cascade operation for the resource model. Features
+    that aren't known are left out.
+
+    Args:
+        operation: (cascade_at.cascade.cascade_operations.CascadeOperation)
+        settings: (cascade_at.settings.settings_configuration.SettingsConfiguration)
+        location_dag: (cascade_at.inputs.locations.LocationDAG)
+        n_data: (int) number of rows of input data
+
+    Returns:
+        (Dict[str, float])
+    """
+    features = dict()
+    if n_data is not None:
+        features['n_data'] = n_data
+    parents = _as_list(getattr(operation, 'parent_location_id', None))
+    sexes = _as_list(getattr(operation, 'sex_id', None))
+    if parents:
+        features['n_databases'] = len(parents) * max(len(sexes), 1)
+        if location_dag is not None:
+            features['n_children'] = sum(len(location_dag.children(p)) for p in parents)
+    if settings is not None:
+        features['grid_size'] = len(settings.model.default_age_grid) * len(settings.model.default_time_grid)
+    if getattr(operation, 'n_simulations', None) is not None:
+        features['n_simulations'] = operation.n_simulations
+    return features
+
+
+def measure_command(command):
+    """
+    Runs a shell command and measures its runtime and peak memory.
+
+    Args:
+        command: (str)
+
+    Returns:
+        (Dict) with returncode, stdout, stderr, runtime_seconds and max_rss_gb
+    """
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        start = time.time()
+        process = subprocess.Popen(command, shell=True, stdout=stdout, stderr=stderr)
+        _, status, usage = os.wait4(process.pid, 0)
+        runtime = time.time() - start
+        process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        stdout.seek(0)
+        stderr.seek(0)
+        return {
+            'returncode': process.returncode,
+            'stdout': stdout.read().decode(),
+            'stderr': stderr.read().decode(),
+            'runtime_seconds': runtime,
+            # ru_maxrss is in kilobytes on Linux.
+            'max_rss_gb': usage.ru_maxrss / 1024 ** 2
+        }
+
+
+def record_task_metrics(path, operation, measurement, features):
+    """
+    Appends the metrics of one run of an operation to a metrics log.
+
+    Args:
+        path: (pathlib.Path) the metrics log
+        operation: (cascade_at.cascade.cascade_operations.CascadeOperation)
+        measurement: (Dict) from measure_command
+        features: (Dict[str, float]) from operation_features
+    """
+    row = {
+        'operation': operation_name(operation),
+        'command': operation.command,
+        'finished': time.time(),
+        'returncode': measurement['returncode'],
+        'runtime_seconds': measurement['runtime_seconds'],
+        'max_rss_gb': measurement['max_rss_gb']
+    }
+    row.update({f: features[f] for f in FEATURES if f in features})
+    os.makedirs(path.parent, exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(row) + '\n')
+
+
+def read_task_metrics(paths):
+    """
+    Reads metrics logs into one data frame.
+
+    Args:
+        paths: (List[pathlib.Path]) metrics logs, usually of all model versions
+
+    Returns:
+        (pd.DataFrame)
+    """
+    rows = list()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            rows.extend(json.loads(line) for line in f if line.strip())
+    df = pd.DataFrame(rows, columns=['operation', 'command', 'finished', 'returncode',
+                                     'runtime_seconds', 'max_rss_gb'] + FEATURES)
+    return df.astype({c: float for c in ['runtime_seconds', 'max_rss_gb'] + FEATURES})
+
+
+class ResourceEstimator:
+    def __init__(self, history=None, memory_margin=1.5, runtime_margin=2., min_history=3):
+        """
+        Predicts the memory and runtime of operations from the metrics of past runs.
+
+        Args:
+            history: (pd.DataFrame) from read_task_metrics
+            memory_margin: (float) multiplies the memory prediction
+            runtime_margin: (float) multiplies the runtime prediction
+            min_history: (int) number of runs beyond the number of features
+                needed to fit a regression, rather than taking the largest past run
+        """
+        if history is None:
+            history = read_task_metrics([])
+        history = history.reindex(columns=read_task_metrics([]).columns.union(history.columns, sort=False))
+        self.history = history.loc[history.returncode == 0]
+        self.memory_margin = memory_margin
+        self.runtime_margin = runtime_margin
+        self.min_history = min_history
+
+    def predict(self, name, target, features):
+        """
+        Predicts memory or runtime for an operation, before the margin.
+
+        Args:
+            name: (str) name of the operation
+            target: (str) 'max_rss_gb' or 'runtime_seconds'
+            features: (Dict[str, float])
+
+        Returns:
+            (float) or None if the operation hasn't run before
+        """
+        runs = self.history.loc[(self.history.operation == name) & (self.history[target] > 0)]
+        if runs.empty:
+            return None
+        y = np.log(runs[target].values)
+        known = runs[FEATURES].median()
+        columns = [f for f in FEATURES if runs[f].notna().any() and runs[f].nunique() > 1]
+        if len(runs) < len(columns) + 1 + self.min_history:
+            return float(np.exp(y.max()))
+
+        x = np.log1p(runs[columns].fillna(known[columns]).values)
+        design = np.column_stack([np.ones(len(runs)), x])
+        beta, _, _, _ = np.linalg.lstsq(design, y, rcond=None)
+        residual_std = np.std(y - design @ beta, ddof=design.shape[1]) if len(runs) > design.shape[1] else 0.
+        point = np.r_[1., np.log1p([features.get(c, known[c]) for c in columns])]
+        return float(np.exp(point @ beta + residual_std))
+
+    def estimate(self, name, features, num_cores=None):
+        """
+        Executor parameters for an operation.
+
+        Args:
+            name: (str) name of the operation
+            features: (Dict[str, float]) from operation_features
+            num_cores: (int) cores, if the operation says how many it uses
+
+        Returns:
+            (Dict) executor parameters like DEFAULT_EXECUTOR_PARAMETERS
+        """
+        parameters = dict(DEFAULT_EXECUTOR_PARAMETERS)
+        parameters.update(OPERATION_PARAMETERS.get(name, dict()))
+        memory = self.predict(name, 'max_rss_gb', features)
+        if memory is not None:
+            parameters['m_mem_free'] = f'{max(math.ceil(memory * self.memory_margin), MIN_MEMORY_GB)}G'
+        runtime = self.predict(name, 'runtime_seconds', features)
+        if runtime is not None:
+            parameters['max_runtime_seconds'] = int(min(
+                max(runtime * self.runtime_margin, MIN_RUNTIME_SECONDS),
+                DEFAULT_EXECUTOR_PARAMETERS['max_runtime_seconds']
+            ))
+        if num_cores is not None:
+            parameters['num_cores'] = num_cores
+        return parameters
+
+
+def assign_resources(cascade_command, estimator, settings=None, location_dag=None, n_data=None):
+    """
+    Sets the executor parameters and features of each operation in a cascade command.
+
+    Args:
+        cascade_command: (cascade_at.cascade.cascade_commands.CascadeCommand)
+        estimator: (ResourceEstimator)
+        settings: (cascade_at.settings.settings_configuration.SettingsConfiguration)
+        location_dag: (cascade_at.inputs.locations.LocationDAG)
+        n_data: (int) number of rows of input data, if the inputs are configured
+
+    Returns:
+        (Dict[str, int]) the critical path priority of each command
+    """
+    for command, operation in cascade_command.task_dict.items():
+        operation.features = operation_features(
+            operation, settings=settings, location_dag=location_dag, n_data=n_data
+        )
+        operation.executor_parameters = estimator.estimate(
+            operation_name(operation), operation.features, num_cores=getattr(operation, 'n_pools', None)
+        )
+        LOG.info(f"Estimated {operation.executor_parameters['m_mem_free']} and "
+                 f"{operation.executor_parameters['max_runtime_seconds']}s for {command}.")
+    return critical_path_priorities(cascade_command.task_dict)
+
+
+def critical_path_priorities(task_dict):
+    """
+    The length in estimated runtime of the longest path from each operation
+    to the end of the cascade, including itself. Operations on the critical path
+    should start first.
+
+    Args:
+        task_dict: (Dict[str, CascadeOperation]) with upstream commands before downstream commands
+
+    Returns:
+        (Dict[str, int])
+    """
+    downstream = {command: list() for command in task_dict}
+    for command, operation in task_dict.items():
+        for upstream in operation.upstream_commands:
+            if upstream in downstream:
+                downstream[upstream].append(command)
+    priorities = dict()
+    for command in reversed(list(task_dict.keys())):
+        after = max((priorities[d] for d in downstream[command]), default=0)
+        priorities[command] = task_dict[command].executor_parameters['max_runtime_seconds'] + after
+    return priorities
+
+
+def critical_path_order(task_dict, priorities):
+    """
+    Orders the commands so that each comes after its upstream commands and,
+    of the commands that are ready to run, the one with the highest priority is first.
+
+    Args:
+        task_dict: (Dict[str, CascadeOperation])
+        priorities: (Dict[str, int]) from critical_path_priorities
+
+    Returns:
+        (List[str])
+    """
+    index = {command: i for i, command in enumerate(task_dict)}
+    waiting = {command: {u for u in operation.upstream_commands if u in task_dict}
+               for command, operation in task_dict.items()}
+    ready = [(-priorities[c], index[c], c) for c, upstream in waiting.items() if not upstream]
+    heapq.heapify(ready)
+    order = list()
+    while ready:
+        _, _, command = heapq.heappop(ready)
+        order.append(command)
+        for c, upstream in waiting.items():
+            if command in upstream:
+                upstream.remove(command)
+                if not upstream:
+                    heapq.heappush(ready, (-priorities[c], index[c], c))
+    return order
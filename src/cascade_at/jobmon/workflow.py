@@ -3,6 +3,7 @@ import getpass
 
 from cascade_at.core.db import swarm
 from cascade_at.core.log import get_loggers
+from cascade_at.jobmon.resources import critical_path_order
 
 LOG = get_loggers(__name__)
 
@@ -48,12 +49,16 @@ def bash_task_from_cascade_operation(co):
     )
 
 
-def jobmon_workflow_from_cascade_command(cc, context):
+def jobmon_workflow_from_cascade_command(cc, context, priorities=None):
     """
-    Create a jobmon workflow from a cascade command (cc for short)
+    Create a jobmon workflow from a cascade command (cc for short).
+    Tasks are added in critical path order if there are priorities,
+    so that the scheduler sees the longest chains first.
 
     :param cc: (cascade_at.cascade.cascade_commands.CascadeCommand)
     :param context: (cascade_at.context.model_context.Context)
+    :param priorities: (Dict[str, int]) critical path priorities from
+        cascade_at.jobmon.resources.assign_resources
     :return: jobmon.client.swarm.workflow.workflow.Workflow
     """
     user = getpass.getuser()
@@ -79,6 +84,10 @@ def jobmon_workflow_from_cascade_command(cc, context):
         for upstream in task.upstream_commands:
             task.add_upstream(bash_tasks.get(upstream))
 
-    wf.add_tasks(list(bash_tasks.values()))
+    if priorities is None:
+        order = list(bash_tasks.keys())
+    else:
+        order = critical_path_order(cc.task_dict, priorities)
+    wf.add_tasks([bash_tasks[command] for command in order])
     return wf
 
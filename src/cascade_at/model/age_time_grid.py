@@ -1,3 +1,4 @@
+from copy import copy
 from datetime import timedelta
 from itertools import product
 from math import nan, inf
@@ -75,6 +76,17 @@ class AgeTimeGrid:
     def mulstd(self):
         return self._mulstd
 
+    def clone(self):
+        """A copy of this grid that can be changed without changing this one.
+        This copies the data frames rather than building the grid again."""
+        other = copy(self)
+        other.ages = self.ages.copy()
+        other.times = self.times.copy()
+        other.columns = list(self.columns)
+        other.grid = self.grid.copy()
+        other._mulstd = {kind: mulstd.copy() for kind, mulstd in self._mulstd.items()}
+        return other
+
     def age_time(self):
         yield from zip(np.repeat(self.ages, len(self.times)), np.tile(self.times, len(self.ages)))
 
@@ -6,8 +6,8 @@ import numpy as np
 from cascade_at.core.log import get_loggers
 from cascade_at.model.model import Model
 from cascade_at.model.utilities.grid_helpers import smooth_grid_from_smoothing_form
-from cascade_at.model.utilities.grid_helpers import rectangular_data_to_var
-from cascade_at.model.utilities.grid_helpers import constraint_from_rectangular_data
+from cascade_at.model.utilities.grid_helpers import interpolate_rectangular_data
+from cascade_at.model.utilities.grid_helpers import constant_grid
 
 LOG = get_loggers(__name__)
 
@@ -41,9 +41,21 @@ class Alchemy:
         self.settings = settings
         self.age_time_grid = self.construct_age_time_grid()
         self.single_age_time_grid = self.construct_single_age_time_grid()
+        self._grid_templates = dict()
 
         self.model = None
 
+    def __getstate__(self):
+        # The templates are keyed on the ids of the forms, which
+        # don't survive pickling, so they are made again after.
+        state = self.__dict__.copy()
+        state['_grid_templates'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault('_grid_templates', dict())
+        self.__dict__.update(state)
+
     def construct_age_time_grid(self):
         """
         Construct a DEFAULT age-time grid,
@@ -76,7 +88,10 @@ class Alchemy:
 
     def get_smoothing_grid(self, rate):
         """
-        Construct a smoothing grid for any rate in the model.
+        Construct a smoothing grid for any rate, covariate multiplier or
+        random effect in the model. The settings form is made into a grid
+        the first time it is asked for, and kept as a template. Each call gets
+        a copy of the template, so it is safe to change the priors on it.
 
         Parameters:
             rate: (cascade_at.settings.settings_configuration.Smoothing)
@@ -84,11 +99,15 @@ class Alchemy:
         Returns: (cascade_at.model.smooth_grid.SmoothGrid)
 
         """
-        return smooth_grid_from_smoothing_form(
-            default_age_time=self.age_time_grid,
-            single_age_time=self.single_age_time_grid,
-            smooth=rate
-        )
+        key = id(rate)
+        if key not in self._grid_templates:
+            # Keep the form with the template so that its id isn't reused.
+            self._grid_templates[key] = (rate, smooth_grid_from_smoothing_form(
+                default_age_time=self.age_time_grid,
+                single_age_time=self.single_age_time_grid,
+                smooth=rate
+            ))
+        return self._grid_templates[key][1].clone()
 
     def get_all_rates_grids(self):
         """
@@ -134,7 +153,7 @@ class Alchemy:
             omega_df: (pd.DataFrame)
             update_prior: (dict) of (dict)
         """
-        children = list(location_dag.dag.successors(parent_location_id))
+        children = location_dag.children(parent_location_id)
         model = Model(
             nonzero_rates=self.settings.rate,
             parent_location=parent_location_id,
@@ -152,8 +171,8 @@ class Alchemy:
                     prior = update_prior[smooth.rate]
                     # Check that the prior grid lines up with this rate
                     # grid. If it doesn't, we have a problem.
-                    assert (prior['ages'] == rate_grid.ages)
-                    assert (prior['times'] == rate_grid.times)
+                    assert np.array_equal(prior['ages'], rate_grid.ages)
+                    assert np.array_equal(prior['times'], rate_grid.times)
                     # For each of the types of priors, update rate_grid
                     # with the new prior information from the update_prior
                     # object that has info from a different model fit
@@ -176,11 +195,7 @@ class Alchemy:
         
         # Second construct the covariate grids
         for mulcov in covariate_specs.covariate_multipliers:
-            grid = smooth_grid_from_smoothing_form(
-                    default_age_time=self.age_time_grid,
-                    single_age_time=self.single_age_time_grid,
-                    smooth=mulcov.grid_spec
-                )
+            grid = self.get_smoothing_grid(rate=mulcov.grid_spec)
             model[mulcov.group][mulcov.key] = grid
 
         # Construct the random effect grids, based on the parent location
@@ -188,11 +203,7 @@ class Alchemy:
         if self.settings.random_effect:
             random_effect_by_rate = defaultdict(list)
             for smooth in self.settings.random_effect:
-                re_grid = smooth_grid_from_smoothing_form(
-                    default_age_time=self.age_time_grid,
-                    single_age_time=self.single_age_time_grid,
-                    smooth=smooth
-                )
+                re_grid = self.get_smoothing_grid(rate=smooth)
                 if not smooth.is_field_unset("location") and smooth.location in model.child_location:
                     location = smooth.location
                 else:
@@ -213,32 +224,25 @@ class Alchemy:
             if omega_df is None:
                 raise RuntimeError("Need an omega data frame in order to constrain omega.")
             
-            parent_omega = omega_df.loc[omega_df.location_id == parent_location_id].copy()
-            if parent_omega.empty:
-                raise RuntimeError("No omega values for location {parent_location_id}.")
-
-            omega = rectangular_data_to_var(gridded_data=parent_omega)
-            model.rate["omega"] = constraint_from_rectangular_data(
-                rate_var=omega,
-                default_age_time=self.age_time_grid
+            ages = np.sort(np.array(self.age_time_grid["age"], dtype=np.float))
+            times = np.sort(np.array(self.age_time_grid["time"], dtype=np.float))
+            omega = interpolate_rectangular_data(
+                gridded_data=omega_df.loc[omega_df.location_id.isin([parent_location_id] + list(children))],
+                ages=ages, times=times, by="location_id"
             )
-            
-            locations = set(omega_df.location_id.unique().tolist())
-            children_without_omega = set(children) - set(locations)
+            if parent_location_id not in omega:
+                raise RuntimeError(f"No omega values for location {parent_location_id}.")
+
+            model.rate["omega"] = constant_grid(omega[parent_location_id], default_age_time=self.age_time_grid)
+
+            children_without_omega = set(children) - set(omega.keys())
             if children_without_omega:
                 LOG.warning(f"Children of {parent_location_id} missing omega {children_without_omega}"
                             f"so not including child omega constraints")
             else:
                 for child in children:
-                    child_omega = omega_df.loc[omega_df.location_id == child].copy()
-                    assert not child_omega.empty
-                    child_rate = rectangular_data_to_var(gridded_data=child_omega)
-
-                    def child_effect(age, time):
-                        return np.log(child_rate(age, time) / omega(age, time))
-                    
-                    model.random_effect[("omega", child)] = constraint_from_rectangular_data(
-                        rate_var=child_effect,
+                    model.random_effect[("omega", child)] = constant_grid(
+                        np.log(omega[child] / omega[parent_location_id]),
                         default_age_time=self.age_time_grid
                     )
         return model
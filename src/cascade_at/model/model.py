@@ -20,7 +20,7 @@ class Model(DismodGroups):
         """
         >>> from cascade_at.inputs.locations import LocationDAG
         >>> locations = LocationDAG(location_set_version_id=429)
-        >>> m = Model(["chi", "omega", "iota"], 6, locations.dag.successors(6))
+        >>> m = Model(["chi", "omega", "iota"], 6, locations.children(6))
 
         Args:
             nonzero_rates (List[str]): A list of rates, using the Dismod-AT
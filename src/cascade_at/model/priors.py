@@ -2,11 +2,13 @@ from copy import copy
 from functools import total_ordering
 
 import numpy as np
-import scipy.stats as stats
 
+from cascade_at.core.lazy import LazyModule
 from cascade_at.core.log import get_loggers
 LOG = get_loggers(__name__)
 
+stats = LazyModule("scipy.stats")
+
 # A description of how dismod interprets these distributions and their parameters can be found here:
 # https://bradbell.github.io/dismod_at/doc/prior_table.htm
 
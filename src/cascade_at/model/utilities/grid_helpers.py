@@ -36,6 +36,118 @@ def rectangular_data_to_var(gridded_data):
     return guess
 
 
+def interpolation_weights(knots, points):
+    """
+    Weights for linear interpolation from values at sorted knots to values at points,
+    as a matrix so that ``weights @ values`` gives the values at the points.
+    Points outside the knots get the value of the nearest knot, the same
+    way that a Var is constant outside of its grid.
+
+    Args:
+        knots (np.ndarray): sorted points where the values are known
+        points (np.ndarray): points at which to interpolate
+
+    Returns:
+        np.ndarray: of shape (len(points), len(knots))
+    """
+    knots = np.asarray(knots, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64)
+    weights = np.zeros((len(points), len(knots)), dtype=np.float64)
+    if len(knots) == 1:
+        weights[:, 0] = 1.
+        return weights
+    clamped = np.clip(points, knots[0], knots[-1])
+    upper = np.clip(np.searchsorted(knots, clamped, side="right"), 1, len(knots) - 1)
+    lower = upper - 1
+    fraction = (clamped - knots[lower]) / (knots[upper] - knots[lower])
+    rows = np.arange(len(points))
+    weights[rows, lower] = 1 - fraction
+    weights[rows, upper] += fraction
+    return weights
+
+
+def interpolate_rectangular_data(gridded_data, ages, times, by="location_id"):
+    """
+    Interpolates rectangular data, like the omega data, for many locations at once
+    onto an age-time grid. This is the same bilinear interpolation that
+    rectangular_data_to_var and Var do, but the data for all locations with the
+    same ages and times is interpolated with one product of arrays.
+
+    Args:
+        gridded_data (pd.DataFrame): with age_lower, age_upper, time_lower, time_upper,
+            mean and the ``by`` column, that has a complete set of ages-cross-times
+            for each value of ``by``
+        ages (np.ndarray): sorted ages at which to interpolate
+        times (np.ndarray): sorted times at which to interpolate
+        by (str): column that identifies each set of rectangular data
+
+    Returns:
+        Dict[int, np.ndarray]: an array of shape (len(ages), len(times)) for each value of ``by``
+    """
+    try:
+        data = pd.DataFrame({
+            by: gridded_data[by].values,
+            "age": gridded_data[["age_lower", "age_upper"]].mean(axis=1).values,
+            "time": gridded_data[["time_lower", "time_upper"]].mean(axis=1).values,
+            "mean": gridded_data["mean"].values
+        })
+    except KeyError:
+        LOG.error(f"Data to interpolate has columns {gridded_data.columns}")
+        raise RuntimeError(
+            f"Wrong columns in interpolate_rectangular_data {gridded_data.columns}")
+    if data.empty:
+        return dict()
+
+    table = data.set_index([by, "age", "time"])["mean"].unstack("time").sort_index(axis=1)
+    keys = table.index.get_level_values(by).unique()
+    knot_ages = np.sort(data.age.unique())
+    table = table.reindex(pd.MultiIndex.from_product([keys, knot_ages], names=[by, "age"]))
+    if not table.isnull().values.any():
+        # The usual case, where every location has the same ages and times.
+        groups = [(keys, knot_ages, table.columns.values, table.values.reshape((len(keys), len(knot_ages), -1)))]
+    else:
+        groups = list()
+        for key in keys:
+            rectangle = table.loc[key].dropna(how="all").dropna(axis=1, how="all")
+            if rectangle.isnull().values.any():
+                raise RuntimeError(f"Rectangular data for {by} {key} doesn't have every age and time.")
+            groups.append(([key], rectangle.index.values, rectangle.columns.values, rectangle.values[np.newaxis]))
+
+    interpolated = dict()
+    for group_keys, knot_ages, knot_times, values in groups:
+        age_weights = interpolation_weights(knot_ages, ages)
+        time_weights = interpolation_weights(knot_times, times)
+        result = np.einsum("ia,kat,jt->kij", age_weights, values, time_weights)
+        interpolated.update(zip(group_keys, result))
+    return interpolated
+
+
+def constant_grid(values, default_age_time):
+    """
+    Makes a SmoothGrid whose value priors are Constant, set from an array
+    of values at every age and time.
+
+    Args:
+        values (np.ndarray): of shape (ages, times), in the order of the sorted ages and times
+        default_age_time: dictionary with the ages and times of the grid
+
+    Returns:
+        SmoothGrid
+    """
+    grid = SmoothGrid(ages=default_age_time["age"], times=default_age_time["time"])
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape != (len(grid.ages), len(grid.times)):
+        raise ValueError(f"Values of shape {values.shape} don't match a grid of "
+                         f"{len(grid.ages)} ages and {len(grid.times)} times.")
+    # The grid rows are every age crossed with every time, in that order.
+    values = values.ravel()
+    prior = grid.value.grid
+    prior["density"] = Constant.density
+    for column in ["mean", "lower", "upper"]:
+        prior[column] = values
+    return grid
+
+
 def constraint_from_rectangular_data(rate_var, default_age_time):
     """Takes data on a complete set of ages and times, makes a constraint grid.
 
@@ -43,10 +155,10 @@ def constraint_from_rectangular_data(rate_var, default_age_time):
         rate_var: A function of age and time to represent a rate.
         default_age_time:
     """
-    omega_grid = SmoothGrid(ages=default_age_time["age"], times=default_age_time["time"])
-    for age, time in omega_grid.age_time():
-        omega_grid.value[age, time] = Constant(rate_var(age, time))
-    return omega_grid
+    ages = np.sort(np.array(default_age_time["age"], dtype=np.float64))
+    times = np.sort(np.array(default_age_time["time"], dtype=np.float64))
+    values = np.array([[rate_var(age, time) for time in times] for age in ages], dtype=np.float64)
+    return constant_grid(values, default_age_time)
 
 
 def smooth_grid_from_smoothing_form(default_age_time, single_age_time, smooth):
@@ -1,9 +1,11 @@
 import numpy as np
-from scipy.interpolate import RectBivariateSpline, interp1d
 
+from cascade_at.core.lazy import LazyModule
 from cascade_at.dismod.constants import PriorKindEnum
 from cascade_at.model.age_time_grid import AgeTimeGrid
 
+interpolate = LazyModule("scipy.interpolate")
+
 
 class Var(AgeTimeGrid):
     """A Var is a function of age and time, defined by values on a grid.
@@ -167,7 +169,7 @@ class Var(AgeTimeGrid):
         time = np.sort(np.unique(age_time_df.time.values))
         if len(age) > 1 and len(time) > 1:
             heights = ordered[self._column_name].values.reshape(len(age), len(time))
-            spline = RectBivariateSpline(age, time, heights, kx=1, ky=1)
+            spline = interpolate.RectBivariateSpline(age, time, heights, kx=1, ky=1)
 
             def bivariate_function(x, y):
                 return spline(x, y)[0]
@@ -177,7 +179,7 @@ class Var(AgeTimeGrid):
         elif len(age) * len(time) > 1:
             fill = (ordered[self._column_name].values[0], ordered[self._column_name].values[-1])
             independent = age if len(age) != 1 else time
-            spline = interp1d(
+            spline = interpolate.interp1d(
                 independent, ordered[self._column_name].values, kind="linear", bounds_error=False, fill_value=fill)
 
             def age_spline(x, _):
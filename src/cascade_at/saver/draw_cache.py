@@ -0,0 +1,201 @@
+"""
+A cache of the prior draws that a parent model hands off to its children.
+
+All of the (age, time, draw) arrays for every child location, sex and rate
+are written once, into a single .npy file, with a JSON manifest that says
+where each array is in the file. Child tasks memory-map the file and read
+only their own arrays, rather than each reading the parent's predict table.
+
+Each write makes a new draw file with its own name, and the manifest names the
+draw file that goes with it, so replacing the manifest swaps both at once.
+The manifest also has a fingerprint of the parent database that the draws came
+from, and the cache is ignored if the database has changed since, for example
+because the parent was fit again.
+"""
+import json
+import os
+import uuid
+
+import numpy as np
+
+from cascade_at.core.log import get_loggers
+
+LOG = get_loggers(__name__)
+
+DRAW_PREFIX = 'prior_draws'
+MANIFEST_FILE = 'prior_draws.json'
+
+
+def source_fingerprint(path):
+    """
+    A fingerprint of the database that the draws come from. Dismod commands
+    write to the database, so a database that was fit again has a new one.
+
+    Args:
+        path: (pathlib.Path)
+
+    Returns:
+        (Dict) or None if the database isn't there
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class DrawCache:
+    def __init__(self, directory, source=None):
+        """
+        Draw cache in a directory, usually the database folder of the parent.
+
+        Args:
+            directory: (pathlib.Path)
+            source: (pathlib.Path) the database that the draws come from. If it is
+                given, writes record its fingerprint and reads ignore draws that
+                don't match it.
+        """
+        self.directory = directory
+        self.source = source
+        self.manifest_file = directory / MANIFEST_FILE
+        self._manifest = None
+        self._draws = None
+
+    @staticmethod
+    def _key(location_id, sex_id):
+        return f'{int(location_id)}_{int(sex_id)}'
+
+    def write(self, draws):
+        """
+        Writes the draws for all of the children. The draws go into a new file,
+        and then the manifest that names it replaces the old manifest, so that
+        a reader sees either the old cache or the new one, never a partial cache
+        or a mix of the two. Draw files from earlier writes are then removed.
+
+        Args:
+            draws: (dict) from (location_id, sex_id) to the dictionary of draws
+                for each rate that ``DismodExtractor.gather_draws_for_prior_grid`` makes
+
+        Returns:
+            (int) the number of arrays written
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = dict()
+        offset = 0
+        for (location_id, sex_id), rate_dict in draws.items():
+            entries = dict()
+            for rate, rate_draws in rate_dict.items():
+                shape = (len(rate_draws['ages']), len(rate_draws['times']), rate_draws['n_draws'])
+                entries[rate] = {
+                    'offset': offset,
+                    'shape': list(shape),
+                    'ages': np.asarray(rate_draws['ages'], dtype=np.float64).tolist(),
+                    'times': np.asarray(rate_draws['times'], dtype=np.float64).tolist()
+                }
+                offset += int(np.prod(shape))
+            manifest[self._key(location_id, sex_id)] = entries
+
+        draw_file = self.directory / f'{DRAW_PREFIX}.{uuid.uuid4().hex}.npy'
+        temporary_draws = self.directory / f'.{draw_file.name}.tmp'
+        data = np.lib.format.open_memmap(temporary_draws, mode='w+', dtype=np.float64, shape=(offset,))
+        for (location_id, sex_id), rate_dict in draws.items():
+            for rate, entry in manifest[self._key(location_id, sex_id)].items():
+                size = int(np.prod(entry['shape']))
+                data[entry['offset']:entry['offset'] + size] = np.asarray(rate_dict[rate]['value']).ravel()
+        data.flush()
+        del data
+        os.replace(temporary_draws, draw_file)
+
+        temporary_manifest = self.directory / f'.{MANIFEST_FILE}.{os.getpid()}.tmp'
+        with open(temporary_manifest, 'w') as f:
+            json.dump({
+                'draw_file': draw_file.name,
+                'source': source_fingerprint(self.source) if self.source is not None else None,
+                'draws': manifest
+            }, f)
+        os.replace(temporary_manifest, self.manifest_file)
+
+        for old_file in self.directory.glob(f'{DRAW_PREFIX}.*.npy'):
+            if old_file != draw_file:
+                # Readers that already mapped the old file keep it until they are done.
+                old_file.unlink()
+
+        n_arrays = sum(len(v) for v in manifest.values())
+        LOG.info(f"Wrote {n_arrays} prior draw arrays for {len(manifest)} locations and sexes "
+                 f"to {draw_file}.")
+        self._manifest = None
+        self._draws = None
+        return n_arrays
+
+    @property
+    def manifest(self):
+        """
+        The manifest, or an empty one if there isn't a cache or
+        it is from a different version of the source database.
+        """
+        if self._manifest is None:
+            self._manifest = {'draw_file': None, 'source': None, 'draws': dict()}
+            if self.manifest_file.exists():
+                with open(self.manifest_file) as f:
+                    manifest = json.load(f)
+                if 'draws' not in manifest:
+                    LOG.info(f"Ignoring the prior draw cache in {self.directory}, which has an old layout.")
+                elif self.source is not None and manifest['source'] != source_fingerprint(self.source):
+                    LOG.info(f"Ignoring the prior draw cache in {self.directory} because "
+                             f"{self.source} has changed since it was written.")
+                else:
+                    self._manifest = manifest
+        return self._manifest
+
+    def has(self, location_id, sex_id, rates):
+        """
+        Whether the cache has draws for all of these rates for a location and sex.
+        """
+        entries = self.manifest['draws'].get(self._key(location_id, sex_id), dict())
+        return all(r in entries for r in rates)
+
+    def read(self, location_id, sex_id, rates, value=True, dage=True, dtime=True):
+        """
+        Reads the draws for a location and sex, in the same form as
+        ``DismodExtractor.gather_draws_for_prior_grid``. The value arrays
+        are read-only views of the memory-mapped file.
+
+        Args:
+            location_id: (int)
+            sex_id: (int)
+            rates: List[str] list of rates to get the draws for
+            value: (bool) calculate value priors
+            dage: (bool) calculate dage priors
+            dtime: (bool) calculate dtime priors
+
+        Returns:
+            (dict) for each rate, or None if the cache doesn't have them
+        """
+        if not self.has(location_id, sex_id, rates):
+            return None
+        if self._draws is None:
+            try:
+                self._draws = np.load(self.directory / self.manifest['draw_file'], mmap_mode='r')
+            except FileNotFoundError:
+                # Another write replaced the cache after the manifest was read.
+                LOG.info(f"The prior draw cache in {self.directory} was replaced while reading it.")
+                return None
+        entries = self.manifest['draws'][self._key(location_id, sex_id)]
+
+        rate_dict = dict()
+        for r in rates:
+            entry = entries[r]
+            size = int(np.prod(entry['shape']))
+            draw_data = self._draws[entry['offset']:entry['offset'] + size].reshape(entry['shape'])
+            rate_dict[r] = {
+                'ages': np.array(entry['ages']),
+                'times': np.array(entry['times']),
+                'n_draws': entry['shape'][2]
+            }
+            if value:
+                rate_dict[r]['value'] = draw_data
+            if dage:
+                rate_dict[r]['dage'] = np.diff(draw_data, n=1, axis=0)
+            if dtime:
+                rate_dict[r]['dtime'] = np.diff(draw_data, n=1, axis=1)
+        return rate_dict
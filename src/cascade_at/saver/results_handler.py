@@ -59,6 +59,40 @@ class ResultsHandler:
                 ].copy()
                 subset.to_csv(directory / str(loc) / f'{loc}_{sex}.csv')
 
+    def save_sample_draws(self, chunks, directory):
+        """
+        Saves draws by location and sex in .csv files, one chunk
+        at a time, so that all of the draws are never in memory at once.
+        Files that are there from before are replaced.
+
+        Args:
+            chunks: (Iterable[pd.DataFrame]) with the id columns and a column for each draw
+            directory: (pathlib.Path)
+
+        Returns:
+            (List[pathlib.Path]) the files that were written
+        """
+        LOG.info(f"Saving draws to {directory.absolute()}")
+        written = list()
+        for df in chunks:
+            df['model_version_id'] = self.model_version_id
+            validated_df = self.validate_results(df=df)
+            for loc in validated_df.location_id.unique().tolist():
+                os.makedirs(directory / str(loc), exist_ok=True)
+                for sex in validated_df.sex_id.unique().tolist():
+                    subset = validated_df.loc[
+                        (validated_df.location_id == loc) &
+                        (validated_df.sex_id == sex)
+                    ]
+                    if subset.empty:
+                        continue
+                    path = directory / str(loc) / f'{loc}_{sex}.csv'
+                    first = path not in written
+                    subset.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+                    if first:
+                        written.append(path)
+        return written
+
     @staticmethod
     def upload_summaries(directory, conn_def):
         """
@@ -326,6 +326,27 @@ class Policies(Form):
     gbd_round_id = IntField(nullable=True, default=6)
 
 
+class DataReduction(Form):
+    strategy = OptionField(
+        ["bin_years", "bin_ages", "cap_rows", "pool_observations"], display="Data reduction strategy"
+    )
+    num_years = IntField(nullable=True, display="Years to combine")
+    age_bins = StringListField(constructor=float, nullable=True, display="Age band edges")
+    max_rows = IntField(nullable=True, display="Most rows for each location and measure")
+    age_width = FloatField(nullable=True, display="Width of age bins for pooling")
+    time_width = FloatField(nullable=True, display="Width of time bins for pooling")
+
+    def _full_form_validation(self, root):
+        errors = []
+
+        if self.strategy == "bin_ages" and self.is_field_unset("age_bins"):
+            errors.append("Binning ages needs the age band edges.")
+        if self.strategy == "cap_rows" and self.is_field_unset("max_rows"):
+            errors.append("Capping rows needs the most rows for each location and measure.")
+
+        return errors
+
+
 class SettingsConfiguration(Form):
     """ The root Form of the whole settings inputs tree.
 
@@ -359,4 +380,5 @@ class SettingsConfiguration(Form):
     data_cv_by_integrand = FormList(DataCV)
     data_eta_by_integrand = FormList(DataEta)
     data_density_by_integrand = FormList(DataDensity)
+    data_reduction = FormList(DataReduction, nullable=True, display="Data volume reduction")
     config_version = StrField(nullable=True, display="Settings version")
@@ -36,6 +36,16 @@ def test_fit_both():
     )
 
 
+def test_fit_both_index_tables():
+    obj = FitBoth(
+        model_version_id=0,
+        parent_location_id=1,
+        sex_id=1,
+        index_tables=True
+    )
+    assert obj.command.endswith('predict-fit_var --index-tables ')
+
+
 def test_sample_simulate():
     obj = SampleSimulate(
         model_version_id=0,
@@ -78,3 +88,29 @@ def test_cleanup():
         f'cleanup '
         f'-model-version-id 0'
     )
+
+
+def test_fit_both_warm_start():
+    obj = FitBoth(
+        model_version_id=0,
+        parent_location_id=102,
+        sex_id=1,
+        prior_parent=1,
+        prior_sex=1,
+        warm_start=True,
+        skip_fit_fixed=True
+    )
+    assert obj.command.endswith(
+        'predict-fit_var --prior-parent 1 --prior-sex 1 --warm-start --skip-fit-fixed '
+    )
+
+
+def test_fit_both_batch():
+    obj = FitBoth(
+        model_version_id=0,
+        parent_location_id=[102, 103],
+        sex_id=[1, 2]
+    )
+    assert obj.command.startswith(
+        'dismod_db -model-version-id 0 -parent-location-id 102 103 -sex-id 1 2 --commands'
+    )
@@ -0,0 +1,87 @@
+import os
+import sqlite3
+
+import pytest
+
+from cascade_at.cascade.cascade_operations import ConfigureInputs, FitBoth, FormatAndUpload, CleanUp
+from cascade_at.cascade.completion import (
+    FileOutput, DatabaseOutput, CompletionManifest, input_hash, is_complete
+)
+from cascade_at.context.model_context import Context
+
+
+@pytest.fixture
+def context(tmp_path):
+    return Context(model_version_id=0, make=True, configure_application=False, root_directory=tmp_path)
+
+
+def write_db(path, tables):
+    os.makedirs(path.parent, exist_ok=True)
+    connection = sqlite3.connect(str(path))
+    for table, n_rows in tables.items():
+        connection.execute(f"CREATE TABLE {table} (value REAL)")
+        connection.executemany(f"INSERT INTO {table} VALUES (?)", [(1.,)] * n_rows)
+    connection.commit()
+    connection.close()
+
+
+def test_database_output(tmp_path):
+    path = tmp_path / 'dismod.db'
+    assert not DatabaseOutput(path, tables=['fit_var']).is_valid()
+    write_db(path, {'fit_var': 2, 'predict': 0})
+    assert DatabaseOutput(path, tables=['fit_var']).is_valid()
+    assert not DatabaseOutput(path, tables=['fit_var', 'predict']).is_valid()
+    assert not DatabaseOutput(path, tables=['sample']).is_valid()
+
+
+def test_manifest(tmp_path):
+    manifest = CompletionManifest(tmp_path / 'completed.json')
+    manifest.record('cleanup', 'abc')
+    assert manifest.has('cleanup', 'abc')
+    assert not manifest.has('cleanup', 'abd')
+    assert CompletionManifest(tmp_path / 'completed.json').has('cleanup', 'abc')
+
+
+def test_input_hash(tmp_path):
+    path = tmp_path / 'inputs.p'
+    missing = input_hash('command', [path])
+    path.write_text('inputs')
+    present = input_hash('command', [path])
+    assert missing != present
+    assert present != input_hash('other command', [path])
+    os.utime(path, ns=(0, 0))
+    assert present != input_hash('command', [path])
+
+
+def test_operation_outputs(context):
+    fit = FitBoth(model_version_id=0, parent_location_id=[1, 2], sex_id=2, prior_parent=3, prior_sex=2)
+    assert [o.path for o in fit.outputs(context)] == [
+        context.db_file(location_id=1, sex_id=2, make=False), context.db_file(location_id=2, sex_id=2, make=False)
+    ]
+    assert fit.inputs(context)[-1] == context.db_file(location_id=3, sex_id=2, make=False)
+    upload = FormatAndUpload(model_version_id=0, parent_location_id=1, sex_id=2)
+    assert upload.outputs(context)[0].path == context.draw_dir / '1' / '1_2.csv'
+    assert CleanUp(model_version_id=0).outputs(context) == []
+
+
+def test_is_complete(context):
+    manifest = CompletionManifest(context.model_dir / 'completed.json')
+    configure = ConfigureInputs(model_version_id=0)
+    fit = FitBoth(model_version_id=0, parent_location_id=1, sex_id=2)
+    cleanup = CleanUp(model_version_id=0)
+
+    context.inputs_file.write_text('inputs')
+    context.settings_file.write_text('settings')
+    db = context.db_file(location_id=1, sex_id=2, make=False)
+    write_db(db, {'fit_var': 1, 'predict': 1})
+    for operation in [configure, fit, cleanup]:
+        assert not is_complete(operation, context, manifest)
+        manifest.record(operation.command, input_hash(operation.command, operation.inputs(context)))
+
+    assert is_complete(configure, context, manifest)
+    assert is_complete(fit, context, manifest)
+    assert not is_complete(cleanup, context, manifest)
+
+    # The inputs are newer than the database.
+    os.utime(db, (1, 1))
+    assert not is_complete(fit, context, manifest)
@@ -273,7 +273,8 @@ def df(mi, settings):
         measurement_inputs=mi,
         grid_alchemy=alchemy,
         parent_location_id=70,
-        sex_id=2
+        sex_id=2,
+        keep_held_out=True
     )
     d.fill_for_parent_child()
     return d
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.core.compact import compact_frame, frame_memory, upcast_frame
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.inputs.covariate_data import CovariateData
+from cascade_at.inputs.locations import LocationDAG
+
+
+@pytest.fixture
+def frame():
+    n = 1000
+    return pd.DataFrame({
+        'location_id': np.repeat(np.arange(100, 200), 10),
+        'year_id': np.tile(np.arange(1990, 2000), 100),
+        'sex_id': 2,
+        'measure': np.tile(['prevalence', 'mtspecific'], n // 2),
+        'name': [str(i) for i in range(n)],
+        'mean_value': np.linspace(0., 1., n),
+    })
+
+
+def test_compact_frame(frame):
+    compact = compact_frame(frame)
+    assert compact.location_id.dtype == np.int16
+    assert compact.sex_id.dtype == np.int8
+    assert compact.mean_value.dtype == np.float32
+    assert isinstance(compact.measure.dtype, pd.CategoricalDtype)
+    # Mostly unique strings aren't worth a categorical.
+    assert compact.name.dtype == object
+    assert frame_memory(compact) < frame_memory(frame)
+    assert frame.mean_value.dtype == np.float64
+
+
+def test_compact_float_columns(frame):
+    frame['other'] = 1.
+    compact = compact_frame(frame, float_columns=['mean_value'])
+    assert compact.mean_value.dtype == np.float32
+    assert compact.other.dtype == np.float64
+
+
+def test_compact_halves_memory(frame):
+    numbers = frame.drop(columns=['name'])
+    assert frame_memory(compact_frame(numbers)) * 2 <= frame_memory(numbers)
+
+
+def test_upcast_frame(frame):
+    upcast = upcast_frame(compact_frame(frame))
+    assert upcast.dtypes.to_dict() == frame.dtypes.to_dict()
+    pd.testing.assert_frame_equal(upcast.drop(columns=['mean_value']), frame.drop(columns=['mean_value']))
+    np.testing.assert_allclose(upcast.mean_value, frame.mean_value, rtol=1e-6)
+    assert upcast_frame(frame) is frame
+
+
+def test_upcast_categorical_with_missing():
+    df = pd.DataFrame({'node_id': pd.Categorical([1, np.nan, 1])})
+    assert upcast_frame(df).node_id.dtype == np.float64
+
+
+def test_write_compact_table(tmp_path, frame):
+    db = DismodIO(path=tmp_path / 'compact.db')
+    db.integrand = compact_frame(pd.DataFrame({
+        'integrand_name': ['prevalence', 'prevalence', 'mtspecific'], 'minimum_meas_cv': [0.1, 0.1, 0.2]
+    }))
+    integrand = db.integrand
+    assert integrand.minimum_meas_cv.dtype == np.float64
+    assert integrand.integrand_name.tolist() == ['prevalence', 'prevalence', 'mtspecific']
+    np.testing.assert_allclose(integrand.minimum_meas_cv, [0.1, 0.1, 0.2])
+
+
+def test_compact_covariate_locations():
+    hierarchy = LocationDAG(df=pd.DataFrame({
+        'location_id': [1, 4, 31, 32], 'parent_id': [1, 1, 4, 4], 'location_name': ['Global', 'A', 'AA', 'AB']
+    }))
+    pop = pd.DataFrame(
+        [(l, a, s, 2000) for l in [1, 4, 31, 32] for a in [2, 3] for s in [1, 2, 3]],
+        columns=['location_id', 'age_group_id', 'sex_id', 'year_id']
+    )
+    pop['population'] = np.where(pop.age_group_id == 2, 1., 3.)
+    cov = pop.loc[pop.location_id.isin([31, 32]), ['location_id', 'year_id', 'age_group_id', 'sex_id']].copy()
+    cov['mean_value'] = np.where(cov.location_id == 31, 1., 0.)
+
+    full = CovariateData.complete_covariate_locations(
+        cov_df=cov, pop_df=pop, location_dag=hierarchy, locations=[1, 4, 31, 32]
+    )
+    compact = CovariateData.complete_covariate_locations(
+        cov_df=compact_frame(cov), pop_df=compact_frame(pop), location_dag=hierarchy, locations=[1, 4, 31, 32]
+    )
+    columns = ['location_id', 'age_group_id', 'sex_id']
+    full = full.sort_values(columns).reset_index(drop=True)
+    compact = upcast_frame(compact).sort_values(columns).reset_index(drop=True)
+    pd.testing.assert_frame_equal(compact[columns], full[columns])
+    np.testing.assert_allclose(compact.mean_value, full.mean_value, rtol=1e-6)
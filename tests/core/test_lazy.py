@@ -0,0 +1,33 @@
+import sys
+
+import pytest
+
+from cascade_at.core.db import ModuleProxy
+from cascade_at.core.lazy import LazyModule
+
+
+def test_lazy_module_imports_on_use():
+    module = LazyModule("json")
+    assert not module.loaded
+    assert module.dumps([1]) == '[1]'
+    assert module.loaded
+    assert module.loads is sys.modules['json'].loads
+
+
+def test_lazy_module_missing():
+    module = LazyModule("cascade_at_no_such_module")
+    with pytest.raises(ModuleNotFoundError):
+        module.anything
+
+
+def test_lazy_module_needs_name():
+    with pytest.raises(ValueError):
+        LazyModule(sys)
+
+
+def test_module_proxy_imports_on_use():
+    # A module that doesn't exist doesn't fail until it is used.
+    proxy = ModuleProxy("cascade_at_no_such_module")
+    assert not proxy._imported
+    assert proxy._module is None
+    assert proxy._imported
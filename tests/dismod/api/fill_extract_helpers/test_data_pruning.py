@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.inputs.locations import LocationDAG
+from cascade_at.dismod.api.fill_extract_helpers.data_pruning import prune_data
+
+
+@pytest.fixture
+def dag():
+    return LocationDAG(df=pd.DataFrame({
+        'location_id': [1, 4, 31, 32, 5],
+        'parent_id': [1, 1, 4, 4, 1],
+        'location_name': ['Global', 'A', 'AA', 'AB', 'B']
+    }))
+
+
+@pytest.fixture
+def data():
+    return pd.DataFrame({
+        'location_id': [4, 31, 32, 5, 4, 31, 4, 32],
+        'measure': ['prevalence', 'prevalence', 'relrisk', 'prevalence', 'mtall', 'Sincidence',
+                    'prevalence', 'prevalence'],
+        'hold_out': [0, 0, 1, 0, 1, 0, 0, np.nan],
+        'c_ldi': [1., 2., 3., 4., 5., 9., np.nan, 2.],
+        's_sex': -0.5
+    })
+
+
+@pytest.fixture
+def covariate_df():
+    return pd.DataFrame({
+        'covariate_name': ['x_0', 'x_1'], 'c_covariate_name': ['s_sex', 'c_ldi'],
+        'reference': [0., 2.], 'max_difference': [np.nan, 5.]
+    })
+
+
+def test_prune_data(data, dag, covariate_df):
+    pruned, report = prune_data(
+        data, location_dag=dag, parent_location_id=4,
+        measures_to_exclude=['relrisk'], covariate_df=covariate_df
+    )
+    assert report == {'excluded_measures': 1, 'held_out': 1, 'outside_subtree': 1, 'covariate_difference': 1}
+    assert pruned.index.tolist() == [0, 1, 6, 7]
+
+
+def test_prune_data_rules(data, dag, covariate_df):
+    pruned, report = prune_data(
+        data, rules=['outside_subtree'], location_dag=dag, parent_location_id=4,
+        measures_to_exclude=['relrisk'], covariate_df=covariate_df
+    )
+    assert report == {'outside_subtree': 1}
+    assert 3 not in pruned.index
+    assert len(pruned) == 7
+
+    pruned, report = prune_data(data, rules=[])
+    assert report == dict()
+    assert len(pruned) == len(data)
+
+    with pytest.raises(ValueError):
+        prune_data(data, rules=['held_out', 'outliers'])
+
+
+def test_prune_data_without_inputs(data):
+    pruned, report = prune_data(data)
+    assert report == {'excluded_measures': 0, 'held_out': 2, 'outside_subtree': 0, 'covariate_difference': 0}
+    assert pruned.index.tolist() == [0, 1, 3, 5, 6, 7]
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from cascade_at.dismod.api.fill_extract_helpers.data_tables import construct_gbd_avgint_table
+from cascade_at.dismod.constants import IntegrandEnum
+
+
+def test_construct_gbd_avgint_table():
+    df = pd.DataFrame({
+        'location_id': [1, 1, 2, 2],
+        'sex_id': 2,
+        'age_group_id': [2, 3, 2, 3],
+        'year_id': 2000,
+        'age_lower': [0., 1., 0., 1.],
+        'age_upper': [1., 5., 1., 5.],
+        'time_lower': 2000,
+        'time_upper': 2001.,
+        'ldi': [0.1, 0.2, 0.3, 0.4],
+        's_sex': -0.5
+    })
+    node_df = pd.DataFrame({'node_id': [0, 1], 'c_location_id': [1, 2]})
+    covariate_df = pd.DataFrame({'covariate_name': ['x_0', 'x_1'], 'c_covariate_name': ['ldi', 's_sex']})
+    integrand_df = pd.DataFrame({'integrand_name': ['Sincidence', 'mtstandard', 'prevalence', 'relrisk']})
+
+    avgint = construct_gbd_avgint_table(
+        df=df, node_df=node_df, covariate_df=covariate_df, integrand_df=integrand_df,
+        ages=np.array([0., 100.]), times=np.array([1990., 2020.])
+    )
+    assert len(avgint) == 8
+    assert avgint.integrand_id.tolist() == (
+        [IntegrandEnum.Sincidence.value] * 4 + [IntegrandEnum.prevalence.value] * 4
+    )
+    assert avgint.node_id.tolist() == [0, 0, 1, 1] * 2
+    assert avgint.x_0.tolist() == [0.1, 0.2, 0.3, 0.4] * 2
+    assert (avgint.x_1 == -0.5).all()
+    assert (avgint.c_sex_id == 2).all()
+    assert avgint.columns.tolist() == [
+        'integrand_id', 'node_id', 'weight_id', 'subgroup_id', 'c_location_id',
+        'c_age_group_id', 'c_year_id', 'c_sex_id',
+        'age_lower', 'age_upper', 'time_lower', 'time_upper', 'x_0', 'x_1'
+    ]
+
+
+def test_construct_gbd_avgint_table_age_range():
+    df = pd.DataFrame({
+        'location_id': 1, 'sex_id': 2, 'age_group_id': [2, 3], 'year_id': 2000,
+        'age_lower': [0., 1.], 'age_upper': [1., 5.], 'time_lower': 2000, 'time_upper': 2001.
+    })
+    avgint = construct_gbd_avgint_table(
+        df=df, node_df=pd.DataFrame({'node_id': [0], 'c_location_id': [1]}),
+        covariate_df=pd.DataFrame({'covariate_name': [], 'c_covariate_name': []}),
+        integrand_df=pd.DataFrame({'integrand_name': ['prevalence']}),
+        ages=np.array([0., 1.]), times=np.array([1990., 2020.])
+    )
+    assert avgint.c_age_group_id.tolist() == [2]
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.dismod.api.fill_extract_helpers.draw_summaries import (
+    avgint_chunks, draw_frame, draw_matrix, summarize_draws
+)
+
+
+@pytest.fixture
+def predict():
+    rng = np.random.RandomState(0)
+    n_avgint, n_draws = 5, 200
+    values = rng.lognormal(size=(n_avgint, n_draws))
+    sample_index, avgint_id = np.meshgrid(np.arange(n_draws), np.arange(n_avgint) + 10)
+    order = rng.permutation(values.size)
+    df = pd.DataFrame({
+        'sample_index': sample_index.ravel()[order],
+        'avgint_id': avgint_id.ravel()[order],
+        'avg_integrand': values.ravel()[order]
+    })
+    return df, values
+
+
+def test_draw_matrix(predict):
+    df, values = predict
+    np.testing.assert_array_equal(draw_matrix(df, avgint_ids=np.arange(10, 15)), values)
+    draws = draw_matrix(df, avgint_ids=np.array([12, 99]))
+    np.testing.assert_array_equal(draws[0], values[2])
+    assert np.isnan(draws[1]).all()
+
+
+def test_draw_matrix_fit():
+    df = pd.DataFrame({'sample_index': np.nan, 'avgint_id': [1, 0], 'avg_integrand': [0.2, 0.1]})
+    np.testing.assert_array_equal(draw_matrix(df, avgint_ids=[0, 1]), [[0.1], [0.2]])
+
+
+def test_summarize_draws(predict):
+    df, values = predict
+    mean, bounds = summarize_draws(values, quantiles=(0.025, 0.5, 0.975))
+    np.testing.assert_allclose(mean, values.mean(axis=1))
+    for i, row in enumerate(values):
+        np.testing.assert_allclose(bounds[i], np.quantile(row, [0.025, 0.5, 0.975]))
+
+
+def test_summarize_missing_draws():
+    draws = np.array([[1., np.nan, 3.], [np.nan, np.nan, np.nan], [2., 2., 2.]])
+    mean, bounds = summarize_draws(draws, quantiles=(0., 1.))
+    np.testing.assert_array_equal(mean[[0, 2]], [2., 2.])
+    np.testing.assert_array_equal(bounds[0], [1., 3.])
+    assert np.isnan(mean[1]) and np.isnan(bounds[1]).all()
+
+
+def test_avgint_chunks():
+    chunks = avgint_chunks([4, 0, 3, 1, 2], chunk_size=2)
+    assert [c.tolist() for c in chunks] == [[0, 1], [2, 3], [4]]
+    assert [c.tolist() for c in avgint_chunks([1, 0])] == [[0, 1]]
+
+
+def test_draw_frame():
+    assert draw_frame(np.zeros((2, 3))).columns.tolist() == ['draw_0', 'draw_1', 'draw_2']
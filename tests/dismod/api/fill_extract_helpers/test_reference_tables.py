@@ -3,8 +3,9 @@ import pandas as pd
 import pytest
 
 from cascade_at.dismod.api.fill_extract_helpers.reference_tables import (
-    construct_age_time_table, construct_integrand_table
+    construct_age_time_table, construct_integrand_table, construct_node_table
 )
+from cascade_at.inputs.locations import LocationDAG
 from cascade_at.settings.settings import load_settings
 from cascade_at.settings.base_case import BASE_CASE
 from cascade_at.inputs.measurement_inputs import MeasurementInputs
@@ -85,3 +86,16 @@ def test_construct_integrand_table_from_settings():
     unchanged = df.loc[df.integrand_name != 'prevalence']
     assert all(changed.minimum_meas_cv == 0.5)
     assert all(unchanged.minimum_meas_cv == 0.2)
+
+
+def test_construct_node_table():
+    dag = LocationDAG(df=pd.DataFrame({
+        'location_id': [1, 102, 555, 101],
+        'parent_id': [1, 1, 102, 1],
+        'location_name': ['Global', 'USA', 'Washington', 'Canada']
+    }))
+    node = construct_node_table(location_dag=dag)
+    assert node.columns.tolist() == ['node_id', 'node_name', 'parent', 'c_location_id']
+    assert node.c_location_id.tolist() == [1, 101, 102, 555]
+    assert np.isnan(node.parent.iloc[0])
+    assert node.parent.tolist()[1:] == [0, 0, 2]
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.fill_extract_helpers.table_hash import (
+    TABLE_HASH_TABLE, content_hash, invalidated_commands, split_options
+)
+
+COMMANDS = ['init', 'fit fixed', 'set start_var fit_var', 'fit both', 'sample asymptotic both 10',
+            'predict sample']
+
+
+def test_content_hash():
+    df = pd.DataFrame({'age': [0., 1., 5.], 'name': ['a', 'b', None]})
+    assert content_hash(df) == content_hash(df.copy())
+    assert content_hash(df) != content_hash(df.assign(age=[0., 1., 6.]))
+    assert content_hash(df) != content_hash(df.rename(columns={'age': 'time'}))
+    assert content_hash(df, np.arange(3)) != content_hash(df, np.arange(3.))
+    assert content_hash({'b': 1, 'a': [2, 3]}) == content_hash({'a': [2, 3], 'b': 1})
+    assert content_hash({1: df}) != content_hash({2: df})
+
+
+def test_invalidated_commands():
+    assert invalidated_commands([], COMMANDS) == []
+    assert invalidated_commands(['avgint'], COMMANDS) == ['predict sample']
+    assert invalidated_commands(['option_fit', 'avgint'], COMMANDS) == COMMANDS[1:]
+    assert invalidated_commands(['option'], COMMANDS) == COMMANDS
+    assert invalidated_commands(['option_fit', 'data'], COMMANDS) == COMMANDS
+    assert invalidated_commands(['avgint'], ['init', 'fit both']) == []
+
+
+def test_table_hash_table(tmp_path):
+    db = DismodIO(path=tmp_path / 'hash.db')
+    db.write_table(TABLE_HASH_TABLE, pd.DataFrame({'table_name': ['age', 'data'], 'table_hash': ['ab', 'cd']}))
+    hashes = db.read_table(TABLE_HASH_TABLE)
+    assert hashes.columns.tolist() == ['c_table_hash_id', 'table_name', 'table_hash']
+    assert dict(zip(hashes.table_name, hashes.table_hash)) == {'age': 'ab', 'data': 'cd'}
+
+
+def test_split_options():
+    option = pd.DataFrame({
+        'option_name': ['parent_node_id', 'tolerance_fixed', 'rate_case', 'max_num_iter_fixed'],
+        'option_value': ['0', '1e-8', 'iota_pos_rho_zero', '100']
+    })
+    init_options, fit_options = split_options(option)
+    assert init_options.option_name.tolist() == ['parent_node_id', 'rate_case']
+    assert fit_options.option_name.tolist() == ['max_num_iter_fixed', 'tolerance_fixed']
+
+    # A fit option changes only the fit hash, in any order of the rows.
+    changed = option.assign(option_value=['0', '1e-10', 'iota_pos_rho_zero', '100']).iloc[::-1]
+    changed_init, changed_fit = split_options(changed)
+    assert content_hash(changed_init) == content_hash(init_options)
+    assert content_hash(changed_fit) != content_hash(fit_options)
+
+    changed = option.assign(option_value=['1', '1e-8', 'iota_pos_rho_zero', '100'])
+    assert content_hash(split_options(changed)[0]) != content_hash(init_options)
@@ -1,7 +1,12 @@
 import pytest
 
 import numpy as np
-from cascade_at.dismod.api.fill_extract_helpers.utils import vec_to_midpoint
+import pandas as pd
+
+from cascade_at.dismod.api.fill_extract_helpers.utils import (
+    vec_to_midpoint, map_locations_to_nodes, map_nodes_to_locations, map_covariate_names,
+    nearest_id, convert_age_time_to_id, convert_id_to_age_time
+)
 
 
 @pytest.mark.parametrize("array,mid", [
@@ -12,3 +17,70 @@ from cascade_at.dismod.api.fill_extract_helpers.utils import vec_to_midpoint
 def test_vec_to_midpoint(array, mid):
     np.testing.assert_array_equal(vec_to_midpoint(np.array(array)), np.array(mid))
 
+
+
+@pytest.fixture
+def node_df():
+    return pd.DataFrame({
+        'node_id': [0, 1, 2],
+        'c_location_id': [1, 102, 555]
+    })
+
+
+def test_map_locations_to_nodes(node_df):
+    df = pd.DataFrame({'location_id': [555., 1., 7., 102.], 'value': [1, 2, 3, 4]})
+    data = map_locations_to_nodes(df=df, node_df=node_df)
+    assert data.c_location_id.tolist() == [555, 1, 102]
+    assert data.node_id.tolist() == [2, 0, 1]
+    assert data.value.tolist() == [1, 2, 4]
+    assert 'location_id' in df.columns
+
+
+def test_map_nodes_to_locations(node_df):
+    df = pd.DataFrame({'node_id': [2, 0, 1]})
+    assert map_nodes_to_locations(df=df, node_df=node_df).c_location_id.tolist() == [555, 1, 102]
+
+
+def test_map_covariate_names():
+    covariate_df = pd.DataFrame({'covariate_name': ['x_0', 'x_1'], 'c_covariate_name': ['s_sex', 'ldi']})
+    df = pd.DataFrame({'s_sex': [0.5], 'ldi': [1.]})
+    assert map_covariate_names(df=df, covariate_df=covariate_df).columns.tolist() == ['x_0', 'x_1']
+
+
+@pytest.mark.parametrize("values", [
+    [0., 0.5, 1.5, 2.2, 7., 100., -3.],
+    [2.5, 1., 0.001, 4.99]
+])
+def test_nearest_id_matches_merge_asof(values):
+    grid = pd.DataFrame({'age': [0., 1., 2., 5.], 'age_id': [0, 1, 2, 3]})
+    left = pd.DataFrame({'age': values}).sort_values('age')
+    expected = pd.merge_asof(left, grid, on='age', direction='nearest')
+    np.testing.assert_array_equal(
+        nearest_id(expected.age.values, grid.age.values, grid.age_id.values),
+        expected.age_id.values
+    )
+
+
+def test_nearest_id_missing():
+    ids = nearest_id(np.array([0.1, np.nan]), np.array([1., 0.]), np.array([4, 3]))
+    assert ids[0] == 3
+    assert np.isnan(ids[1])
+
+
+def test_convert_age_time_to_id_and_back():
+    age_df = pd.DataFrame({'age_id': [0, 1, 2], 'age': [0., 1., 5.]})
+    time_df = pd.DataFrame({'time_id': [0, 1], 'time': [1990., 2000.]})
+    df = pd.DataFrame({
+        'age': [0.9, 5., np.nan],
+        'time': [1990., 1996., np.nan],
+        'value': [1, 2, 3]
+    }, index=[5, 6, 7])
+    converted = convert_age_time_to_id(df=df, age_df=age_df, time_df=time_df)
+    assert converted.columns.tolist() == ['value', 'age_id', 'time_id']
+    assert converted.index.tolist() == [0, 1, 2]
+    np.testing.assert_array_equal(converted.age_id.values, [1, 2, np.nan])
+    np.testing.assert_array_equal(converted.time_id.values, [0, 1, np.nan])
+
+    back = convert_id_to_age_time(df=converted, age_df=age_df, time_df=time_df)
+    np.testing.assert_array_equal(back.age.values, [1., 5., np.nan])
+    np.testing.assert_array_equal(back.time.values, [1990., 2000., np.nan])
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.fill_extract_helpers.warm_start import (
+    read_vars, parent_location, warm_start_values, warm_start
+)
+
+
+def write_common(db, locations, parent):
+    db.age = pd.DataFrame({'age': [0., 50., 100.]})
+    db.time = pd.DataFrame({'time': [1990., 2000., 2010.]})
+    db.node = pd.DataFrame({
+        'node_name': [str(loc) for loc in locations], 'parent': [np.nan] + [0] * (len(locations) - 1),
+        'c_location_id': locations
+    })
+    db.option = pd.DataFrame({'option_name': ['parent_node_id'], 'option_value': [str(parent)]})
+    db.rate = pd.DataFrame({
+        'rate_name': ['pini', 'iota'], 'parent_smooth_id': np.nan,
+        'child_smooth_id': np.nan, 'child_nslist_id': np.nan
+    })
+    db.integrand = pd.DataFrame({'integrand_name': ['Sincidence', 'prevalence'], 'minimum_meas_cv': 0.})
+    db.covariate = pd.DataFrame({
+        'covariate_name': ['x_0'], 'c_covariate_name': ['s_sex'], 'reference': 0., 'max_difference': np.nan
+    })
+
+
+def write_vars(db, var, table, values):
+    var = pd.DataFrame(var)
+    for column in ['integrand_id', 'covariate_id', 'mulcov_id', 'node_id']:
+        if column not in var:
+            var[column] = np.nan
+    db.write_table('var', var)
+    db.write_table(table, pd.DataFrame({f'{table}_value': values}))
+
+
+@pytest.fixture
+def parent_db(tmp_path):
+    db = DismodIO(path=tmp_path / 'parent.db')
+    write_common(db, locations=[1, 2, 3], parent=0)
+    write_vars(db, {
+        # iota on ages 0, 100 and times 1990, 2010 for the parent, then a
+        # constant random effect for location 2 and a rate covariate multiplier
+        'var_type': ['rate'] * 4 + ['rate', 'mulcov_rate_value'],
+        'smooth_id': [0, 0, 0, 0, 1, 2], 'age_id': [0, 0, 2, 2, 1, 1], 'time_id': [0, 2, 0, 2, 1, 1],
+        'node_id': [0, 0, 0, 0, 1, np.nan], 'rate_id': 1,
+        'covariate_id': [np.nan] * 5 + [0], 'mulcov_id': [np.nan] * 5 + [0]
+    }, table='fit_var', values=[0.01, 0.02, 0.03, 0.04, 0.1, 0.3])
+    return db
+
+
+@pytest.fixture
+def child_db(tmp_path):
+    db = DismodIO(path=tmp_path / 'child.db')
+    write_common(db, locations=[2, 4], parent=0)
+    write_vars(db, {
+        'var_type': ['rate'] * 3 + ['rate', 'mulcov_rate_value'],
+        'smooth_id': [0, 0, 0, 1, 2], 'age_id': [0, 1, 2, 1, 1], 'time_id': 1,
+        'node_id': [0, 0, 0, 1, np.nan], 'rate_id': 1,
+        'covariate_id': [np.nan] * 4 + [0], 'mulcov_id': [np.nan] * 4 + [0]
+    }, table='start_var', values=[0.001, 0.001, 0.001, 0., 0.])
+    db.write_table('scale_var', pd.DataFrame({'scale_var_value': [0.001, 0.001, 0.001, 0., 0.]}))
+    db.prior = pd.DataFrame({
+        'prior_name': ['rate', 'effect'], 'density_id': 0, 'lower': [1e-6, np.nan], 'upper': [0.03, np.nan],
+        'mean': 0., 'std': 1., 'eta': np.nan, 'nu': np.nan
+    })
+    db.smooth_grid = pd.DataFrame({
+        'smooth_id': [0, 0, 0, 1, 2], 'age_id': [0, 1, 2, 1, 1], 'time_id': 1,
+        'value_prior_id': [0, 0, 0, 1, 1], 'dage_prior_id': np.nan, 'dtime_prior_id': np.nan,
+        'const_value': np.nan
+    })
+    return db
+
+
+def test_read_vars(parent_db):
+    var = read_vars(parent_db, table='fit_var')
+    assert var.c_location_id.tolist() == [1, 1, 1, 1, 2, -1]
+    assert var.rate_name.unique().tolist() == ['iota']
+    assert var.c_covariate_name.tolist()[-1] == 's_sex'
+    assert var.age.tolist() == [0., 0., 100., 100., 50., 50.]
+    assert parent_location(parent_db) == 1
+
+
+def test_warm_start_values(parent_db, child_db):
+    values = warm_start_values(
+        read_vars(parent_db, table='fit_var'), read_vars(child_db),
+        parent_location_id=1, child_location_id=2
+    )
+    # Parent iota is bilinear at time 2000, times the random effect of location 2
+    np.testing.assert_allclose(values[:3], np.array([0.015, 0.025, 0.035]) * np.exp(0.1))
+    # The random effect for location 4 isn't known from the parent
+    assert np.isnan(values[3])
+    assert values[4] == pytest.approx(0.3)
+
+
+def test_warm_start(parent_db, child_db):
+    assert warm_start(parent_db=parent_db, child_db=child_db, child_location_id=2) == 4
+    start = child_db.start_var.start_var_value.values
+    # Clipped to the upper limit of the value prior
+    np.testing.assert_allclose(start[:3], [0.015 * np.exp(0.1), 0.025 * np.exp(0.1), 0.03])
+    assert start[3] == 0.
+    assert start[4] == pytest.approx(0.3)
+    np.testing.assert_allclose(child_db.scale_var.scale_var_value.values, start)
@@ -1,10 +1,11 @@
 import pytest
 from pathlib import Path
 import numpy as np
+import pandas as pd
 import os
 
 from cascade_at.dismod.api.run_dismod import run_dismod
-from cascade_at.dismod.api.dismod_extractor import DismodExtractor
+from cascade_at.dismod.api.dismod_extractor import DismodExtractor, _same_grid
 
 
 def test_run_dismod_fit_predict(dismod, ihme):
@@ -55,3 +56,193 @@ def test_format_for_ihme(ihme, dismod):
     assert all(pred.age_group_id == 2)
     assert all(pred.year_id == 1990)
 
+
+
+def test_get_predictions_filtered(tmp_path):
+    d = DismodExtractor(path=tmp_path / 'predict.db')
+    d.avgint = pd.DataFrame({
+        'integrand_id': [2, 2, 2, 2], 'node_id': [0, 0, 1, 1], 'weight_id': 1, 'subgroup_id': 0,
+        'age_lower': 0., 'age_upper': 1., 'time_lower': 0., 'time_upper': 1.,
+        'c_location_id': [1, 1, 2, 2], 'c_sex_id': [1, 2, 1, 2]
+    })
+    d.integrand = pd.DataFrame({'integrand_name': ['Sincidence', 'remission', 'mtexcess'], 'minimum_meas_cv': 0.})
+    d.write_table('predict', pd.DataFrame({
+        'sample_index': 0, 'avgint_id': [0, 1, 2, 3], 'avg_integrand': [0.1, 0.2, 0.3, 0.4]
+    }))
+    pred = d.get_predictions(location_id=2, sex_id=1)
+    assert pred.avgint_id.tolist() == [2]
+    assert pred.avg_integrand.tolist() == [0.3]
+    assert pred.rate.tolist() == ['chi']
+    assert len(d.get_predictions(location_id=1)) == 2
+    assert len(d.get_predictions()) == 4
+
+
+@pytest.fixture
+def sampled(tmp_path):
+    d = DismodExtractor(path=tmp_path / 'sample.db')
+    d.age = pd.DataFrame({'age': [0., 50., 100.]})
+    d.time = pd.DataFrame({'time': [1990., 2000., 2010.]})
+    d.node = pd.DataFrame({
+        'node_name': ['1', '2', '3'], 'parent': [np.nan, 0, 0], 'c_location_id': [1, 2, 3]
+    })
+    d.option = pd.DataFrame({'option_name': ['parent_node_id'], 'option_value': ['0']})
+    d.rate = pd.DataFrame({
+        'rate_name': ['pini', 'iota'], 'parent_smooth_id': np.nan,
+        'child_smooth_id': np.nan, 'child_nslist_id': np.nan
+    })
+    d.integrand = pd.DataFrame({'integrand_name': ['Sincidence', 'prevalence'], 'minimum_meas_cv': 0.})
+    # iota on ages 0, 100 and times 1990, 2010, and a constant random effect for location 2
+    d.write_table('var', pd.DataFrame({
+        'var_type': 'rate', 'smooth_id': [0, 0, 0, 0, 1], 'age_id': [2, 0, 2, 0, 1], 'time_id': [0, 2, 2, 0, 1],
+        'node_id': [0, 0, 0, 0, 1], 'rate_id': 1, 'integrand_id': np.nan, 'covariate_id': np.nan,
+        'mulcov_id': np.nan
+    }))
+    parent = np.array([[0.01, 0.02], [0.03, 0.04]])[:, :, None] * np.array([1., 2., 3.])
+    effect = np.array([0.1, -0.1, 0.])
+    d.write_table('sample', pd.DataFrame({
+        'sample_index': np.repeat(np.arange(3), 5),
+        'var_id': np.tile(np.arange(5), 3),
+        'var_value': np.concatenate([
+            [parent[1, 0, s], parent[0, 1, s], parent[1, 1, s], parent[0, 0, s], effect[s]] for s in range(3)
+        ])
+    }))
+    return d, parent, effect
+
+
+def test_gather_draws_from_sample(sampled):
+    d, parent, effect = sampled
+    grids = {'iota': (np.array([0., 100.]), np.array([1990., 2010.]))}
+    assert d.can_gather_draws_from_sample(location_ids=[1, 2, 3], rates=['iota'], grids=grids)
+
+    draws = d.gather_draws_from_sample(location_id=1, rates=['iota'], grids=grids)
+    np.testing.assert_allclose(draws['iota']['value'], parent)
+    assert draws['iota']['n_draws'] == 3
+    np.testing.assert_array_equal(draws['iota']['ages'], [0., 100.])
+    np.testing.assert_array_equal(draws['iota']['times'], [1990., 2010.])
+
+    draws = d.gather_draws_from_sample(location_id=2, rates=['iota'], grids=grids)
+    np.testing.assert_allclose(draws['iota']['value'], parent * np.exp(effect))
+    np.testing.assert_allclose(draws['iota']['dage'], np.diff(parent * np.exp(effect), axis=0))
+    np.testing.assert_allclose(draws['iota']['dtime'], np.diff(parent * np.exp(effect), axis=1))
+
+
+def test_gather_draws_from_sample_falls_back(sampled):
+    d, parent, effect = sampled
+    other_grid = {'iota': (np.array([0., 50., 100.]), np.array([1990., 2010.]))}
+    assert d.gather_draws_from_sample(location_id=2, rates=['iota'], grids=other_grid) is None
+    assert not d.can_gather_draws_from_sample(location_ids=[4], rates=['iota'])
+    assert not d.can_gather_draws_from_sample(location_ids=[2], rates=['pini'])
+
+
+
+def test_gather_all_draws_from_sample(sampled, monkeypatch):
+    d, parent, effect = sampled
+    grids = {'iota': (np.array([0., 100.]), np.array([1990., 2010.]))}
+    tables = list()
+    read_table = d.read_table
+    monkeypatch.setattr(d, 'read_table', lambda table, **kwargs: tables.append(table) or read_table(table, **kwargs))
+
+    draws = d.gather_all_draws_from_sample(location_ids=[1, 2, 3], rates=['iota'], grids=grids, dtime=False)
+    assert set(draws) == {1, 2, 3}
+    # Once to check that there are samples, and once for the draws.
+    assert tables.count('sample') == 2
+    np.testing.assert_allclose(draws[1]['iota']['value'], parent)
+    np.testing.assert_allclose(draws[2]['iota']['value'], parent * np.exp(effect))
+    np.testing.assert_allclose(draws[3]['iota']['value'], parent)
+    assert 'dtime' not in draws[2]['iota']
+    assert d.gather_all_draws_from_sample(location_ids=[2, 4], rates=['iota']) is None
+
+
+def test_same_grid_tolerance():
+    ages = np.array([0., 100.])
+    assert _same_grid(ages, np.array([2000.]), ages + 1e-9, np.array([2000.]))
+    assert not _same_grid(ages, np.array([2000.]), ages, np.array([2000.02]))
+
+
+def test_gather_draws_same_as_predictions(sampled):
+    d, parent, effect = sampled
+    ages, times = np.meshgrid([0., 100.], [1990., 2010.], indexing='ij')
+    d.avgint = pd.DataFrame({
+        'integrand_id': 0, 'node_id': 1, 'weight_id': 0, 'subgroup_id': 0,
+        'age_lower': ages.ravel(), 'age_upper': ages.ravel(),
+        'time_lower': times.ravel(), 'time_upper': times.ravel(),
+        'c_location_id': 2, 'c_sex_id': 2
+    })
+    values = parent * np.exp(effect)
+    d.write_table('predict', pd.DataFrame({
+        'sample_index': np.repeat(np.arange(3), 4), 'avgint_id': np.tile(np.arange(4), 3),
+        'avg_integrand': np.concatenate([values[:, :, s].ravel() for s in range(3)])
+    }))
+    predicted = d.gather_draws_for_prior_grid(location_id=2, sex_id=2, rates=['iota'])
+    sampled_draws = d.gather_draws_from_sample(location_id=2, rates=['iota'])
+    np.testing.assert_allclose(predicted['iota']['value'], sampled_draws['iota']['value'])
+    np.testing.assert_array_equal(predicted['iota']['times'], sampled_draws['iota']['times'])
+
+
+def test_gather_all_draws_for_prior_grid(sampled):
+    d, parent, effect = sampled
+    d.avgint = pd.DataFrame({
+        'integrand_id': 0, 'node_id': [0, 1], 'weight_id': 0, 'subgroup_id': 0,
+        'age_lower': 0., 'age_upper': 0., 'time_lower': 1990., 'time_upper': 1990.,
+        'c_location_id': [1, 2], 'c_sex_id': 2
+    })
+    d.write_table('predict', pd.DataFrame({
+        'sample_index': np.repeat(np.arange(3), 2), 'avgint_id': np.tile([0, 1], 3),
+        'avg_integrand': [0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
+    }))
+    draws = d.gather_all_draws_for_prior_grid(rates=['iota'], dage=False, dtime=False)
+    assert set(draws.keys()) == {(1, 2), (2, 2)}
+    np.testing.assert_array_equal(draws[(2, 2)]['iota']['value'].ravel(), [0.2, 0.4, 0.6])
+    assert 'dage' not in draws[(1, 2)]['iota']
+
+
+@pytest.fixture
+def predict_sample(tmp_path):
+    d = DismodExtractor(path=tmp_path / 'predict_sample.db')
+    d.avgint = pd.DataFrame({
+        'integrand_id': [0, 1, 0, 1], 'node_id': 0, 'weight_id': 0, 'subgroup_id': 0,
+        'age_lower': 0., 'age_upper': 1., 'time_lower': 1990., 'time_upper': 1990.,
+        'c_location_id': [1, 1, 2, 2], 'c_sex_id': 2, 'c_age_group_id': 2, 'c_year_id': 1990
+    })
+    d.integrand = pd.DataFrame({'integrand_name': ['Sincidence', 'prevalence'], 'minimum_meas_cv': 0.})
+    draws = np.arange(4)[:, None] + np.linspace(0., 1., 101)[None, :]
+    d.write_table('predict', pd.DataFrame({
+        'sample_index': np.repeat(np.arange(101), 4), 'avgint_id': np.tile(np.arange(4), 101),
+        'avg_integrand': draws.T.ravel()
+    }))
+    return d, draws
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1, 3])
+def test_format_sample_predictions_for_ihme(predict_sample, chunk_size):
+    d, draws = predict_sample
+    pred = d.format_predictions_for_ihme(quantiles=(0.1, 0.9), chunk_size=chunk_size)
+    assert pred.columns.tolist() == [
+        'location_id', 'age_group_id', 'year_id', 'sex_id', 'measure_id', 'mean', 'upper', 'lower'
+    ]
+    # Sincidence is duplicated as incidence.
+    assert pred.measure_id.tolist() == [41, 5, 41, 5, 6, 6]
+    assert pred.location_id.tolist() == [1, 1, 2, 2, 1, 2]
+    np.testing.assert_allclose(pred['mean'].values[:4], draws.mean(axis=1))
+    np.testing.assert_allclose(pred['lower'].values[:4], np.arange(4) + 0.1)
+    np.testing.assert_allclose(pred['upper'].values[:4], np.arange(4) + 0.9)
+
+
+def test_format_draws_for_ihme(predict_sample):
+    d, draws = predict_sample
+    chunks = list(d.format_draws_for_ihme(chunk_size=2))
+    assert len(chunks) == 2
+    df = pd.concat(chunks)
+    assert df.columns.tolist()[:5] == ['location_id', 'age_group_id', 'year_id', 'sex_id', 'measure_id']
+    assert len(df.columns) == 5 + 101
+    np.testing.assert_allclose(df.loc[df.measure_id != 6].iloc[:, 5:].values, draws)
+
+
+def test_compact_predictions(predict_sample):
+    d, draws = predict_sample
+    compact = DismodExtractor(path=d.path, compact=True)
+    assert compact.get_predictions().avg_integrand.dtype == np.float32
+    chunk = next(compact.format_draws_for_ihme())
+    assert (chunk.iloc[:, 5:].dtypes == np.float32).all()
+    pred = compact.format_predictions_for_ihme()
+    np.testing.assert_allclose(pred['mean'].values, d.format_predictions_for_ihme()['mean'].values, rtol=1e-6)
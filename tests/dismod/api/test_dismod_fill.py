@@ -3,6 +3,9 @@ import numpy as np
 from numpy import nan, inf
 import pandas as pd
 
+from cascade_at.dismod.api.dismod_filler import DismodFiller
+from cascade_at.model.grid_alchemy import Alchemy
+
 
 @pytest.fixture(scope='module')
 def value_prior(df):
@@ -381,3 +384,22 @@ def test_mulcov(df, mulcov):
 
 def test_option(df, option):
     pd.testing.assert_frame_equal(df.option, option)
+
+
+def test_shared_tables(mi, settings, tmp_path):
+    alchemy = Alchemy(settings)
+    shared_tables = dict()
+    fills = [
+        DismodFiller(
+            path=tmp_path / f'{sex_id}.db',
+            settings_configuration=settings,
+            measurement_inputs=mi,
+            grid_alchemy=alchemy,
+            parent_location_id=70,
+            sex_id=sex_id,
+            shared_tables=shared_tables
+        ).fill_reference_tables() for sex_id in [1, 2]
+    ]
+    assert {'density', 'node', 'integrand'} <= set(shared_tables.keys())
+    for name in ['density', 'node', 'age', 'time', 'integrand']:
+        pd.testing.assert_frame_equal(getattr(fills[0], name), getattr(fills[1], name))
@@ -176,6 +176,87 @@ def test_avgint(dm, dm_read):
                                           'age_lower', 'age_upper', 'time_lower', 'time_upper'])
 
 
+def test_avgint_in_chunks(dm, dm_read):
+    def chunks():
+        for start in [0, 3, 5]:
+            yield pd.DataFrame({
+                'integrand_id': 1, 'node_id': np.arange(start, start + 3), 'weight_id': 1, 'subgroup_id': 0,
+                'age_lower': 0., 'age_upper': 1., 'time_lower': 0., 'time_upper': 1., 'x_0': 0.5
+            })
+    n_rows = dm.write_table_in_chunks('avgint', chunks())
+    avgint = dm_read.avgint
+    assert n_rows == 9
+    assert avgint.avgint_id.tolist() == list(range(9))
+    assert avgint.node_id.tolist() == [0, 1, 2, 3, 4, 5, 5, 6, 7]
+    assert (avgint.x_0 == 0.5).all()
+
+
+def test_avgint_in_chunks_empty(dm, dm_read):
+    assert dm.write_table_in_chunks('avgint', iter([])) == 0
+    assert dm_read.avgint.empty
+
+
+@pytest.fixture
+def dm_avgint(dm):
+    dm.avgint = pd.DataFrame({
+        'integrand_id': [1, 2, 1, 2], 'node_id': [0, 0, 1, 1], 'weight_id': 1, 'subgroup_id': 0,
+        'age_lower': 0., 'age_upper': 1., 'time_lower': 0., 'time_upper': 1.,
+        'c_location_id': [1, 1, 2, 2], 'c_year_id': [1990, 1990, np.nan, 1990]
+    })
+    return dm
+
+
+def test_read_table_columns(dm_avgint, dm_read):
+    avgint = dm_read.read_table('avgint', columns=['node_id', 'avgint_id'])
+    assert avgint.columns.tolist() == ['node_id', 'avgint_id']
+    assert avgint.avgint_id.dtype == np.int64
+    with pytest.raises(ValueError):
+        dm_read.read_table('avgint', columns=['foo'])
+
+
+def test_read_table_where(dm_avgint, dm_read):
+    avgint = dm_read.read_table('avgint', where="c_location_id = ?", params=(2,))
+    assert avgint.avgint_id.tolist() == [2, 3]
+    avgint = dm_read.read_table('avgint', id_range=(1, 3), where="integrand_id = ?", params=(2,))
+    assert avgint.avgint_id.tolist() == [1]
+
+
+def test_read_table_types(dm_avgint, dm_read):
+    avgint = dm_read.read_table('avgint')
+    assert avgint.node_id.dtype == np.int64
+    assert avgint.c_location_id.dtype == np.int64
+    assert avgint.age_lower.dtype == np.float64
+    assert avgint.c_year_id.dtype == np.float64
+    assert np.isnan(avgint.c_year_id.iloc[2])
+
+
+def test_read_table_real_in_integer_column(dm_avgint, dm_read):
+    dm_avgint.engine.execute("UPDATE avgint SET c_location_id = 2.5 WHERE avgint_id = 3")
+    avgint = dm_read.read_table('avgint', batch_size=2)
+    assert avgint.c_location_id.dtype == np.float64
+    assert avgint.c_location_id.tolist() == [1., 1., 2., 2.5]
+    assert dm_read.read_table('avgint').node_id.dtype == np.int64
+
+
+def test_fill_column_keeps_reals():
+    from cascade_at.dismod.api.dismod_sqlite import _fill_column
+    column = _fill_column(np.empty(3, np.int64), 0, 3, (1, 2.5, 3))
+    assert column.dtype == np.float64
+    assert column.tolist() == [1., 2.5, 3.]
+
+
+def test_read_table_batches(dm_avgint, dm_read):
+    pd.testing.assert_frame_equal(
+        dm_read.read_table('avgint', batch_size=3),
+        dm_read.read_table('avgint')
+    )
+
+
+def test_read_table_missing(dm_read):
+    with pytest.raises(ValueError):
+        dm_read.read_table('avgint')
+
+
 def test_data(dm, dm_read):
     dm.data = pd.DataFrame({
         'data_id': 1, 'data_name': '', 'integrand_id': 1, 'density_id': 1,
@@ -205,3 +286,62 @@ def test_subgroup(dm, dm_read):
     }, index=[0])
     assert len(dm_read.subgroup) == 1
     assert all(dm_read.subgroup.columns == ['subgroup_id', 'subgroup_name', 'group_id', 'group_name'])
+
+
+def test_shared_engine(dm, dm_read, tmp_path):
+    assert dm.engine is dm_read.engine
+    assert DismodIO(path=tmp_path / 'other.db').engine is not dm.engine
+
+
+def test_added_columns_are_per_instance(dm, tmp_path):
+    from cascade_at.dismod.api.table_metadata import Base
+    dm.avgint = pd.DataFrame({
+        'integrand_id': [0], 'node_id': [0], 'weight_id': [0], 'subgroup_id': [0],
+        'age_lower': [0.], 'age_upper': [1.], 'time_lower': [2000.], 'time_upper': [2001.],
+        'x_0': [1.], 'c_location_id': [1]
+    })
+    assert {'x_0', 'c_location_id'} <= set(dm._table_definitions['avgint'].c.keys())
+    assert dm._table_definitions.overlays == ['avgint']
+    assert 'x_0' not in Base.metadata.tables['avgint'].c
+    other = DismodIO(path=tmp_path / 'other.db')
+    assert 'x_0' not in other._table_definitions['avgint'].c
+    assert other._table_definitions.overlays == []
+
+
+def test_create_indexes(dm_avgint, dm_read):
+    dm_avgint.write_table('sample', pd.DataFrame({
+        'sample_index': [0, 0, 1, 1], 'var_id': [0, 1, 0, 1], 'var_value': [1., 2., 3., 4.]
+    }))
+    # The avgint table doesn't have c_sex_id so it isn't indexed
+    assert dm_avgint.create_indexes() == ['ix_sample_sample_index_var_id_var_value', 'ix_sample_var_id']
+    assert dm_avgint.create_indexes(tables=['sample']) == [
+        'ix_sample_sample_index_var_id_var_value', 'ix_sample_var_id'
+    ]
+    plan = dm_read.engine.execute(
+        "EXPLAIN QUERY PLAN SELECT var_id, var_value FROM sample WHERE sample_index = 1"
+    ).fetchall()
+    assert 'COVERING INDEX ix_sample_sample_index_var_id_var_value' in plan[0][-1]
+    sample = dm_read.read_table('sample', where="sample_index = ?", params=(1,))
+    assert sample.var_value.tolist() == [3., 4.]
+
+
+def test_engine_cache_from_threads(tmp_path, monkeypatch):
+    import time
+    from collections import OrderedDict
+    from concurrent.futures import ThreadPoolExecutor
+    from cascade_at.dismod.api import dismod_sqlite
+
+    class SlowEngines(OrderedDict):
+        """Lets other threads run between finding an engine and using it."""
+        def get(self, key, default=None):
+            engine = super().get(key, default)
+            time.sleep(0.0001)
+            return engine
+
+    monkeypatch.setattr(dismod_sqlite, 'ENGINE_CACHE_SIZE', 2)
+    monkeypatch.setattr(dismod_sqlite, '_ENGINES', SlowEngines())
+    paths = [tmp_path / f'{i % 5}.db' for i in range(500)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        engines = list(executor.map(dismod_sqlite.get_engine, paths))
+    assert len(engines) == len(paths)
+    assert len(dismod_sqlite._ENGINES) == 2
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.dismod.api.multi_db import AttachedDatabases
+
+
+@pytest.fixture
+def db_paths(tmp_path):
+    paths = list()
+    for i in range(5):
+        path = tmp_path / f'dismod_{i}.db'
+        db = DismodIO(path=path)
+        db.write_table('var', pd.DataFrame({
+            'var_type': 'rate', 'smooth_id': 0, 'age_id': [0, 1], 'time_id': 0,
+            'node_id': i, 'rate_id': 1, 'integrand_id': np.nan,
+            'covariate_id': np.nan, 'mulcov_id': np.nan
+        }))
+        db.write_table('fit_var', pd.DataFrame({
+            'fit_var_value': [i, i + 0.5], 'residual_value': 0., 'residual_dage': 0., 'residual_dtime': 0.
+        }))
+        paths.append(path)
+    return paths
+
+
+def test_query_batches_tags(db_paths):
+    databases = AttachedDatabases(
+        paths=db_paths, tags=[dict(location_id=100 + i, sex_id=2) for i in range(5)], batch_size=2
+    )
+    assert len(databases.batches()) == 3
+    df = databases.query(
+        "SELECT var.age_id, fit_var.fit_var_value FROM {db}.var AS var "
+        "JOIN {db}.fit_var AS fit_var ON fit_var.fit_var_id = var.var_id WHERE var.age_id = ?",
+        params=(1,), tables=['var', 'fit_var']
+    )
+    assert df.columns.tolist() == ['location_id', 'sex_id', 'age_id', 'fit_var_value']
+    assert df.location_id.tolist() == [100, 101, 102, 103, 104]
+    assert (df.sex_id == 2).all()
+    np.testing.assert_array_equal(df.fit_var_value.values, np.arange(5) + 0.5)
+
+
+def test_read_table_skips_missing(db_paths, tmp_path):
+    empty = DismodIO(path=tmp_path / 'empty.db')
+    empty.write_table('age', pd.DataFrame({'age': [0.]}))
+    databases = AttachedDatabases(paths=db_paths[:2] + [empty.path, tmp_path / 'nothing.db'])
+    assert len(databases) == 3
+    df = databases.read_table('fit_var', columns=['fit_var_value'])
+    assert df.fit_var_value.tolist() == [0., 0.5, 1., 1.5]
+    assert not (tmp_path / 'nothing.db').exists()
+
+
+def test_empty_query(tmp_path):
+    databases = AttachedDatabases(paths=[], tags=[])
+    df = databases.query("SELECT * FROM {db}.var", dtypes={'var_id': int})
+    assert df.empty
+
+
+def test_mismatched_tags(db_paths):
+    with pytest.raises(ValueError):
+        AttachedDatabases(paths=db_paths[:2], tags=[dict(location_id=1), dict(sex_id=1)])
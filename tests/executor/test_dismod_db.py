@@ -0,0 +1,74 @@
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from cascade_at.executor.dismod_db import split_commands_for_warm_start, get_args, database_executor
+
+
+COMMANDS = ['init', 'fit fixed', 'set start_var fit_var', 'set scale_var fit_var', 'fit both', 'predict fit_var']
+
+
+def test_split_commands_for_warm_start():
+    before, after = split_commands_for_warm_start(COMMANDS)
+    assert before == ['init']
+    assert after == COMMANDS[1:]
+
+
+def test_split_commands_skip_fit_fixed():
+    before, after = split_commands_for_warm_start(COMMANDS, skip_fit_fixed=True)
+    assert before == ['init']
+    assert after == ['fit both', 'predict fit_var']
+
+
+def test_split_commands_without_init():
+    with pytest.raises(ValueError):
+        split_commands_for_warm_start(COMMANDS[1:])
+
+
+def test_batch_arguments(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', [
+        'dismod_db', '-model-version-id', '0', '-parent-location-id', '102', '103',
+        '-sex-id', '1', '2', '--commands', 'init', 'fit-fixed', '--n-workers', '2'
+    ])
+    args = get_args()
+    assert args.parent_location_id == [102, 103]
+    assert args.sex_id == [1, 2]
+    assert args.commands == ['init', 'fit fixed']
+    assert args.n_workers == 2
+    assert args.pool == 'thread'
+
+
+def test_pruning_arguments(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', [
+        'dismod_db', '-model-version-id', '0', '-parent-location-id', '102', '-sex-id', '1'
+    ])
+    args = get_args()
+    assert args.prune_rules is None
+    assert not args.keep_held_out
+    monkeypatch.setattr(sys, 'argv', sys.argv + ['--prune-rules', 'held_out', '--keep-held-out'])
+    args = get_args()
+    assert args.prune_rules == ['held_out']
+    assert args.keep_held_out
+
+
+def test_incremental_argument(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', [
+        'dismod_db', '-model-version-id', '0', '-parent-location-id', '102', '-sex-id', '1', '--incremental'
+    ])
+    assert get_args().incremental
+
+
+def test_database_executor_forks():
+    with database_executor(pool='process', n_workers=2) as executor:
+        assert isinstance(executor, ProcessPoolExecutor)
+        assert executor._mp_context.get_start_method() == 'fork'
+    with database_executor(pool='thread', n_workers=2) as executor:
+        assert isinstance(executor, ThreadPoolExecutor)
+
+
+def test_database_executor_without_fork(monkeypatch):
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    with database_executor(pool='process', n_workers=2) as executor:
+        assert isinstance(executor, ThreadPoolExecutor)
@@ -2,7 +2,11 @@ import pytest
 import pandas as pd
 import numpy as np
 
-from cascade_at.executor.mulcov_statistics import compute_statistics
+from cascade_at.dismod.api.dismod_io import DismodIO
+from cascade_at.executor.mulcov_statistics import (
+    compute_statistics, MulcovStatistics, query_mulcov_values, attached_common_covariate_names
+)
+from cascade_at.dismod.api.multi_db import AttachedDatabases
 
 
 @pytest.fixture
@@ -31,3 +35,99 @@ def test_compute_statistics(mulcov_df):
     assert (stat.stat.values == np.repeat([
         'mean', 'std', 'quantile_0.025', 'quantile_0.975'
     ], repeats=3)).all()
+
+
+def test_streaming_statistics_match_pandas():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame({
+        'c_covariate_name': rng.choice(['a', 'b'], size=200),
+        'mulcov_type': 'rate_value',
+        'rate_name': rng.choice(['iota', 'chi', np.nan], size=200),
+        'integrand_name': np.nan,
+        'mulcov_value': rng.normal(size=200)
+    })
+    statistics = MulcovStatistics()
+    for chunk in np.array_split(np.arange(200), 7):
+        statistics.add(df.iloc[chunk])
+    stat = statistics.to_frame(mean=True, std=True, quantile=[0.1, 0.5])
+
+    groups = df.fillna('none').groupby(
+        ['c_covariate_name', 'mulcov_type', 'rate_name', 'integrand_name'], sort=False
+    ).mulcov_value
+    np.testing.assert_allclose(stat.loc[stat.stat == 'mean'].mulcov_value.values, groups.mean().values)
+    np.testing.assert_allclose(stat.loc[stat.stat == 'std'].mulcov_value.values, groups.std(ddof=0).values)
+    np.testing.assert_allclose(stat.loc[stat.stat == 'quantile_0.1'].mulcov_value.values,
+                               groups.quantile(0.1).values)
+    np.testing.assert_allclose(stat.loc[stat.stat == 'quantile_0.5'].mulcov_value.values,
+                               groups.quantile(0.5).values)
+
+
+@pytest.fixture
+def mulcov_db(tmp_path):
+    db = DismodIO(path=tmp_path / 'dismod.db')
+    db.covariate = pd.DataFrame({
+        'covariate_name': ['x_0', 'x_1'], 'c_covariate_name': ['s_sex', 's_one'],
+        'reference': 0., 'max_difference': np.nan
+    })
+    db.write_table('mulcov', pd.DataFrame({
+        'mulcov_type': ['rate_value', 'meas_value'], 'rate_id': [1, np.nan], 'integrand_id': [np.nan, 2],
+        'covariate_id': [0, 1], 'group_smooth_id': 0, 'group_id': 0, 'subgroup_smooth_id': np.nan
+    }))
+    db.rate = pd.DataFrame({
+        'rate_id': [0, 1], 'rate_name': ['pini', 'iota'],
+        'parent_smooth_id': np.nan, 'child_smooth_id': np.nan, 'child_nslist_id': np.nan
+    })
+    db.integrand = pd.DataFrame({'integrand_name': ['Sincidence', 'remission', 'prevalence'], 'minimum_meas_cv': 0.})
+    db.write_table('var', pd.DataFrame({
+        'var_type': ['rate', 'mulcov_rate_value', 'mulcov_meas_value'],
+        'smooth_id': 0, 'age_id': 0, 'time_id': 0, 'node_id': [0, np.nan, np.nan],
+        'rate_id': [1, 1, np.nan], 'integrand_id': [np.nan, np.nan, 2],
+        'covariate_id': [np.nan, 0, 1], 'mulcov_id': [np.nan, 0, 1]
+    }))
+    db.write_table('fit_var', pd.DataFrame({
+        'fit_var_value': [0.01, 0.5, -0.2], 'residual_value': 0., 'residual_dage': 0., 'residual_dtime': 0.
+    }))
+    db.write_table('sample', pd.DataFrame({
+        'sample_index': [0, 0, 0, 1, 1, 1], 'var_id': [0, 1, 2] * 2,
+        'var_value': [0.01, 0.5, -0.2, 0.02, 0.7, -0.1]
+    }))
+    return db
+
+
+def read_one(db, covs, table):
+    databases = AttachedDatabases(paths=[db.path])
+    return pd.concat(query_mulcov_values(databases=databases, covs=covs, table=table), ignore_index=True)
+
+
+def test_query_mulcov_values_one_db(mulcov_db):
+    df = read_one(mulcov_db, covs={'s_sex', 's_one'}, table='fit_var').sort_values('c_covariate_name')
+    assert df.c_covariate_name.tolist() == ['s_one', 's_sex']
+    assert df.rate_name.tolist()[1] == 'iota'
+    assert df.integrand_name.tolist()[0] == 'prevalence'
+    assert df.mulcov_value.tolist() == [-0.2, 0.5]
+
+    df = read_one(mulcov_db, covs={'s_sex'}, table='sample')
+    assert sorted(df.mulcov_value.tolist()) == [0.5, 0.7]
+
+
+def test_query_mulcov_values_workers(mulcov_db):
+    databases = AttachedDatabases(paths=[mulcov_db.path] * 3, batch_size=1)
+    df = pd.concat(query_mulcov_values(databases=databases, covs={'s_sex'}, table='sample', n_workers=2))
+    assert len(df) == 6
+    stat = compute_statistics(df=df, mean=True, std=False)
+    assert np.allclose(stat.mulcov_value.values, [0.6])
+
+
+def test_query_mulcov_values(mulcov_db, tmp_path):
+    other = DismodIO(path=tmp_path / 'other.db')
+    for table in ['covariate', 'mulcov', 'rate', 'integrand', 'var', 'fit_var', 'sample']:
+        other.write_table(table, mulcov_db.read_table(table))
+    databases = AttachedDatabases(paths=[mulcov_db.path, other.path], batch_size=1)
+    assert attached_common_covariate_names(databases) == {'s_sex', 's_one'}
+
+    df = pd.concat(query_mulcov_values(databases=databases, covs={'s_sex', 's_one'}, table='sample'))
+    expected = read_one(mulcov_db, covs={'s_sex', 's_one'}, table='sample')
+    pd.testing.assert_frame_equal(
+        df.sort_values(['c_covariate_name', 'mulcov_value']).reset_index(drop=True),
+        pd.concat([expected, expected]).sort_values(['c_covariate_name', 'mulcov_value']).reset_index(drop=True)
+    )
@@ -0,0 +1,45 @@
+import pytest
+
+from cascade_at.executor.utils.startup import (
+    LAZY_MODULES, compare_reports, measure_import, parse_importtime
+)
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   json.decoder
+import time:       200 |        300 | json
+import time:  not a line
+import time:        50 |        350 | cascade_at.executor.cleanup
+"""
+
+
+def test_parse_importtime():
+    times = parse_importtime(IMPORTTIME)
+    assert times.module.tolist() == ['json.decoder', 'json', 'cascade_at.executor.cleanup']
+    assert times.depth.tolist() == [1, 0, 0]
+    assert times.self_seconds.tolist() == [1e-4, 2e-4, 5e-5]
+    assert times.cumulative_seconds.tolist() == [1e-4, 3e-4, 3.5e-4]
+
+
+def test_compare_reports():
+    baseline = {'dismod_db': {'seconds': 1.}, 'cleanup': {'seconds': 1.}}
+    report = {
+        'dismod_db': {'seconds': 1.5},
+        'cleanup': {'seconds': 1.1},
+        'format_upload': {'seconds': 2.},
+        'run_cascade': {'error': 'No module named jobmon'}
+    }
+    assert compare_reports(report, baseline, tolerance=0.2) == {'dismod_db': (1., 1.5)}
+
+
+@pytest.mark.parametrize("module", [
+    'cascade_at.executor.dismod_db',
+    'cascade_at.executor.sample_simulate',
+    'cascade_at.executor.format_upload',
+    'cascade_at.executor.cleanup'
+])
+def test_scripts_import_lazy_modules_on_use(module):
+    seconds, times = measure_import(module, repeats=1)
+    assert seconds > 0
+    imported = set(times.module)
+    assert module in imported
+    assert not imported & set(LAZY_MODULES)
@@ -1,5 +1,10 @@
+import numpy as np
+import pandas as pd
 import pytest
 
+from cascade_at.inputs.covariate_data import CovariateData
+from cascade_at.inputs.locations import LocationDAG
+
 
 def test_complete_covariate_ages(covariate_data):
     df = covariate_data.complete_covariate_ages(cov_df=covariate_data.raw)
@@ -11,7 +16,7 @@ def test_complete_covariate_ages(covariate_data):
 def df_for_dismod(covariate_data, population, dag):
     return covariate_data.configure_for_dismod(
         pop_df=population.raw,
-        loc_df=dag.df
+        location_dag=dag
     )
 
 
@@ -37,3 +42,72 @@ def test_all_columns(df_for_dismod, column, value):
         (df_for_dismod.age_group_id == 2) & (df_for_dismod.sex_id == 2)
     ].copy()
     assert df[column].iloc[0] == value
+
+
+@pytest.fixture
+def small_hierarchy():
+    df = pd.DataFrame({
+        'location_id': [1, 4, 31, 32],
+        'parent_id': [1, 1, 4, 4],
+        'location_name': ['Global', 'A', 'AA', 'AB']
+    })
+    return LocationDAG(df=df)
+
+
+@pytest.fixture
+def small_population():
+    pop = pd.DataFrame(
+        [(l, a, s, 2000) for l in [1, 4, 31, 32] for a in [2, 3] for s in [1, 2, 3]],
+        columns=['location_id', 'age_group_id', 'sex_id', 'year_id']
+    )
+    pop['population'] = 1.
+    pop.loc[pop.location_id == 31, 'population'] = np.where(pop.loc[pop.location_id == 31, 'age_group_id'] == 2, 1., 3.)
+    pop.loc[pop.location_id == 32, 'population'] = 1.
+    pop.loc[pop.location_id == 4, 'population'] = np.where(pop.loc[pop.location_id == 4, 'age_group_id'] == 2, 2., 4.)
+    pop.loc[pop.location_id == 1, 'population'] = 8.
+    return pop
+
+
+def test_complete_covariate_locations(small_hierarchy, small_population):
+    cov = small_population.loc[small_population.location_id.isin([31, 32]),
+                               ['location_id', 'year_id', 'age_group_id', 'sex_id']].copy()
+    cov['mean_value'] = np.where(cov.location_id == 31, 1., 0.)
+    df = CovariateData.complete_covariate_locations(
+        cov_df=cov, pop_df=small_population, location_dag=small_hierarchy,
+        locations=[1, 4, 31, 32]
+    )
+    assert len(df) == 4 * 2 * 3
+    parent = df.loc[df.location_id == 4].set_index('age_group_id').mean_value
+    assert np.allclose(parent.loc[2], 1. / 2.)
+    assert np.allclose(parent.loc[3], 3. / 4.)
+    root = df.loc[df.location_id == 1].set_index('age_group_id').mean_value
+    assert np.allclose(root.loc[2], 1. / 8.)
+    assert np.allclose(root.loc[3], 3. / 8.)
+
+
+def test_complete_covariate_locations_not_age_specific(small_hierarchy, small_population):
+    cov = pd.DataFrame({
+        'location_id': [31, 31, 31, 32, 32, 32],
+        'year_id': 2000,
+        'age_group_id': 22,
+        'sex_id': [1, 2, 3] * 2,
+        'mean_value': [1., 1., 1., 0., 0., 0.]
+    })
+    df = CovariateData.complete_covariate_locations(
+        cov_df=cov, pop_df=small_population, location_dag=small_hierarchy,
+        locations=[1, 4, 31, 32]
+    )
+    assert (df.loc[df.location_id.isin([31, 32])].age_group_id == 22).all()
+    parent = df.loc[df.location_id == 4]
+    assert set(parent.age_group_id) == {2, 3}
+    assert np.allclose(parent.loc[parent.age_group_id == 3].mean_value, 3. / 4.)
+
+
+def test_complete_covariate_locations_nothing_missing(small_hierarchy, small_population):
+    cov = small_population[['location_id', 'year_id', 'age_group_id', 'sex_id']].copy()
+    cov['mean_value'] = 1.
+    df = CovariateData.complete_covariate_locations(
+        cov_df=cov, pop_df=small_population, location_dag=small_hierarchy,
+        locations=[1, 4, 31, 32]
+    )
+    assert len(df) == len(cov)
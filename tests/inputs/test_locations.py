@@ -1,3 +1,12 @@
+import pickle
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.inputs.locations import LocationDAG
+
 
 def test_not_empty_df(dag):
     assert not dag.df.empty
@@ -32,3 +41,93 @@ def test_parent_children(dag):
 
 def test_root(dag):
     assert dag.dag.graph["root"] == 1
+
+
+@pytest.fixture
+def small_dag():
+    df = pd.DataFrame({
+        'location_id': [1, 4, 31, 32, 64, 66, 5, 6],
+        'parent_id': [1, 1, 4, 4, 31, 31, 1, 5],
+        'location_name': ['Global', 'A', 'AA', 'AB', 'AAA', 'AAB', 'B', 'BA']
+    })
+    return LocationDAG(df=df)
+
+
+def test_small_children(small_dag):
+    assert small_dag.children(1) == [4, 5]
+    assert small_dag.children(31) == [64, 66]
+    assert small_dag.children(64) == []
+    assert small_dag.parent_children(4) == [4, 31, 32]
+    assert small_dag.parent(31) == 4
+    assert small_dag.parent(1) is None
+
+
+def test_small_descendants(small_dag):
+    assert small_dag.descendants(1) == {4, 5, 6, 31, 32, 64, 66}
+    assert small_dag.descendants(4) == {31, 32, 64, 66}
+    assert small_dag.descendants(66) == set()
+    assert small_dag.is_descendant(66, 4)
+    assert not small_dag.is_descendant(4, 4)
+    assert not small_dag.is_descendant(6, 4)
+
+
+def test_small_in_subtree(small_dag):
+    locations = np.array([1, 4, 31, 6, 66, 1000])
+    np.testing.assert_array_equal(
+        small_dag.in_subtree(locations, 4),
+        [False, True, True, False, True, False]
+    )
+    np.testing.assert_array_equal(
+        small_dag.in_subtree(locations, 4, include_ancestor=False),
+        [False, False, True, False, True, False]
+    )
+
+
+def test_small_depth(small_dag):
+    assert small_dag.depth(1) == 0
+    assert small_dag.depth(5) == 1
+    assert small_dag.depth(66) == 3
+
+
+def test_small_matches_networkx(small_dag):
+    dag = small_dag.dag
+    assert dag.graph["root"] == 1
+    assert dag.nodes[31]['location_name'] == 'AA'
+    for location_id in small_dag.location_ids:
+        assert small_dag.descendants(location_id) == nx.descendants(dag, location_id)
+        assert small_dag.children(location_id) == list(dag.successors(location_id))
+    assert small_dag.to_dataframe().location_id.tolist() == list(nx.lexicographical_topological_sort(dag))
+
+
+def test_small_to_dataframe(small_dag):
+    df = small_dag.to_dataframe()
+    assert df.location_id.tolist() == [1, 4, 5, 6, 31, 32, 64, 66]
+    assert np.isnan(df.parent_id.iloc[0])
+    assert df.parent_id.tolist()[1:] == [1, 1, 5, 4, 4, 31, 31]
+    assert df.name.tolist()[:2] == ['Global', 'A']
+
+
+def test_small_pickle(small_dag):
+    small_dag.dag
+    copy = pickle.loads(pickle.dumps(small_dag))
+    assert copy._dag is None
+    assert copy.children(31) == [64, 66]
+    assert copy.descendants(5) == {6}
+
+
+def test_small_missing_location(small_dag):
+    with pytest.raises(KeyError):
+        small_dag.children(7)
+
+
+def test_disconnected_location():
+    df = pd.DataFrame({
+        'location_id': [1, 4, 90, 91],
+        'parent_id': [1, 1, 91, 90],
+        'location_name': ['Global', 'A', 'X', 'Y']
+    })
+    dag = LocationDAG(df=df)
+    assert dag.descendants(1) == {4}
+    assert dag.descendants(90) == set()
+    assert not dag.is_descendant(4, 90)
+    np.testing.assert_array_equal(dag.in_subtree(np.array([4, 90, 91]), 90), [False, False, False])
@@ -1,9 +1,17 @@
+import time
+from types import SimpleNamespace
+
 import pytest
 import numpy as np
+import pandas as pd
 
+from cascade_at.executor.dismod_db import database_executor
 from cascade_at.settings.base_case import BASE_CASE
 from cascade_at.settings.settings import load_settings
+from cascade_at.inputs import measurement_inputs
+from cascade_at.inputs.covariate_specs import CovariateSpecs
 from cascade_at.inputs.measurement_inputs import MeasurementInputs
+from cascade_at.inputs.utilities.covariate_specifications import EpiVizCovariate
 
 
 @pytest.mark.parametrize("column,values", [
@@ -58,3 +66,55 @@ def test_data_cv_from_settings_by_integrand():
             assert v == 0.5
         else:
             assert v == 0.1
+
+
+@pytest.fixture
+def reference_inputs(monkeypatch):
+    """
+    Inputs with the sex, one and a country covariate, where interpolating
+    the country covariate is slow and gives the parent's location ID plus a tenth of the sex.
+    """
+    def slow_interpolation(data_df, covariate_dict, population_df):
+        time.sleep(0.01)
+        row = data_df.iloc[0]
+        return pd.DataFrame({name: [row.location_id + row.sex_id / 10] for name in covariate_dict})
+
+    monkeypatch.setattr(measurement_inputs, 'get_interpolated_covariate_values', slow_interpolation)
+    specs = list()
+    for study_country, covariate_id, name in [('study', 0, 's_sex'), ('study', 1604, 's_one'),
+                                              ('country', 28, 'c_diabetes_fpg')]:
+        spec = EpiVizCovariate(study_country, covariate_id, 0)
+        spec.untransformed_covariate_name = name
+        specs.append(spec)
+    covariate_specs = CovariateSpecs.__new__(CovariateSpecs)
+    covariate_specs.covariate_specs = specs
+    covariate_specs.covariate_multipliers = list()
+    covariate_specs.covariate_list = list()
+
+    mi = MeasurementInputs.__new__(MeasurementInputs)
+    mi.covariate_specs = covariate_specs
+    mi.dismod_data = pd.DataFrame({'age_lower': [0.], 'age_upper': [100.],
+                                   'time_lower': [1990.], 'time_upper': [2000.]})
+    mi.location_dag = SimpleNamespace(children=lambda location_id: [location_id * 10])
+    mi.country_covariate_data = {28: pd.DataFrame({
+        'location_id': [1, 2, 10, 20], 'mean_value': [1., 2., 3., 4.]
+    })}
+    mi.population = SimpleNamespace(configure_for_dismod=lambda: pd.DataFrame({'location_id': [1, 2]}))
+    return mi
+
+
+def test_reference_values_in_threads(reference_inputs):
+    databases = [(location_id, sex_id) for location_id in [1, 2] for sex_id in [1, 2, 3]]
+
+    def references(location_id, sex_id):
+        specs = reference_inputs.calculate_country_covariate_reference_values(location_id, sex_id)
+        return [(c.name, c.reference, c.max_difference) for c in specs.covariate_list]
+
+    sequential = [references(*database) for database in databases]
+    with database_executor(pool='thread', n_workers=len(databases)) as executor:
+        concurrent = list(executor.map(references, *zip(*databases)))
+    assert concurrent == sequential
+    assert [[reference for _, reference, _ in database] for database in sequential] == [
+        [0.5, 1., 1.1], [-0.5, 1., 1.2], [0., 1., 1.3], [0.5, 1., 2.1], [-0.5, 1., 2.2], [0., 1., 2.3]
+    ]
+    assert [c.reference for c in reference_inputs.covariate_specs.covariate_specs] == [0, 0, 0]
@@ -2,7 +2,8 @@ import pytest
 import numpy as np
 import pandas as pd
 
-from cascade_at.inputs.utilities.covariate_weighting import CovariateInterpolator
+from cascade_at.inputs.utilities.covariate_weighting import CovariateInterpolator, get_interpolated_covariate_values
+from cascade_at.inputs.utilities.stage_cache import StageCache
 
 
 @pytest.fixture
@@ -215,3 +216,51 @@ def test_covariate_interpolation_over_age_and_time(covariate_interpolator, y0, y
             float(data.time_upper)),
         weighted_cov, atol=1e-10, rtol=1e-10
     )
+
+
+@pytest.mark.parametrize("n_processes", [1, 2])
+def test_get_interpolated_covariate_values(test_cov, test_pop, covariate_interpolator, n_processes):
+    data = pd.DataFrame({
+        'location_id': [100, 100, 100, 101],
+        'sex_id': 1,
+        'age_lower': [87., 90., 87., 90.],
+        'age_upper': [100., 95., 100., 95.],
+        'time_lower': [2010., 2010.5, 2010., 2010.],
+        'time_upper': [2011.5, 2011., 2011.5, 2011.],
+        'meas_value': [1., 2., 3., 4.]
+    })
+    other = test_cov.copy()
+    other['mean_value'] = other.mean_value * 2
+    df = get_interpolated_covariate_values(
+        data_df=data, covariate_dict={'c_one': test_cov, 'c_two': other},
+        population_df=test_pop, n_processes=n_processes
+    )
+    expected = [covariate_interpolator.interpolate(100, 1, 87., 100., 2010., 2011.5),
+                covariate_interpolator.interpolate(100, 1, 90., 95., 2010.5, 2011.)]
+    np.testing.assert_allclose(df.c_one.values[:3], [expected[0], expected[1], expected[0]])
+    np.testing.assert_allclose(df.c_two.values[:3], 2 * df.c_one.values[:3])
+    # The covariate isn't there for location 101.
+    assert np.isnan(df.c_one.values[3])
+    np.testing.assert_array_equal(df.meas_value, data.meas_value)
+
+
+def test_get_interpolated_covariate_values_cached(test_cov, test_pop, tmp_path):
+    data = pd.DataFrame({
+        'location_id': [100, 100],
+        'sex_id': 1,
+        'age_lower': [87., 90.],
+        'age_upper': [100., 95.],
+        'time_lower': [2010., 2010.5],
+        'time_upper': [2011.5, 2011.]
+    })
+    stage_cache = StageCache(directory=tmp_path)
+    made = get_interpolated_covariate_values(
+        data_df=data, covariate_dict={'c_one': test_cov}, population_df=test_pop, stage_cache=stage_cache
+    )
+    # The same covariate under another name reads the values from the cache.
+    read = get_interpolated_covariate_values(
+        data_df=data, covariate_dict={'c_two': test_cov}, population_df=test_pop, stage_cache=stage_cache
+    )
+    assert stage_cache.misses == ['interpolated_covariate']
+    assert stage_cache.hits == ['interpolated_covariate']
+    np.testing.assert_array_equal(read.c_two.values, made.c_one.values)
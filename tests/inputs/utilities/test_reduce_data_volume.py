@@ -2,7 +2,13 @@ import pytest
 import pandas as pd
 import numpy as np
 
-from cascade_at.inputs.utilities.reduce_data_volume import decimate_years
+from copy import deepcopy
+
+from cascade_at.inputs.utilities.reduce_data_volume import (
+    decimate_years, bin_years, bin_ages, cap_rows, pool_observations, reduce_data_volume, strategies_from_settings
+)
+from cascade_at.settings.base_case import BASE_CASE
+from cascade_at.settings.settings import load_settings
 
 
 @pytest.fixture
@@ -45,3 +51,100 @@ def test_decimate_years(fake_data):
         }),
         check_names=False
     )
+
+
+@pytest.fixture
+def bundle_data():
+    return pd.DataFrame({
+        'location_id': [101, 101, 101, 101, 102, 102],
+        'sex_id': 2,
+        'measure': ['prevalence'] * 5 + ['Sincidence'],
+        'hold_out': [0, 0, 0, 1, 0, 0],
+        'age_lower': [0., 2., 20., 3., 0., 0.],
+        'age_upper': [2., 4., 25., 4., 2., 2.],
+        'time_lower': [2000., 2001., 2000., 2000., 2000., 2000.],
+        'time_upper': [2001., 2002., 2001., 2001., 2001., 2001.],
+        'meas_value': [0.1, 0.3, 0.5, 0.7, 0.2, 0.4],
+        'meas_std': [0.1, 0.2, 0.1, 0.1, 0.05, 0.],
+        'name': ['a', 'b', 'c', 'd', 'e', 'f']
+    })
+
+
+def test_pool_observations(bundle_data):
+    pooled = pool_observations(bundle_data, age_width=5., time_width=5.)
+    assert pooled.name.tolist() == ['a', 'c', 'd', 'e', 'f']
+    weights = np.array([1 / 0.1 ** 2, 1 / 0.2 ** 2])
+    first = pooled.iloc[0]
+    assert first.meas_value == pytest.approx((weights * [0.1, 0.3]).sum() / weights.sum())
+    assert first.meas_std == pytest.approx(np.sqrt(1 / weights.sum()))
+    assert (first.age_lower, first.age_upper, first.time_lower, first.time_upper) == (0., 4., 2000., 2002.)
+    # Held out and zero standard deviation rows are left as they are.
+    pd.testing.assert_series_equal(pooled.iloc[2], bundle_data.iloc[3], check_names=False)
+    pd.testing.assert_series_equal(pooled.iloc[4], bundle_data.iloc[5], check_names=False)
+
+
+def test_bin_ages(bundle_data):
+    binned = bin_ages(bundle_data.assign(time_lower=2000., time_upper=2001.), age_bins=[0., 5., 50.])
+    assert binned.name.tolist() == ['a', 'c', 'd', 'e', 'f']
+    assert binned.meas_value.iloc[0] == pytest.approx(0.2)
+    assert binned.meas_std.iloc[0] == pytest.approx(0.15)
+    assert binned.age_upper.iloc[0] == 4.
+
+
+def test_bin_years():
+    data = pd.DataFrame({
+        'location_id': 101,
+        'sex_id': 2,
+        'measure': 'prevalence',
+        'hold_out': 0,
+        'age_lower': [0., 0., 0., 0., 5.],
+        'age_upper': [5., 5., 5., 5., 10.],
+        'time_lower': [1990., 1992., 1985., 1996., 1991.],
+        'time_upper': [1991., 1993., 1999., 1997., 1992.],
+        'meas_value': [0.1, 0.3, 0.5, 0.7, 0.2],
+        'meas_std': [0.1, 0.3, 0.1, 0.1, 0.1],
+        'name': ['a', 'b', 'c', 'd', 'e'],
+        'nid': [1., np.nan, np.nan, 4., np.nan],
+        'seq': [np.nan] * 5
+    })
+    binned = bin_years(data, num_years=5)
+    # Missing values don't drop rows, and rows with different names are combined.
+    assert binned.name.tolist() == ['a', 'c', 'd', 'e']
+    first = binned.iloc[0]
+    assert first.meas_value == pytest.approx(0.2)
+    assert first.meas_std == pytest.approx(0.2)
+    assert (first.time_lower, first.time_upper) == (1990., 1993.)
+    # The multi-year study interval stays as it is.
+    pd.testing.assert_series_equal(binned.iloc[1], data.iloc[2], check_names=False)
+    assert binned.time_lower.iloc[2] == 1996.
+    assert binned.age_lower.iloc[3] == 5.
+
+
+def test_cap_rows(bundle_data):
+    capped = cap_rows(bundle_data, max_rows=2)
+    assert capped.name.tolist() == ['a', 'c', 'e', 'f']
+
+
+def test_reduce_data_volume(bundle_data):
+    reduced, report = reduce_data_volume(bundle_data, [
+        ('pool_observations', dict()), ('cap_rows', dict(max_rows=1))
+    ])
+    assert reduced.name.tolist() == ['a', 'e', 'f']
+    assert report == [
+        {'strategy': 'pool_observations', 'rows_before': 6, 'rows_after': 5},
+        {'strategy': 'cap_rows', 'rows_before': 5, 'rows_after': 3}
+    ]
+    with pytest.raises(ValueError):
+        reduce_data_volume(bundle_data, [('sample', dict())])
+
+
+def test_strategies_from_settings():
+    assert strategies_from_settings(load_settings(BASE_CASE)) == list()
+    settings = deepcopy(BASE_CASE)
+    settings['data_reduction'] = [
+        {'strategy': 'pool_observations', 'age_width': 10, 'max_rows': 3},
+        {'strategy': 'cap_rows', 'max_rows': 100}
+    ]
+    assert strategies_from_settings(load_settings(settings)) == [
+        ('pool_observations', {'age_width': 10.}), ('cap_rows', {'max_rows': 100})
+    ]
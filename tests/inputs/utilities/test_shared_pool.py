@@ -0,0 +1,44 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from cascade_at.inputs.utilities.shared_pool import SHARED, map_with_shared
+
+
+def _scaled_sum(scale):
+    return os.getpid(), float(SHARED['values'].sum() * scale)
+
+
+@pytest.mark.parametrize("n_processes", [1, 3])
+def test_map_with_shared(n_processes):
+    results = map_with_shared(_scaled_sum, [1, 2, 3], shared={'values': np.arange(5.)}, n_processes=n_processes)
+    assert [r[1] for r in results] == [10., 20., 30.]
+    assert ({r[0] for r in results} == {os.getpid()}) == (n_processes == 1)
+    assert 'values' not in SHARED
+
+
+def test_map_with_shared_clears_on_error():
+    with pytest.raises(KeyError):
+        map_with_shared(_scaled_sum, [1], shared={'other': 1})
+    assert 'other' not in SHARED
+
+
+@pytest.fixture
+def spawn_by_default():
+    method = multiprocessing.get_start_method()
+    multiprocessing.set_start_method('spawn', force=True)
+    yield
+    multiprocessing.set_start_method(method, force=True)
+
+
+def test_map_with_shared_forks_whatever_the_default(spawn_by_default):
+    results = map_with_shared(_scaled_sum, [1, 2], shared={'values': np.arange(5.)}, n_processes=2)
+    assert [r[1] for r in results] == [10., 20.]
+
+
+def test_map_with_shared_without_fork(monkeypatch):
+    monkeypatch.setattr(multiprocessing, 'get_all_start_methods', lambda: ['spawn'])
+    results = map_with_shared(_scaled_sum, [1, 2], shared={'values': np.arange(5.)}, n_processes=2)
+    assert [r for r in results] == [(os.getpid(), 10.), (os.getpid(), 20.)]
@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.inputs.utilities.stage_cache import StageCache, cached
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'location_id': np.arange(100),
+        'measure': ['Sincidence', 'prevalence'] * 50,
+        'meas_value': np.linspace(0., 1., 100)
+    })
+
+
+class Counter:
+    def __init__(self, df):
+        self.df = df
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.df
+
+
+def test_put_get(df, tmp_path):
+    stage_cache = StageCache(directory=tmp_path)
+    key = stage_cache.key('stage', df, 5)
+    assert stage_cache.get(key) is None
+    stage_cache.put(key, df)
+    pd.testing.assert_frame_equal(stage_cache.get(key), df)
+
+
+def test_put_upcasts(df, tmp_path):
+    stage_cache = StageCache(directory=tmp_path)
+    compact = df.astype({'location_id': np.int16, 'meas_value': np.float32, 'measure': 'category'})
+    stage_cache.put('stage', compact)
+    read = stage_cache.get('stage')
+    assert read.meas_value.dtype == np.float64
+    assert read.location_id.dtype == np.int64
+    assert read.measure.dtype == object
+
+
+def test_cached_hit(df, tmp_path):
+    stage_cache = StageCache(directory=tmp_path)
+    compute = Counter(df)
+    first = stage_cache.cached('stage', [df, 'settings'], compute)
+    second = stage_cache.cached('stage', [df.copy(), 'settings'], compute)
+    assert compute.calls == 1
+    assert stage_cache.misses == ['stage']
+    assert stage_cache.hits == ['stage']
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_key_changes_with_parts(df, tmp_path):
+    stage_cache = StageCache(directory=tmp_path)
+    changed = df.copy()
+    changed.loc[0, 'meas_value'] = 2.
+    key = stage_cache.key('stage', df, 5)
+    assert key.startswith('stage_')
+    assert key == stage_cache.key('stage', df.copy(), 5)
+    assert key != stage_cache.key('stage', changed, 5)
+    assert key != stage_cache.key('stage', df, 1)
+    assert key != stage_cache.key('other', df, 5)
+
+
+def test_evict_least_recently_used(df, tmp_path):
+    stage_cache = StageCache(directory=tmp_path)
+    for i, key in enumerate(['a', 'b', 'c']):
+        stage_cache.put(key, df)
+        os.utime(tmp_path / f'{key}.h5', (i, i))
+    # Reading a makes it the most recently used.
+    stage_cache.get('a')
+    size = (tmp_path / 'a.h5').stat().st_size
+    stage_cache.max_bytes = 2 * size
+    assert stage_cache.evict() == ['b']
+    assert stage_cache.get('b') is None
+    assert stage_cache.get('a') is not None
+    assert stage_cache.get('c') is not None
+
+
+def test_unreadable_stage_is_a_miss(df, tmp_path):
+    stage_cache = StageCache(directory=tmp_path)
+    (tmp_path / f"{stage_cache.key('stage')}.h5").write_text('not a stage')
+    compute = Counter(df)
+    stage_cache.cached('stage', [], compute)
+    assert compute.calls == 1
+    assert stage_cache.misses == ['stage']
+    # The stage is written over with one that can be read.
+    stage_cache.cached('stage', [], compute)
+    assert compute.calls == 1
+
+
+def test_cached_without_cache(df):
+    compute = Counter(df)
+    cached(None, 'stage', [df], compute)
+    cached(None, 'stage', [df], compute)
+    assert compute.calls == 2
@@ -0,0 +1,115 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cascade_at.cascade.cascade_commands import CascadeCommand, Drill
+from cascade_at.cascade.cascade_operations import FitBoth, SampleSimulate
+from cascade_at.jobmon.resources import (
+    DEFAULT_EXECUTOR_PARAMETERS, OPERATION_PARAMETERS, ResourceEstimator,
+    assign_resources, critical_path_order, critical_path_priorities,
+    measure_command, operation_features, read_task_metrics, record_task_metrics
+)
+
+
+@pytest.fixture
+def history():
+    n_data = np.array([100, 200, 400, 800, 1600, 3200, 100, 100])
+    return pd.DataFrame({
+        'operation': ['dismod_db'] * 6 + ['format_upload'] * 2,
+        'returncode': 0,
+        'runtime_seconds': np.r_[n_data[:6] * 10., 100., 300.],
+        'max_rss_gb': np.r_[n_data[:6] / 100., 1., 3.],
+        'n_data': n_data,
+    })
+
+
+def test_operation_features():
+    class DAG:
+        def children(self, location_id):
+            return [1, 2, 3] if location_id == 1 else []
+    fit = FitBoth(model_version_id=0, parent_location_id=[1, 2], sex_id=[1, 2])
+    features = operation_features(fit, location_dag=DAG(), n_data=10)
+    assert features == {'n_data': 10, 'n_databases': 4, 'n_children': 3}
+    sample = SampleSimulate(model_version_id=0, parent_location_id=1, sex_id=2,
+                            n_simulations=5, n_pools=2, fit_type='both')
+    assert operation_features(sample)['n_simulations'] == 5
+
+
+def test_measure_command():
+    measurement = measure_command(f'{sys.executable} -c "import sys; print(1); sys.exit(3)"')
+    assert measurement['returncode'] == 3
+    assert measurement['stdout'].strip() == '1'
+    assert measurement['runtime_seconds'] > 0
+    assert measurement['max_rss_gb'] > 0
+
+
+def test_metrics_round_trip(tmp_path):
+    fit = FitBoth(model_version_id=0, parent_location_id=1, sex_id=2)
+    measurement = {'returncode': 0, 'runtime_seconds': 10., 'max_rss_gb': 2.}
+    path = tmp_path / 'logs' / 'task_metrics.jsonl'
+    record_task_metrics(path, fit, measurement, {'n_data': 5, 'other': 1})
+    record_task_metrics(path, fit, measurement, {})
+    df = read_task_metrics([path, tmp_path / 'missing.jsonl'])
+    assert len(df) == 2
+    assert (df.operation == 'dismod_db').all()
+    assert df.n_data.iloc[0] == 5
+    assert np.isnan(df.n_data.iloc[1])
+
+
+def test_estimator_without_history():
+    estimator = ResourceEstimator()
+    assert estimator.estimate('dismod_db', {})['m_mem_free'] == DEFAULT_EXECUTOR_PARAMETERS['m_mem_free']
+    upload = estimator.estimate('format_upload', {})
+    assert upload['m_mem_free'] == OPERATION_PARAMETERS['format_upload']['m_mem_free']
+    assert upload['resource_scales'] == DEFAULT_EXECUTOR_PARAMETERS['resource_scales']
+
+
+def test_estimator_regression(history):
+    estimator = ResourceEstimator(history=history, memory_margin=1., runtime_margin=1.)
+    # Memory and runtime are proportional to the data, so the regression on the log scale recovers them.
+    assert estimator.predict('dismod_db', 'max_rss_gb', {'n_data': 6400}) == pytest.approx(64, rel=0.05)
+    assert estimator.estimate('dismod_db', {'n_data': 6400})['m_mem_free'] == '65G'
+    assert estimator.estimate('dismod_db', {'n_data': 100})['max_runtime_seconds'] == pytest.approx(1000, rel=0.05)
+
+
+def test_estimator_short_history(history):
+    estimator = ResourceEstimator(history=history, memory_margin=2.)
+    # With two runs, the estimate is the largest run.
+    assert estimator.predict('format_upload', 'max_rss_gb', {}) == pytest.approx(3.)
+    assert estimator.estimate('format_upload', {})['m_mem_free'] == '6G'
+    assert estimator.estimate('format_upload', {})['max_runtime_seconds'] == 60 * 10
+
+
+def test_estimator_ignores_failures(history):
+    history.loc[history.operation == 'format_upload', 'returncode'] = 1
+    estimator = ResourceEstimator(history=history)
+    assert estimator.predict('format_upload', 'max_rss_gb', {}) is None
+
+
+def test_assign_resources(history):
+    drill = Drill(model_version_id=0, drill_parent_location_id=1, drill_sex=2)
+    priorities = assign_resources(drill, ResourceEstimator(history=history), n_data=100)
+    fit, upload = list(drill.task_dict.values())[1:]
+    assert fit.features['n_data'] == 100
+    assert fit.executor_parameters['m_mem_free'] != DEFAULT_EXECUTOR_PARAMETERS['m_mem_free']
+    assert DEFAULT_EXECUTOR_PARAMETERS['m_mem_free'] == '30G'
+    assert priorities[fit.command] == (fit.executor_parameters['max_runtime_seconds']
+                                       + upload.executor_parameters['max_runtime_seconds'])
+
+
+def test_critical_path_order():
+    class Operation:
+        def __init__(self, command, runtime, upstream):
+            self.command = command
+            self.executor_parameters = {'max_runtime_seconds': runtime}
+            self.upstream_commands = upstream
+
+    command = CascadeCommand()
+    for operation in [Operation('a', 1, []), Operation('short', 1, ['a']), Operation('long', 5, ['a']),
+                      Operation('after_short', 10, ['short']), Operation('end', 1, ['long', 'after_short'])]:
+        command.add_task(operation)
+    priorities = critical_path_priorities(command.task_dict)
+    assert priorities == {'a': 13, 'short': 12, 'long': 6, 'after_short': 11, 'end': 1}
+    assert critical_path_order(command.task_dict, priorities) == ['a', 'short', 'after_short', 'long', 'end']
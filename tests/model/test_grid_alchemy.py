@@ -5,6 +5,7 @@ from copy import deepcopy
 from cascade_at.settings.settings import load_settings
 from cascade_at.settings.base_case import BASE_CASE
 from cascade_at.model.grid_alchemy import Alchemy
+from cascade_at.model.priors import Uniform
 
 
 @pytest.fixture(scope='module')
@@ -52,6 +53,17 @@ def test_get_smoothing_grid(modified_settings, alchemy):
     np.testing.assert_array_equal(sm.times, np.array([1990., 1995., 2000., 2005., 2010., 2015., 2016.]))
 
 
+def test_get_smoothing_grid_copies_template(modified_settings, alchemy):
+    rate_settings = {c.rate: c for c in modified_settings.rate}
+    first = alchemy.get_smoothing_grid(rate=rate_settings['iota'])
+    second = alchemy.get_smoothing_grid(rate=rate_settings['iota'])
+    assert first == second
+    assert first is not second
+    first.value[0, 1990] = Uniform(lower=0.1, upper=0.5, mean=0.2)
+    assert first != second
+    assert alchemy.get_smoothing_grid(rate=rate_settings['iota']) == second
+
+
 def test_get_all_smooth_grids(alchemy, default_ages, default_times):
     all_grids = alchemy.get_all_rates_grids()
     np.testing.assert_array_equal(all_grids['iota'].ages, np.array([0., 5., 10., 50., 100.]))
@@ -86,3 +98,13 @@ def test_pini_grid(model):
     np.testing.assert_array_equal(model['rate']['pini'].ages, np.array([0.]))
     np.testing.assert_array_equal(model['rate']['pini'].times, np.array([2005.]))
 
+
+
+def test_alchemy_pickle(modified_settings):
+    import pickle
+    alchemy = Alchemy(modified_settings)
+    alchemy.get_all_rates_grids()
+    assert alchemy._grid_templates
+    loaded = pickle.loads(pickle.dumps(alchemy))
+    assert not loaded._grid_templates
+    assert loaded.get_all_rates_grids() == alchemy.get_all_rates_grids()
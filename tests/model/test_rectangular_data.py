@@ -3,7 +3,12 @@ import pandas as pd
 import numpy as np
 
 from cascade_at.model.var import Var
-from cascade_at.model.utilities.grid_helpers import rectangular_data_to_var
+from cascade_at.model.priors import Constant
+from cascade_at.model.smooth_grid import SmoothGrid
+from cascade_at.model.utilities.grid_helpers import (
+    rectangular_data_to_var, interpolation_weights, interpolate_rectangular_data,
+    constant_grid, constraint_from_rectangular_data
+)
 
 
 @pytest.fixture
@@ -39,3 +44,50 @@ def test_rectangular_data_to_var(rectangular_data, shuffle):
     assert rectangular[0.5, 1951.5] == 0.04
     assert rectangular[3.0, 1951.5] == 0.05
     assert rectangular[7.5, 1951.5] == 0.06
+
+
+def test_interpolation_weights():
+    weights = interpolation_weights(np.array([0., 1., 5.]), np.array([-1., 0., 0.5, 3., 5., 10.]))
+    np.testing.assert_allclose(weights.sum(axis=1), 1.)
+    np.testing.assert_allclose(weights @ np.array([1., 2., 4.]), [1., 1., 1.5, 3., 4., 4.])
+    np.testing.assert_allclose(interpolation_weights(np.array([2.]), np.array([0., 3.])), [[1.], [1.]])
+
+
+def test_interpolate_rectangular_data_matches_var(rectangular_data):
+    data = pd.concat([
+        rectangular_data.assign(location_id=1),
+        rectangular_data.assign(location_id=2, mean=rectangular_data['mean'] * 2)
+    ]).sample(frac=1, random_state=0)
+    ages = np.array([0., 0.5, 2., 7.5, 20.])
+    times = np.array([1950., 1951., 1960.])
+    interpolated = interpolate_rectangular_data(data, ages=ages, times=times)
+    assert set(interpolated) == {1, 2}
+    for location_id, values in interpolated.items():
+        var = rectangular_data_to_var(data.loc[data.location_id == location_id])
+        expected = np.array([[var(a, t) for t in times] for a in ages])
+        np.testing.assert_allclose(values, expected)
+
+
+def test_interpolate_rectangular_data_different_grids(rectangular_data):
+    other = rectangular_data.loc[rectangular_data.time_lower == 1950].assign(location_id=2)
+    data = pd.concat([rectangular_data.assign(location_id=1), other])
+    ages = np.array([0., 3., 10.])
+    times = np.array([1950., 1952.])
+    interpolated = interpolate_rectangular_data(data, ages=ages, times=times)
+    var = rectangular_data_to_var(other)
+    np.testing.assert_allclose(interpolated[2], [[var(a, t) for t in times] for a in ages])
+
+
+def test_constant_grid_matches_constraint(rectangular_data):
+    default_age_time = {'age': np.array([10., 0., 5.]), 'time': np.array([1950., 1952.])}
+    var = rectangular_data_to_var(rectangular_data)
+    by_point = SmoothGrid(ages=default_age_time['age'], times=default_age_time['time'])
+    for age, time in by_point.age_time():
+        by_point.value[age, time] = Constant(var(age, time))
+    values = interpolate_rectangular_data(
+        rectangular_data.assign(location_id=1), ages=by_point.ages, times=by_point.times
+    )[1]
+    assert constant_grid(values, default_age_time) == by_point
+    assert constraint_from_rectangular_data(var, default_age_time) == by_point
+    with pytest.raises(ValueError):
+        constant_grid(values[:2], default_age_time)
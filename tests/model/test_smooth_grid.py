@@ -1,3 +1,4 @@
+import numpy as np
 from numpy import isclose
 
 import pytest
@@ -61,3 +62,19 @@ def test_smooth_grid_mulstd():
     grid.value.mulstd_prior = Gaussian(mean=0.1, standard_deviation=0.02)
     assert grid.value.mulstd_prior.standard_deviation == 0.02
     assert isinstance(grid.value.mulstd_prior, Gaussian)
+
+
+def test_smooth_grid_clone():
+    grid = SmoothGrid([0, 5, 10, 20], [2000, 2010])
+    grid.value[:, :] = Gaussian(mean=0.1, standard_deviation=5.0)
+    grid.dage.mulstd_prior = Gaussian(mean=0.1, standard_deviation=0.02)
+    copied = grid.clone()
+    assert copied == grid
+    np.testing.assert_array_equal(copied.ages, grid.ages)
+
+    copied.value[5, 2000] = Gaussian(mean=0.3, standard_deviation=1.0)
+    copied.dage.mulstd_prior = Gaussian(mean=0.2, standard_deviation=0.02)
+    assert grid.value[5, 2000].mean == 0.1
+    assert grid.dage.mulstd_prior.mean == 0.1
+    assert copied.value[5, 2000].mean == 0.3
+    assert copied.dage.mulstd_prior.mean == 0.2
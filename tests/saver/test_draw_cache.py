@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from cascade_at.saver.draw_cache import DrawCache
+
+
+@pytest.fixture
+def draws():
+    rng = np.random.RandomState(0)
+
+    def rate_draws(n_ages, n_times, n_draws):
+        return {
+            'ages': np.linspace(0, 100, n_ages), 'times': np.linspace(1990, 2010, n_times),
+            'n_draws': n_draws, 'value': rng.uniform(size=(n_ages, n_times, n_draws))
+        }
+    return {
+        (102, 1): {'iota': rate_draws(3, 2, 5), 'chi': rate_draws(1, 1, 5)},
+        (102, 2): {'iota': rate_draws(3, 2, 5), 'chi': rate_draws(1, 1, 5)},
+        (103, 1): {'iota': rate_draws(4, 3, 5)}
+    }
+
+
+def test_write_read(draws, tmp_path):
+    cache = DrawCache(directory=tmp_path / 'cache')
+    assert cache.write(draws) == 5
+    assert not list((tmp_path / 'cache').glob('.*tmp'))
+
+    cache = DrawCache(directory=tmp_path / 'cache')
+    for (location_id, sex_id), rate_dict in draws.items():
+        result = cache.read(location_id=location_id, sex_id=sex_id, rates=list(rate_dict.keys()))
+        for rate, expected in rate_dict.items():
+            np.testing.assert_array_equal(result[rate]['value'], expected['value'])
+            np.testing.assert_array_equal(result[rate]['ages'], expected['ages'])
+            np.testing.assert_array_equal(result[rate]['times'], expected['times'])
+            np.testing.assert_array_equal(result[rate]['dage'], np.diff(expected['value'], axis=0))
+            np.testing.assert_array_equal(result[rate]['dtime'], np.diff(expected['value'], axis=1))
+            assert result[rate]['n_draws'] == 5
+    assert isinstance(result['iota']['value'].base, np.memmap)
+
+
+def test_missing(draws, tmp_path):
+    cache = DrawCache(directory=tmp_path)
+    assert cache.read(location_id=102, sex_id=1, rates=['iota']) is None
+    cache.write(draws)
+    assert cache.has(location_id=103, sex_id=1, rates=['iota'])
+    assert not cache.has(location_id=103, sex_id=1, rates=['iota', 'chi'])
+    assert cache.read(location_id=103, sex_id=2, rates=['iota']) is None
+
+
+def test_source_changed(draws, tmp_path):
+    source = tmp_path / 'dismod.db'
+    source.write_bytes(b'fit')
+    DrawCache(directory=tmp_path, source=source).write(draws)
+    assert DrawCache(directory=tmp_path, source=source).has(location_id=103, sex_id=1, rates=['iota'])
+
+    # The parent is fit again, so its draws in the cache are stale.
+    source.write_bytes(b'fit again')
+    cache = DrawCache(directory=tmp_path, source=source)
+    assert cache.read(location_id=103, sex_id=1, rates=['iota']) is None
+
+
+def test_write_replaces_draw_file(draws, tmp_path):
+    cache = DrawCache(directory=tmp_path)
+    cache.write(draws)
+    first = cache.manifest['draw_file']
+    reader = DrawCache(directory=tmp_path)
+    assert reader.has(location_id=102, sex_id=1, rates=['iota'])
+
+    cache.write({(102, 1): draws[(102, 1)]})
+    assert cache.manifest['draw_file'] != first
+    assert [f.name for f in tmp_path.glob('prior_draws.*.npy')] == [cache.manifest['draw_file']]
+    # A reader with the old manifest doesn't pair it with the new draw file.
+    assert reader.read(location_id=103, sex_id=1, rates=['iota']) is None
+    assert cache.read(location_id=103, sex_id=1, rates=['iota']) is None
+    np.testing.assert_array_equal(
+        cache.read(location_id=102, sex_id=1, rates=['iota'])['iota']['value'], draws[(102, 1)]['iota']['value']
+    )
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+from cascade_at.saver.results_handler import ResultsHandler
+
+
+def test_save_sample_draws(tmp_path):
+    def chunk(location_ids, value):
+        return pd.DataFrame({
+            'location_id': location_ids, 'sex_id': 2, 'age_group_id': 2, 'year_id': 1990, 'measure_id': 5,
+            'draw_0': value, 'draw_1': value
+        })
+    (tmp_path / '1').mkdir()
+    (tmp_path / '1' / '1_2.csv').write_text('old')
+
+    rh = ResultsHandler(model_version_id=0)
+    written = rh.save_sample_draws(chunks=[chunk([1, 2], 0.1), chunk([1], 0.2)], directory=tmp_path)
+    assert sorted(written) == [tmp_path / '1' / '1_2.csv', tmp_path / '2' / '2_2.csv']
+    df = pd.read_csv(tmp_path / '1' / '1_2.csv')
+    assert len(df) == 2
+    np.testing.assert_array_equal(df.draw_1, [0.1, 0.2])
+    assert (df.model_version_id == 0).all()